@@ -6,8 +6,8 @@ import logging
 
 from .models import CustomUser, OriginalAudioFile, Database, ProcessingLog, DetectedNoiseAudioFile, Spectrogram, AdminProfile
 from .forms import UserRegistrationForm, AudioUploadForm
-from .audio_processing import update_audio_metadata, process_pending_audio_files, get_processing_status
-from .tasks import process_pending_audio_files, get_processor_status
+from .audio_processing import update_audio_metadata, get_processing_status
+from .tasks import get_processor_status, notify_new_uploads
 from django.core.files.storage import FileSystemStorage, default_storage
 from django.core.files.base import ContentFile
 from django.http import JsonResponse
@@ -70,6 +70,7 @@ def admin_home(request):
         'processed_files': status_data['processed'],
         'failed_files': status_data['failed'],
         'processor_status': status_data['processor_status'],
+        'processor_workers': status_data['processor_workers'],
         'pending_files_details': pending_files_details,
         'processing_files_details': processing_files_details,
         'recent_logs': recent_logs,
@@ -164,8 +165,8 @@ def upload_audio(request):
             if processed_count > 0:
                 messages.success(request, f"Successfully uploaded {processed_count} audio files. {invalid_count} files were skipped (not .wav format).")
                 
-                # Trigger processing if there are valid files
-                process_pending_audio_files()
+                # Hand the uploaded files to the background processor
+                notify_new_uploads()
             else:
                 messages.warning(request, "No files were successfully uploaded. Please try again.")
             
@@ -200,17 +201,11 @@ def process_audio_files(request):
         return redirect('admin_home')
     
     try:
-        # Process all pending audio files
-        processed_count, failed_count = process_pending_audio_files()
-        
-        if processed_count > 0:
-            messages.success(request, f"Successfully processed {processed_count} audio files.")
-        
-        if failed_count > 0:
-            messages.warning(request, f"Failed to process {failed_count} audio files. Check logs for details.")
-            
+        # Hand the pending files to the background processor, which owns all processing; the request returns at once
+        notify_new_uploads()
+        messages.success(request, f"{pending_count} pending audio files were handed to the background processor.")
     except Exception as e:
-        messages.error(request, f"Error during batch processing: {str(e)}")
+        messages.error(request, f"Error starting the background processor: {str(e)}")
     
     return redirect('admin_home')
 
@@ -1,7 +1,9 @@
+import numpy as np
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
-from .tasks import start_background_processor, stop_background_processor, get_processor_status
+from .detection_engine import DEFAULT_MAX_MAG, DEFAULT_MIN_MAG
+from .tasks import start_background_processor, stop_background_processor, get_processor_status, get_processor_workers
 
 @login_required
 @require_POST
@@ -18,7 +20,8 @@ def start_processor(request):
     return JsonResponse({
         'success': success,
         'message': 'Background processor started' if success else 'Background processor is already running',
-        'status': get_processor_status()
+        'status': get_processor_status(),
+        'workers': get_processor_workers()
     })
 
 @login_required
@@ -36,7 +39,8 @@ def stop_processor(request):
     return JsonResponse({
         'success': success,
         'message': 'Background processor stopped' if success else 'Background processor is not running',
-        'status': get_processor_status()
+        'status': get_processor_status(),
+        'workers': get_processor_workers()
     })
 
 @login_required
@@ -132,3 +136,66 @@ def get_recent_logs(request):
         'success': True,
         'data': logs_data
     })
+
+@login_required
+def get_band_envelope(request, file_id):
+    """
+    API endpoint to get the stored saw-call band envelope of a file for timelines and threshold previews.
+
+    Query parameters:
+    - points: Maximum number of points to return (default 1000)
+    - min_mag, max_mag: Optional magnitude window; the response then counts the envelope windows whose
+      peak band magnitude falls inside it, as a quick preview of how much of the recording it would flag
+    """
+    from .models import OriginalAudioFile
+    from .audio_processing import load_band_envelope
+
+    # Only admin and staff can view the envelope
+    if request.user.user_type not in ['1', '2']:
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    try:
+        audio_file = OriginalAudioFile.objects.get(file_id=file_id)
+        envelope = load_band_envelope(audio_file)
+        if envelope is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'No band envelope stored for this file, it has not been processed yet'
+            }, status=404)
+
+        points = min(max(int(request.GET.get('points', 1000)), 1), 10000)
+        times, energy, peak = envelope.downsample(points)
+        data = {
+            'rate': envelope.rate,
+            'windows': len(envelope.values),
+            'times': [round(float(t), 3) for t in times],
+            'energy': [None if np.isnan(value) else float(value) for value in energy],
+            'peak': [None if np.isnan(value) else float(value) for value in peak]
+        }
+
+        if 'min_mag' in request.GET or 'max_mag' in request.GET:
+            min_mag = float(request.GET.get('min_mag', DEFAULT_MIN_MAG))
+            max_mag = float(request.GET.get('max_mag', DEFAULT_MAX_MAG))
+            window_peaks = envelope.values['peak']
+            active_windows = int(np.count_nonzero((window_peaks > min_mag) & (window_peaks < max_mag)))
+            data['preview'] = {
+                'min_mag': min_mag,
+                'max_mag': max_mag,
+                'active_windows': active_windows,
+                'active_seconds': active_windows / envelope.rate
+            }
+
+        return JsonResponse({
+            'success': True,
+            'data': data
+        })
+    except OriginalAudioFile.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'message': 'Audio file not found'
+        }, status=404)
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
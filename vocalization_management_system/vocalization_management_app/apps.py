@@ -11,9 +11,11 @@ class VocalizationManagementAppConfig(AppConfig):
         Start the background audio processor when Django starts
         This method is called once when Django starts
         """
-        # Only start the processor in the main process, not in management commands
+        # Only start the processor in the main process, not in management commands, and only when it is not run
+        # by dedicated `manage.py run_processor` workers
         import sys
-        if 'runserver' in sys.argv:
+        from django.conf import settings
+        if 'runserver' in sys.argv and getattr(settings, 'AUDIO_PROCESSOR_EMBEDDED', False):
             logger.info("Starting background audio processor...")
             try:
                 # Import here to avoid circular imports
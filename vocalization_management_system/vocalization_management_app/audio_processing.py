@@ -1,14 +1,27 @@
 import os
 import numpy as np
 import librosa
-from scipy.signal import stft
-from scipy.io import wavfile as wav
+import soundfile as sf
 from django.conf import settings
 import pandas as pd
 import re
-from django.utils.timezone import now
-from .models import ProcessedAudioFile, DetectedNoiseAudioFile, Database, ProcessingLog, OriginalAudioFile
-from datetime import datetime, timedelta
+from django.db import transaction
+from django.utils.timezone import make_aware, now
+from .models import (
+    ProcessedAudioFile, DetectedNoiseAudioFile, Database, ProcessingLog, OriginalAudioFile, CallTimeDifference,
+    AcousticEvent
+)
+from .detection_engine import (
+    DEFAULT_MIN_IMPULSES, DEFAULT_NOISE_TIME_CONSTANT, DEFAULT_TIME_THRESHOLD, ActivityGate, BandEnvelope,
+    ImpulseHits, channel_view, detect_saw_calls, detect_events_in_file, detect_events_sharded, iter_wav_range,
+    load_wav, wav_duration
+)
+from .spectrogram_cache import SpectrogramCache
+from .triangulation import (
+    DEFAULT_MAX_LAG, call_time_differences, group_simultaneous_recordings, link_overlapping_detections,
+    overlapping_pairs
+)
+from datetime import datetime, time, timedelta
 import logging
 import pandas as pd
 from django.core.files.base import ContentFile
@@ -20,6 +33,74 @@ def ensure_directory_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def get_spectrogram_cache():
+    """
+    Returns the STFT magnitude cache configured in settings, or None when caching is disabled.
+    """
+    cache_dir = getattr(settings, 'SPECTROGRAM_CACHE_DIR', None)
+    if not cache_dir:
+        return None
+    max_mb = getattr(settings, 'SPECTROGRAM_CACHE_MAX_MB', None)
+    return SpectrogramCache(cache_dir, max_bytes=int(max_mb * 1024 * 1024) if max_mb else None)
+
+def get_detection_params():
+    """
+    Returns the detection parameters configured in settings, for every detection entry point.
+    """
+    params = {}
+    noise_gate = getattr(settings, 'AUDIO_PROCESSING_NOISE_GATE', None)
+    if noise_gate:
+        params['noise_gate'] = noise_gate
+        params['noise_time_constant'] = getattr(settings, 'AUDIO_PROCESSING_NOISE_TIME_CONSTANT',
+                                                DEFAULT_NOISE_TIME_CONSTANT)
+    noise_floor = getattr(settings, 'AUDIO_PROCESSING_NOISE_FLOOR', None)
+    if noise_floor:
+        params['noise_floor'] = noise_floor
+        params['noise_floor_max'] = getattr(settings, 'AUDIO_PROCESSING_NOISE_FLOOR_MAX', None)
+    return params
+
+def get_activity_gate():
+    """
+    Returns a new ActivityGate when settings ask for silent stretches to be skipped, otherwise None.
+    """
+    return ActivityGate() if getattr(settings, 'AUDIO_PROCESSING_SKIP_SILENCE', False) else None
+
+def get_shard_duration(file_path):
+    """
+    Returns the shard length in seconds to split a recording into for parallel detection,
+    or None when the recording is short enough to be processed in one piece.
+    """
+    shard_minutes = getattr(settings, 'AUDIO_PROCESSING_SHARD_MINUTES', None)
+    if not shard_minutes:
+        return None
+    try:
+        duration = wav_duration(file_path)
+    except Exception:
+        return None
+    return shard_minutes * 60 if duration > 2 * shard_minutes * 60 else None
+
+def get_fft_workers(concurrency=1):
+    """
+    Returns the threads for each STFT's FFTs (AUDIO_PROCESSING_FFT_WORKERS), divided between the files
+    processed at the same time so that together they use no more than the configured CPUs.
+    """
+    workers = getattr(settings, 'AUDIO_PROCESSING_FFT_WORKERS', None)
+    if workers is None or concurrency <= 1:
+        return workers
+    if workers < 0:
+        workers = (os.cpu_count() or 1) + 1 + workers  # -1 is every CPU, -2 all but one, as in scipy.fft
+    return max(1, workers // concurrency)
+
+def get_shard_workers(concurrency=1):
+    """
+    Returns the worker processes for sharded detection (AUDIO_PROCESSING_WORKERS, None for every CPU),
+    divided between the files processed at the same time.
+    """
+    workers = getattr(settings, 'AUDIO_PROCESSING_WORKERS', None)
+    if concurrency <= 1:
+        return workers
+    return max(1, (workers or os.cpu_count() or 1) // concurrency)
+
 def parse_audio_filename(filename):
     """
     Parse the audio filename in the format SMM07257_20230201_171502.wav
@@ -186,37 +267,12 @@ def timestamp_to_time_object(timestamp_str):
     
     return total_seconds
 
-def detect_saw_calls(audio_data, sample_rate):
-    """
-    Detects saw calls in the audio data using STFT analysis.
-    
-    Parameters:
-    - audio_data (numpy.ndarray): The audio data.
-    - sample_rate (int): The sample rate of the audio data.
-    
-    Returns:
-    - list: A list of dictionaries containing information about detected saw calls:
-            [{'start': start_time_str, 'end': end_time_str, 'magnitude': mag, 'frequency': freq, 'impulse_count': count}]
-    """
-    # Parameters for saw call detection
-    min_mag = 3500
-    max_mag = 10000
-    min_freq = 15
-    max_freq = 300
-    segment_duration = 0.1
-    time_threshold = 5
-    
-    # Convert audio data to float32 if not already
-    audio_data = audio_data.astype(np.float32)
-    
-    # Remove DC offset by subtracting the mean
-    audio_data -= np.mean(audio_data)
-    
-def find_events_within_threshold(file_path, dataset, callset, min_mag=3500, max_mag=10000, min_freq=15, max_freq=300, segment_duration=.1, time_threshold=5):
+def find_events_within_threshold(file_path, dataset, callset, min_mag=3500, max_mag=10000, min_freq=15, max_freq=300, segment_duration=.1, time_threshold=5, decimate=False):
     
     """
-    Reads a WAV audio file, computes its STFT to find major magnitude events over time,
+    Reads a WAV audio file in blocks, computes its STFT to find major magnitude events over time,
     and stores events that exceed a magnitude threshold.
+    Kept for the notebooks; the detection itself is detect_saw_calls.
 
     Parameters:
     - file_path (str): Path to the WAV file.
@@ -228,107 +284,353 @@ def find_events_within_threshold(file_path, dataset, callset, min_mag=3500, max_
     - max_freq (float): The maximum frequency for event detection (default is 300hz).
     - segment_duration (float): Duration of each STFT segment in seconds (default is 0.1s).
     - time_threshold (float): Time threshold in seconds for merging events (default is 5s).
+    - decimate (bool): Decimate to just above twice max_freq before the STFT (default is False).
 
     Returns:
     - None
     """
+    # Stream the file through the STFT block by block so memory stays bounded for long recordings
     try:
-        sample_rate, audio_data = wav.read(file_path)
+        filtered_events, sample_rate, n_samples = detect_events_in_file(
+            file_path,
+            min_mag=min_mag, max_mag=max_mag, min_freq=min_freq, max_freq=max_freq,
+            segment_duration=segment_duration, time_threshold=time_threshold, decimate=decimate
+        )
     except Exception as e:
         print(f"Error: {file_path} is not an audio file or doesn't exist. ({e})")
         return
 
-    # If stereo, take just one channel
-    if len(audio_data.shape) == 2:
-        audio_data = audio_data[:, 0]
+    # Build the notebook-facing dictionaries only for the events that survived the impulse filter
+    return [event_to_dict(event) for event in filtered_events]
 
-    # Convert audio data to np.float32 for efficiency
-    audio_data = audio_data.astype(np.float32)
-    # Remove DC offset by subtracting the mean
-    audio_data -= np.mean(audio_data)
-    
 
-    # Compute the STFT with a specified segment duration
-    nperseg = int(segment_duration * sample_rate)
-    frequencies, times, Zxx = stft(audio_data, fs=sample_rate, nperseg=nperseg)
-    magnitude = np.abs(Zxx)  # Magnitude of the STFT result
-
-
-    # Initialize variables for event detection
-    last_event_time_seconds = None
-    event_data = []
-    # Iterate over each time frame, using np.where to find indices where magnitude exceeds threshold
-
-    for time_idx in range(magnitude.shape[1]):
-        # Filter for magnitudes above the threshold
-        magnitudes_at_time = magnitude[:, time_idx]
-        valid_indices = np.where(np.logical_and(magnitudes_at_time < max_mag, magnitudes_at_time > min_mag))[0]
-        
-        if valid_indices.size == 0:
-            continue  # Skip if no magnitudes exceed the threshold
-        
-        event_time_seconds = times[time_idx]
-        # Format with higher precision (2 decimal places for seconds)
-        event_time_str = seconds_to_timestamp(event_time_seconds)
-        
-        # Extract valid frequencies and magnitudes
-        valid_frequencies = frequencies[valid_indices]
-        valid_magnitudes = magnitudes_at_time[valid_indices]
-        
-        # Filter frequencies between min_freq and max_freq Hz
-        freq_mask = (valid_frequencies < max_freq) & (valid_frequencies > min_freq)
-        valid_frequencies = valid_frequencies[freq_mask]
-        valid_magnitudes = valid_magnitudes[freq_mask]
-        
-        # Process events
-        for freq, mag in zip(valid_frequencies, valid_magnitudes):
-            if last_event_time_seconds is None:
-                # First event, add to dataset
-                event_data.append({
-                    'start': event_time_str,
-                    'end': event_time_str,
-                    'start_seconds': event_time_seconds,  # Store raw seconds for precise calculations
-                    'end_seconds': event_time_seconds,    # Store raw seconds for precise calculations
-                    'magnitude': float(mag),
-                    'frequency': float(freq),
-                    'impulse_count': 1
-                })
-                last_event_time_seconds = event_time_seconds
-            else:
-                # Check if the event is within the time threshold and more than 0.1 seconds later
-                time_diff = event_time_seconds - last_event_time_seconds
-                
-                if time_diff <= time_threshold and time_diff > 0.1:  # Events within threshold are merged
-                    # Extend the duration of the last event
-                    event_data[-1]['end'] = event_time_str
-                    event_data[-1]['end_seconds'] = event_time_seconds
-                    # Calculate duration in seconds
-                    duration = event_data[-1]['end_seconds'] - event_data[-1]['start_seconds']
-                    # Increase count of impulses
-                    event_data[-1]['impulse_count'] += 1
-                    # Update magnitude and frequency if higher
-                    if mag > event_data[-1]['magnitude']:
-                        event_data[-1]['magnitude'] = float(mag)
-                        event_data[-1]['frequency'] = float(freq)
-                elif time_diff > time_threshold:
-                    # Add new event
-                    event_data.append({
-                        'start': event_time_str,
-                        'end': event_time_str,
-                        'start_seconds': event_time_seconds,
-                        'end_seconds': event_time_seconds,
-                        'magnitude': float(mag),
-                        'frequency': float(freq),
-                        'impulse_count': 1
-                    })
-                
-                # Update last event time
-                last_event_time_seconds = event_time_seconds
-    
-    # Filter out events with less than 3 impulses (likely false positives)
-    filtered_events = [event for event in event_data if event['impulse_count'] >= 3]
-    
-    return filtered_events
+def event_to_dict(event):
+    """
+    Converts one detected saw call record into the dictionary used by the notebooks and reports.
+
+    Parameters:
+    - event (numpy.void): A record of an EVENT_DTYPE array.
+
+    Returns:
+    - dict: The saw call with formatted 'start'/'end' timestamps.
+    """
+    start_seconds = float(event['start_s'])
+    end_seconds = float(event['end_s'])
+    return {
+        'start': seconds_to_timestamp(start_seconds),
+        'end': seconds_to_timestamp(end_seconds),
+        'start_seconds': start_seconds,
+        'end_seconds': end_seconds,
+        'magnitude': float(event['peak_mag']),
+        'frequency': float(event['peak_freq']),
+        'impulse_count': int(event['impulse_count'])
+    }
+
+
+def seconds_to_time(seconds):
+    """
+    Converts seconds from the start of a recording to a time object for the TimeFields of detected calls.
+
+    Parameters:
+    - seconds (float): The number of seconds to convert.
+
+    Returns:
+    - datetime.time: The time, truncated to whole microseconds.
+    """
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, whole_seconds = divmod(remainder, 60)
+    microseconds = int((seconds - int(seconds)) * 1000000)
+    return time(hours, minutes, whole_seconds, microseconds)
+
+
+def time_to_seconds(time_value):
+    """
+    Converts the time object of a detected call back to seconds from the start of its recording.
+
+    Parameters:
+    - time_value (datetime.time): Time as stored by seconds_to_time.
+
+    Returns:
+    - float: The number of seconds.
+    """
+    return (time_value.hour * 3600 + time_value.minute * 60 + time_value.second
+            + time_value.microsecond / 1000000)
+
+
+def save_detection_data(original_audio, field_name, data):
+    """
+    Stores data kept from a recording's detection run (ImpulseHits or a BandEnvelope) in one of its file fields.
+
+    Parameters:
+    - original_audio: OriginalAudioFile instance
+    - field_name: Name of the FileField to store the data in ('impulse_hits' or 'band_envelope')
+    - data: Object with a save(file) method writing it in NumPy .npz format
+    """
+    buffer = io.BytesIO()
+    data.save(buffer)
+    field = getattr(original_audio, field_name)
+    if field:
+        field.delete(save=False)
+    filename = f"{os.path.splitext(original_audio.audio_file_name)[0]}_{field_name}.npz"
+    field.save(filename, ContentFile(buffer.getvalue()), save=False)
+    original_audio.save(update_fields=[field_name])
+
+
+def load_band_envelope(original_audio):
+    """
+    Reads the band-energy envelope stored when a recording was processed.
+
+    Parameters:
+    - original_audio: OriginalAudioFile instance
+
+    Returns:
+    - BandEnvelope: The envelope, or None if the file has none stored.
+    """
+    if not original_audio.band_envelope:
+        return None
+    with original_audio.band_envelope.open('rb') as envelope_file:
+        return BandEnvelope.load(io.BytesIO(envelope_file.read()))
+
+
+def remerge_saw_calls(original_audio, time_threshold=DEFAULT_TIME_THRESHOLD, min_impulses=DEFAULT_MIN_IMPULSES):
+    """
+    Rebuilds the detected saw calls of a processed recording from its stored impulse hits.
+
+    Only the merge step runs, so the audio is not read. The magnitude window and frequency band are
+    those the file was processed with.
+
+    Parameters:
+    - original_audio: OriginalAudioFile instance
+    - time_threshold (float): Time threshold in seconds for merging events (default is 5s).
+    - min_impulses (int): Minimum number of impulses for a saw call to be kept (default is 3).
+
+    Returns:
+    - int: The number of saw calls stored, or None if the file has no stored impulse hits.
+    """
+    if not original_audio.impulse_hits:
+        return None
+    with original_audio.impulse_hits.open('rb') as hits_file:
+        hits = ImpulseHits.load(io.BytesIO(hits_file.read()))
+    saw_calls = hits.merge(time_threshold, min_impulses)
+
+    detected_noises = [
+        DetectedNoiseAudioFile(
+            original_file=original_audio,
+            detected_noise_file_path="",
+            start_time=seconds_to_time(float(saw_call['start_s'])),
+            end_time=seconds_to_time(float(saw_call['end_s'])),
+            saw_count=int(saw_call['impulse_count']),
+            saw_call_count=1,
+            file_size_mb=0.0,
+            frequency=float(saw_call['peak_freq']),
+            magnitude=float(saw_call['peak_mag'])
+        )
+        for saw_call in saw_calls
+    ]
+    with transaction.atomic():
+        DetectedNoiseAudioFile.objects.filter(original_file=original_audio).delete()
+        DetectedNoiseAudioFile.objects.bulk_create(detected_noises)
+        ProcessingLog.objects.create(
+            audio_file=original_audio,
+            message=f"Re-merged {len(hits.hits)} impulse hits into {len(saw_calls)} saw calls "
+                    f"(time threshold {time_threshold}s, minimum {min_impulses} impulses)",
+            level="SUCCESS"
+        )
+    return len(saw_calls)
+
+
+class WavRangeSignal:
+    """
+    The first channel of a WAV file that cannot be memory-mapped (e.g. compressed WAV), read from the file
+    when it is indexed instead of being held in memory.
+
+    Indexing with an array of sample positions, as signal_windows does, reads each run of consecutive
+    positions once with iter_wav_range.
+    """
+
+    def __init__(self, file_path, n_samples):
+        self.file_path = file_path
+        self.n_samples = n_samples
+
+    def __len__(self):
+        return self.n_samples
+
+    def __getitem__(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        positions = np.unique(indices)
+        runs = np.split(positions, np.flatnonzero(np.diff(positions) > 1) + 1) if positions.size else []
+        values = [
+            np.concatenate(list(iter_wav_range(self.file_path, int(run[0]), int(run[-1]) + 1)))
+            for run in runs
+        ]
+        values = np.concatenate(values) if values else np.empty(0, dtype=np.int16)
+        return values[np.searchsorted(positions, indices)]
+
+
+def read_mono_signal(file_path):
+    """
+    Returns the first channel of a WAV file, memory-mapped when the format allows it.
+
+    Returns:
+    - tuple: (sample_rate, signal) where signal is a numpy array or, for formats that cannot be
+             memory-mapped, a WavRangeSignal.
+    """
+    try:
+        sample_rate, audio_data = load_wav(file_path)
+        return sample_rate, channel_view(audio_data)
+    except ValueError:
+        info = sf.info(file_path)
+        return info.samplerate, WavRangeSignal(file_path, info.frames)
+
+
+def triangulate_saw_calls(audio_files, max_lag=None):
+    """
+    Finds the time difference of arrival (TDOA) of detected saw calls at the other recorders running at
+    the same time.
+
+    Recordings are grouped by the device and timestamp in their filenames (see parse_audio_filename). For
+    every overlapping pair from different devices, the calls detected in each recording are
+    cross-correlated with the other one, and one CallTimeDifference per call and device pair is stored,
+    replacing earlier results. The filename timestamps only have one-second resolution, so the TDOAs
+    include the offset between the recorders' clocks; compare them within one device pair.
+
+    Parameters:
+    - audio_files: Processed OriginalAudioFile instances
+    - max_lag (float): Largest time difference searched, in seconds (default is TRIANGULATION_MAX_LAG_SECONDS)
+
+    Returns:
+    - list: (audio_file, other_file, count) for both directions of every overlapping pair, with the
+            number of calls of audio_file triangulated against other_file.
+    """
+    if max_lag is None:
+        max_lag = getattr(settings, 'TRIANGULATION_MAX_LAG_SECONDS', DEFAULT_MAX_LAG)
+    recordings = []
+    for audio_file in audio_files:
+        try:
+            device_info, recording_datetime = parse_audio_filename(audio_file.audio_file_name)
+        except ValueError:
+            continue
+        if audio_file.duration_seconds:
+            recordings.append((audio_file, device_info['full_device_id'], recording_datetime,
+                               audio_file.duration_seconds))
+
+    results = []
+    for group in group_simultaneous_recordings(recordings):
+        # Each recording belongs to one group only, so its signal is dropped once the group is done
+        signals = {}
+        for first, second, offset, overlap_start, overlap_end in overlapping_pairs(group):
+            for (audio_file, device, _, _), (other_file, other_device, _, _), pair_offset, overlap in (
+                (first, second, offset, (overlap_start, overlap_end)),
+                (second, first, -offset, (overlap_start - offset, overlap_end - offset)),
+            ):
+                for recording in (audio_file, other_file):
+                    if recording.file_id not in signals:
+                        signals[recording.file_id] = read_mono_signal(recording.audio_file.path)
+                sample_rate, signal = signals[audio_file.file_id]
+                other_rate, other_signal = signals[other_file.file_id]
+                if sample_rate != other_rate:
+                    ProcessingLog.objects.create(
+                        audio_file=audio_file,
+                        message=f"Cannot triangulate against {other_file.audio_file_name}: "
+                                f"sample rates differ ({sample_rate}Hz and {other_rate}Hz)",
+                        level="WARNING"
+                    )
+                    continue
+
+                detections = [
+                    detection for detection in DetectedNoiseAudioFile.objects.filter(original_file=audio_file)
+                    if overlap[0] <= time_to_seconds(detection.start_time) < overlap[1]
+                ]
+                time_differences = call_time_differences(
+                    signal, other_signal, sample_rate, pair_offset,
+                    [time_to_seconds(detection.start_time) for detection in detections],
+                    [time_to_seconds(detection.end_time) for detection in detections],
+                    max_lag=max_lag, workers=get_fft_workers()
+                )
+                with transaction.atomic():
+                    CallTimeDifference.objects.filter(detection__original_file=audio_file,
+                                                      other_file=other_file).delete()
+                    CallTimeDifference.objects.bulk_create([
+                        CallTimeDifference(
+                            detection=detection,
+                            other_file=other_file,
+                            device=device,
+                            other_device=other_device,
+                            tdoa_seconds=float(time_difference['tdoa_s']),
+                            correlation=float(time_difference['correlation'])
+                        )
+                        for detection, time_difference in zip(detections, time_differences)
+                    ])
+                    ProcessingLog.objects.create(
+                        audio_file=audio_file,
+                        message=f"Triangulated {len(detections)} saw calls against {other_device} "
+                                f"({other_file.audio_file_name})",
+                        level="SUCCESS"
+                    )
+                results.append((audio_file, other_file, len(detections)))
+    return results
+
+
+def link_acoustic_events(audio_files, tolerance=None):
+    """
+    Links the detected saw calls of several recorders into acoustic events, so a call heard by two
+    devices is counted once.
+
+    Detection times are made absolute with the timestamp in each filename (see parse_audio_filename),
+    and detections whose spans overlap are joined with one sweep (see link_overlapping_detections).
+    Earlier events of these detections are replaced.
+
+    Parameters:
+    - audio_files: Processed OriginalAudioFile instances, e.g. every recording of one day
+    - tolerance (float): Detections less than this many seconds apart are linked as well (default is
+      TRIANGULATION_MAX_LAG_SECONDS, the clock offset allowed between recorders)
+
+    Returns:
+    - list: The AcousticEvent instances created, in time order.
+    """
+    if tolerance is None:
+        tolerance = getattr(settings, 'TRIANGULATION_MAX_LAG_SECONDS', DEFAULT_MAX_LAG)
+    recording_starts = {}
+    for audio_file in audio_files:
+        try:
+            device_info, recording_datetime = parse_audio_filename(audio_file.audio_file_name)
+        except ValueError:
+            continue
+        recording_starts[audio_file.file_id] = (device_info['full_device_id'], recording_datetime)
+    if not recording_starts:
+        return []
+
+    detections = list(DetectedNoiseAudioFile.objects.filter(original_file_id__in=recording_starts))
+    reference = min(recording_datetime for _, recording_datetime in recording_starts.values())
+    offsets = np.array([(recording_starts[detection.original_file_id][1] - reference).total_seconds()
+                        for detection in detections])
+    starts = offsets + np.array([time_to_seconds(detection.start_time) for detection in detections])
+    ends = offsets + np.array([time_to_seconds(detection.end_time) for detection in detections])
+    labels = link_overlapping_detections(starts, ends, tolerance)
+
+    members = [[] for _ in range(labels.max() + 1 if len(labels) else 0)]
+    for index, label in enumerate(labels):
+        members[label].append(index)
+    events = []
+    for indices in members:
+        loudest = detections[max(indices, key=lambda index: detections[index].magnitude or 0)]
+        events.append(AcousticEvent(
+            start_time=make_aware(reference + timedelta(seconds=float(starts[indices].min()))),
+            end_time=make_aware(reference + timedelta(seconds=float(ends[indices].max()))),
+            device_count=len({recording_starts[detections[index].original_file_id][0] for index in indices}),
+            detection_count=len(indices),
+            frequency=loudest.frequency,
+            magnitude=loudest.magnitude
+        ))
+
+    with transaction.atomic():
+        AcousticEvent.objects.filter(detections__in=detections).delete()
+        AcousticEvent.objects.filter(detections__isnull=True).delete()
+        AcousticEvent.objects.bulk_create(events)
+        for detection, label in zip(detections, labels):
+            detection.acoustic_event = events[label]
+        DetectedNoiseAudioFile.objects.bulk_update(detections, ['acoustic_event'], batch_size=500)
+    return events
 
 
 def generate_excel_report(original_audio, saw_calls):
@@ -337,7 +639,7 @@ def generate_excel_report(original_audio, saw_calls):
     
     Parameters:
     - original_audio: OriginalAudioFile instance
-    - saw_calls: List of dictionaries containing saw call data
+    - saw_calls: Detected saw calls as an EVENT_DTYPE structured array
     
     Returns:
     - Path to the saved Excel file
@@ -358,6 +660,7 @@ def generate_excel_report(original_audio, saw_calls):
             )
         
         # Create a DataFrame with the saw call data
+        saw_calls = [event_to_dict(call) for call in saw_calls]
         if saw_calls:
             data = []
             for call in saw_calls:
@@ -447,10 +750,18 @@ def generate_excel_report(original_audio, saw_calls):
         )
         return None
 
-def process_audio(file_path, original_audio):
+def process_audio(file_path, original_audio, detection_result=None, concurrency=1):
     """
     Process the uploaded audio file and store saw call timeframes.
     Uses improved STFT-based detection to accurately identify and log saw calls.
+    
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - original_audio: OriginalAudioFile instance
+    - detection_result (dict): Result already computed for this file by detect_files_parallel.
+      When given, the file is not loaded again and only the results are stored.
+    - concurrency (int): Files being processed at the same time (by the background processor's workers),
+      which share the CPUs: the FFT threads and shard processes are divided between them.
     """
     try:
         # Check if this file has already been processed
@@ -469,7 +780,7 @@ def process_audio(file_path, original_audio):
         if db_entry:
             db_entry.status = 'Processing'
             db_entry.processing_start_time = now()
-            db_entry.save()
+            db_entry.save(update_fields=['status', 'processing_start_time'])  # Leave the worker's lease alone
         else:
             db_entry = Database.objects.create(
                 audio_file=original_audio,
@@ -484,45 +795,104 @@ def process_audio(file_path, original_audio):
             level="INFO"
         )
         
-        # Load the audio file
-        try:
-            # First try using scipy.io.wavfile for better compatibility with various WAV formats
+        # Long recordings are split into time shards that several worker processes detect in parallel
+        shard_duration = get_shard_duration(file_path) if detection_result is None else None
+        activity_gate = get_activity_gate()
+        if shard_duration:
             try:
+                envelope = BandEnvelope()
+                events, sample_rate, n_samples, hits = detect_events_sharded(
+                    file_path, max_workers=get_shard_workers(concurrency),
+                    shard_duration=shard_duration,
+                    memory_limit_mb=getattr(settings, 'AUDIO_PROCESSING_TASK_MEMORY_MB', None),
+                    return_hits=True, envelope=envelope, activity_gate=activity_gate, **get_detection_params()
+                )
+                detection_result = {'events': events, 'sample_rate': sample_rate, 'n_samples': n_samples,
+                                    'hits': hits, 'envelope': envelope}
                 ProcessingLog.objects.create(
                     audio_file=original_audio,
-                    message="Attempting to load audio with scipy.io.wavfile",
+                    message=f"Detected saw calls in time shards of {shard_duration / 60:g} minutes",
                     level="INFO"
                 )
-                sample_rate, audio_data = wav.read(file_path)
-                
-                # Convert to mono if stereo
-                if len(audio_data.shape) > 1:
-                    audio_data = np.mean(audio_data, axis=1)
-                
+            except Exception as e:
+                ProcessingLog.objects.create(
+                    audio_file=original_audio,
+                    message=f"Sharded detection failed: {str(e)}. Processing the file in one piece instead...",
+                    level="WARNING"
+                )
+
+        # Reprocessing a recording reads its STFT magnitudes from the cache instead of recomputing them. The cache
+        # holds every frame, so it is not used when silent frames are to be skipped.
+        cache = get_spectrogram_cache()
+        if detection_result is None and cache is not None and activity_gate is None:
+            try:
+                envelope = BandEnvelope()
+                events, sample_rate, n_samples, hits = detect_events_in_file(
+                    file_path, cache=cache, return_hits=True, envelope=envelope,
+                    fft_workers=get_fft_workers(concurrency), **get_detection_params()
+                )
+                detection_result = {'events': events, 'sample_rate': sample_rate, 'n_samples': n_samples,
+                                    'hits': hits, 'envelope': envelope}
                 ProcessingLog.objects.create(
                     audio_file=original_audio,
-                    message=f"Loaded audio file with scipy.io.wavfile: {sample_rate}Hz, {len(audio_data)/sample_rate:.2f}s",
-                    level="SUCCESS"
+                    message="Detected saw calls using the spectrogram cache",
+                    level="INFO"
                 )
             except Exception as e:
-                # If scipy fails, try librosa
                 ProcessingLog.objects.create(
                     audio_file=original_audio,
-                    message=f"scipy.io.wavfile failed: {str(e)}. Trying librosa...",
+                    message=f"Spectrogram cache unavailable: {str(e)}. Loading the audio instead...",
                     level="WARNING"
                 )
+
+        # Load the audio file
+        try:
+            if detection_result is not None:
+                # Detection already ran (in a worker process or from the cache), only the results are stored here
+                if 'error' in detection_result:
+                    raise RuntimeError(detection_result['error'])
+                sample_rate = detection_result['sample_rate']
+                n_samples = detection_result['n_samples']
+            else:
+                # First try memory-mapping the samples (16/24/32-bit PCM and float, extensible headers); librosa
+                # decodes anything else but reads the whole file into memory, so it is the last resort
+                try:
+                    ProcessingLog.objects.create(
+                        audio_file=original_audio,
+                        message="Attempting to memory-map audio file",
+                        level="INFO"
+                    )
+                    # The samples are memory-mapped, not copied; detect_saw_calls converts them to float32
+                    # block by block. Multi-channel data is passed as is: the engine analyses the first
+                    # channel, the same one find_events_within_threshold always used
+                    sample_rate, audio_data = load_wav(file_path)
                 
-                audio_data, sample_rate = librosa.load(file_path, sr=None, mono=True)
+                    ProcessingLog.objects.create(
+                        audio_file=original_audio,
+                        message=f"Memory-mapped audio file: {sample_rate}Hz, {len(audio_data)/sample_rate:.2f}s",
+                        level="SUCCESS"
+                    )
+                except Exception as e:
+                    # If the format cannot be memory-mapped, try librosa
+                    ProcessingLog.objects.create(
+                        audio_file=original_audio,
+                        message=f"Memory-mapping failed: {str(e)}. Trying librosa...",
+                        level="WARNING"
+                    )
                 
-                ProcessingLog.objects.create(
-                    audio_file=original_audio,
-                    message=f"Loaded audio file with librosa: {sample_rate}Hz, {len(audio_data)/sample_rate:.2f}s",
-                    level="SUCCESS"
-                )
+                    audio_data, sample_rate = librosa.load(file_path, sr=None, mono=True)
+                
+                    ProcessingLog.objects.create(
+                        audio_file=original_audio,
+                        message=f"Loaded audio file with librosa: {sample_rate}Hz, {len(audio_data)/sample_rate:.2f}s",
+                        level="SUCCESS"
+                    )
+            
+                n_samples = len(audio_data)
             
             # Update file metadata if not already set
             if not original_audio.duration_seconds:
-                duration_seconds = len(audio_data) / sample_rate
+                duration_seconds = n_samples / sample_rate
                 original_audio.duration_seconds = duration_seconds
                 original_audio.duration = seconds_to_timestamp(duration_seconds)
                 original_audio.sample_rate = sample_rate
@@ -534,18 +904,34 @@ def process_audio(file_path, original_audio):
                     level="INFO"
                 )
             
-            # Detect saw calls using STFT analysis
-            ProcessingLog.objects.create(
-                audio_file=original_audio,
-                message="Starting saw call detection with STFT analysis",
-                level="INFO"
-            )
-            
-            saw_calls = detect_saw_calls(audio_data, sample_rate)
-            
-            # Filter out calls with less than 3 impulses (likely false positives)
-            filtered_saw_calls = [call for call in saw_calls if call['impulse_count'] >= 3]
+            if detection_result is not None:
+                filtered_saw_calls = detection_result['events']
+                hits = detection_result.get('hits')
+                envelope = detection_result.get('envelope')
+                activity_gate = detection_result.get('activity_gate', activity_gate)
+            else:
+                # Detect saw calls using STFT analysis
+                ProcessingLog.objects.create(
+                    audio_file=original_audio,
+                    message="Starting saw call detection with STFT analysis",
+                    level="INFO"
+                )
+                
+                # The engine works on the already-loaded signal, so the file is decoded only once.
+                # Calls with less than 3 impulses (likely false positives) are already filtered out.
+                envelope = BandEnvelope()
+                filtered_saw_calls, hits = detect_saw_calls(
+                    audio_data, sample_rate, return_hits=True, envelope=envelope, activity_gate=activity_gate,
+                    fft_workers=get_fft_workers(concurrency), **get_detection_params()
+                )
             
+            if activity_gate is not None and activity_gate.frames:
+                ProcessingLog.objects.create(
+                    audio_file=original_audio,
+                    message=f"Skipped {activity_gate.skipped_fraction:.1%} of the recording as silent",
+                    level="INFO"
+                )
+
             ProcessingLog.objects.create(
                 audio_file=original_audio,
                 message=f"Detected {len(filtered_saw_calls)} saw calls after filtering (minimum 3 impulses required)",
@@ -563,7 +949,7 @@ def process_audio(file_path, original_audio):
             # Update database entry to Failed status
             db_entry.status = 'Failed'
             db_entry.processing_end_time = now()
-            db_entry.save()
+            db_entry.save(update_fields=['status', 'processing_end_time'])
             return False
         
         # Extract date from filename if available
@@ -583,28 +969,33 @@ def process_audio(file_path, original_audio):
                 level="WARNING"
             )
         
+        # Keep the impulse hits so the calls can be re-merged with other merge parameters, and the
+        # band envelope for timelines and threshold previews
+        for field_name, data in (('impulse_hits', hits), ('band_envelope', envelope)):
+            if data is None:
+                continue
+            try:
+                save_detection_data(original_audio, field_name, data)
+            except Exception as e:
+                ProcessingLog.objects.create(
+                    audio_file=original_audio,
+                    message=f"Warning: Could not store {field_name.replace('_', ' ')}: {str(e)}",
+                    level="WARNING"
+                )
+
         # Store saw call timeframes
         saw_count = 0
         for saw_call in filtered_saw_calls:
             try:
-                # Convert timestamp strings to time objects for database storage
-                start_seconds = saw_call['start_seconds']
-                end_seconds = saw_call['end_seconds']
-                
-                # Calculate hours, minutes, seconds for start time
-                start_hours, start_remainder = divmod(int(start_seconds), 3600)
-                start_minutes, start_seconds_int = divmod(start_remainder, 60)
-                start_microseconds = int((start_seconds - int(start_seconds)) * 1000000)
-                
-                # Calculate hours, minutes, seconds for end time
-                end_hours, end_remainder = divmod(int(end_seconds), 3600)
-                end_minutes, end_seconds_int = divmod(end_remainder, 60)
-                end_microseconds = int((end_seconds - int(end_seconds)) * 1000000)
+                # Convert event times to time objects for database storage
+                start_seconds = float(saw_call['start_s'])
+                end_seconds = float(saw_call['end_s'])
+                impulse_count = int(saw_call['impulse_count'])
+                frequency = float(saw_call['peak_freq'])
+                magnitude = float(saw_call['peak_mag'])
                 
-                # Create time objects
-                from datetime import time
-                start_time_obj = time(start_hours, start_minutes, start_seconds_int, start_microseconds)
-                end_time_obj = time(end_hours, end_minutes, end_seconds_int, end_microseconds)
+                start_time_obj = seconds_to_time(start_seconds)
+                end_time_obj = seconds_to_time(end_seconds)
                 
                 # Create detected noise entry
                 DetectedNoiseAudioFile.objects.create(
@@ -612,18 +1003,18 @@ def process_audio(file_path, original_audio):
                     detected_noise_file_path="",  # We're not creating actual files
                     start_time=start_time_obj,
                     end_time=end_time_obj,
-                    saw_count=saw_call['impulse_count'],  # Number of impulses in this call
+                    saw_count=impulse_count,  # Number of impulses in this call
                     saw_call_count=1,  # Each entry represents one saw call
                     file_size_mb=0.0,  # No actual file
-                    frequency=saw_call['frequency'],
-                    magnitude=saw_call['magnitude']
+                    frequency=frequency,
+                    magnitude=magnitude
                 )
                 saw_count += 1
                 
                 # Log individual saw call detection with precise timestamps
                 ProcessingLog.objects.create(
                     audio_file=original_audio,
-                    message=f"Detected saw call: Start={saw_call['start']}, End={saw_call['end']}, Duration={(end_seconds-start_seconds):.2f}s, Impulses={saw_call['impulse_count']}, Freq={saw_call['frequency']:.2f}Hz, Mag={saw_call['magnitude']:.2f}",
+                    message=f"Detected saw call: Start={seconds_to_timestamp(start_seconds)}, End={seconds_to_timestamp(end_seconds)}, Duration={(end_seconds-start_seconds):.2f}s, Impulses={impulse_count}, Freq={frequency:.2f}Hz, Mag={magnitude:.2f}",
                     level="INFO"
                 )
             except Exception as e:
@@ -651,7 +1042,7 @@ def process_audio(file_path, original_audio):
         # Update database entry to Processed status
         db_entry.status = 'Processed'
         db_entry.processing_end_time = now()
-        db_entry.save()
+        db_entry.save(update_fields=['status', 'processing_end_time'])
         
         # Log successful processing completion
         ProcessingLog.objects.create(
@@ -675,7 +1066,7 @@ def process_audio(file_path, original_audio):
         if db_entry:
             db_entry.status = 'Failed'
             db_entry.processing_end_time = now()
-            db_entry.save()
+            db_entry.save(update_fields=['status', 'processing_end_time'])
         
         return False
 
@@ -719,21 +1110,12 @@ def get_pending_audio_files():
     from .models import OriginalAudioFile, Database
     return OriginalAudioFile.objects.filter(database_entry__status='Pending')
 
-def process_pending_audio_files():
-    """
-    Process all pending audio files one by one
-    Returns a tuple of (processed_count, failed_count)
-    """
-    # Import here to avoid circular imports
-    from .tasks import process_pending_audio_files_batch
-    return process_pending_audio_files_batch()
-
 def get_processing_status():
     """
     Get the current processing status counts
     """
     from .models import OriginalAudioFile, Database
-    from .tasks import get_processor_status
+    from .tasks import get_processor_status, get_processor_workers
     
     total_files = OriginalAudioFile.objects.count()
     pending_files = Database.objects.filter(status='Pending').count()
@@ -747,5 +1129,6 @@ def get_processing_status():
         'processing': processing_files,
         'processed': processed_files,
         'failed': failed_files,
-        'processor_status': get_processor_status()
+        'processor_status': get_processor_status(),
+        'processor_workers': get_processor_workers()
     }
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def legacy_detect_events(magnitude, frequencies, times, min_mag=3500, max_mag=10000, min_freq=15, max_freq=300,
+                         time_threshold=5):
+    """Frame-by-frame reference implementation of the original find_events_within_threshold loop"""
+    last_event_time_seconds = None
+    event_data = []
+    for time_idx in range(magnitude.shape[1]):
+        magnitudes_at_time = magnitude[:, time_idx]
+        valid_indices = np.where(np.logical_and(magnitudes_at_time < max_mag, magnitudes_at_time > min_mag))[0]
+        if valid_indices.size == 0:
+            continue
+        event_time_seconds = times[time_idx]
+        valid_frequencies = frequencies[valid_indices]
+        valid_magnitudes = magnitudes_at_time[valid_indices]
+        freq_mask = (valid_frequencies < max_freq) & (valid_frequencies > min_freq)
+        for freq, mag in zip(valid_frequencies[freq_mask], valid_magnitudes[freq_mask]):
+            if last_event_time_seconds is None:
+                event_data.append({'start_seconds': event_time_seconds, 'end_seconds': event_time_seconds,
+                                   'magnitude': float(mag), 'frequency': float(freq), 'impulse_count': 1})
+                last_event_time_seconds = event_time_seconds
+            else:
+                time_diff = event_time_seconds - last_event_time_seconds
+                if time_diff <= time_threshold and time_diff > 0.1:
+                    event_data[-1]['end_seconds'] = event_time_seconds
+                    event_data[-1]['impulse_count'] += 1
+                    if mag > event_data[-1]['magnitude']:
+                        event_data[-1]['magnitude'] = float(mag)
+                        event_data[-1]['frequency'] = float(freq)
+                elif time_diff > time_threshold:
+                    event_data.append({'start_seconds': event_time_seconds, 'end_seconds': event_time_seconds,
+                                       'magnitude': float(mag), 'frequency': float(freq), 'impulse_count': 1})
+                last_event_time_seconds = event_time_seconds
+    return [event for event in event_data if event['impulse_count'] >= 3]
+
+
+def synthetic_magnitude(seed, n_frames=4000, density=0.02):
+    """Random STFT-like magnitude matrix with sparse bursts inside the detection window"""
+    rng = np.random.default_rng(seed)
+    frequencies = np.arange(0, 2401, dtype=np.float64) * 10.0
+    times = np.arange(n_frames) * 2400 / 48000.0
+    magnitude = rng.uniform(0, 3000, size=(frequencies.size, n_frames)).astype(np.float32)
+    bursts = rng.random((frequencies.size, n_frames)) < density
+    magnitude[bursts] = rng.uniform(3000, 12000, size=int(bursts.sum())).astype(np.float32)
+    return magnitude, frequencies, times
@@ -0,0 +1,1777 @@
+import itertools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft, rfftfreq
+from scipy.io import wavfile
+from scipy.signal import firwin, freqz, get_window, lfilter, lfilter_zi, resample_poly, upfirdn
+
+from .wav_reader import PCM24Array, map_wav
+
+# Default saw call detection parameters (shared by every detection entry point)
+DEFAULT_MIN_MAG = 3500
+DEFAULT_MAX_MAG = 10000
+DEFAULT_MIN_FREQ = 15
+DEFAULT_MAX_FREQ = 300
+DEFAULT_SEGMENT_DURATION = 0.1
+DEFAULT_TIME_THRESHOLD = 5
+DEFAULT_MIN_IMPULSES = 3
+
+# Detected saw calls are returned as structured arrays with one record per call. Times are in seconds
+# from the start of the recording; strings for display are only built where events are shown or stored.
+EVENT_DTYPE = np.dtype([
+    ('start_s', np.float64),
+    ('end_s', np.float64),
+    ('peak_freq', np.float64),
+    ('peak_mag', np.float64),
+    ('impulse_count', np.int32),
+])
+
+# Frame-level impulse hits kept per recording so events can be re-merged without the audio: the frame
+# time, the index of the qualifying bin in the hit frequency table, and its magnitude
+HIT_DTYPE = np.dtype([
+    ('time_s', np.float64),
+    ('bin', np.uint16),
+    ('magnitude', np.float32),
+])
+
+# Rate in Hz of the low-resolution band envelope stored per recording, and its per-window values:
+# the mean band energy (sum of squared band magnitudes) of the window's frames and the largest band magnitude
+ENVELOPE_RATE = 10
+ENVELOPE_DTYPE = np.dtype([
+    ('energy', np.float32),
+    ('peak', np.float32),
+])
+
+# Impulses closer together than this (in seconds) neither extend nor start an event
+MIN_IMPULSE_SPACING = 0.1
+
+# Optional spectral gating before thresholding: a bin is kept only when it is noise_gate times above its
+# noise level, its magnitude smoothed over noise_time_constant seconds (noise_gate None disables the gate)
+DEFAULT_NOISE_GATE = None
+DEFAULT_NOISE_TIME_CONSTANT = 2.0
+
+# Optional adaptive thresholds: an impulse must rise noise_floor times above the noise floor of its bin (and
+# stay below noise_floor_max times it, or below max_mag when that is None). The floor is the noise_quantile
+# of each bin over chunks of NOISE_FLOOR_CHUNK_DURATION seconds, its median over the last NOISE_FLOOR_CHUNKS.
+DEFAULT_NOISE_FLOOR = None
+DEFAULT_NOISE_FLOOR_MAX = None
+DEFAULT_NOISE_QUANTILE = 0.5
+NOISE_FLOOR_CHUNK_DURATION = 10.0
+NOISE_FLOOR_CHUNKS = 6
+
+# Relative headroom on the activity gate's magnitude bound, covering float32 rounding in the FFT
+ACTIVITY_BOUND_MARGIN = 1e-3
+
+# Time constants of earlier frames a gate started mid-recording runs over, after which its noise level
+# matches a gate run from the start to well below float32 precision
+NOISE_GATE_WARM_UP = 20
+
+# Decimated sample rate is kept at least this factor above twice max_freq (anti-aliasing headroom)
+DECIMATION_MARGIN = 1.25
+# Kaiser window beta and half-length (in input samples per unit of decimation) of the anti-aliasing filter,
+# matching the filter scipy.signal.resample_poly designs by default
+DECIMATION_KAISER_BETA = 5.0
+DECIMATION_HALF_LENGTH = 10
+
+# Length of the blocks read from disk by the streaming engine, in seconds of audio
+DEFAULT_BLOCK_DURATION = 60
+
+# Length of the time shards a long recording is split into for parallel detection, in seconds of audio
+DEFAULT_SHARD_DURATION = 30 * 60
+
+# Sample type to read each soundfile subtype as, so sample values match scipy.io.wavfile.read
+WAV_SUBTYPE_DTYPES = {
+    'PCM_16': 'int16',
+    'PCM_24': 'int32',
+    'PCM_32': 'int32',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+}
+
+
+def empty_events():
+    """Returns an event array with no events"""
+    return np.empty(0, dtype=EVENT_DTYPE)
+
+
+def stft_segment(sample_rate, segment_duration=DEFAULT_SEGMENT_DURATION):
+    """
+    Returns the STFT segment length and overlap used for a given sample rate.
+
+    Parameters:
+    - sample_rate (int): Sample rate of the audio data in Hz.
+    - segment_duration (float): Duration of each STFT segment in seconds.
+
+    Returns:
+    - tuple: (nperseg, noverlap) in samples, as scipy.signal.stft uses them by default.
+    """
+    nperseg = int(segment_duration * sample_rate)
+    return nperseg, nperseg // 2
+
+
+def stft_frame_times(n_frames, nperseg, noverlap, sample_rate, first_frame=0):
+    """
+    Returns the frame times scipy.signal.stft reports for a zero-padded (boundary='zeros') signal.
+
+    The same arithmetic is used whatever path produced the frames so that merge decisions, which compare
+    time differences against MIN_IMPULSE_SPACING, never depend on rounding.
+
+    Parameters:
+    - n_frames (int): Number of STFT frames.
+    - nperseg (int): Segment length in samples at sample_rate.
+    - noverlap (int): Segment overlap in samples at sample_rate.
+    - sample_rate (int): Sample rate in Hz.
+    - first_frame (int): Index of the first frame to return.
+
+    Returns:
+    - numpy.ndarray: Frame times in seconds.
+    """
+    frames = np.arange(first_frame, first_frame + n_frames)
+    times = (nperseg / 2 + frames * float(nperseg - noverlap)) / float(sample_rate)
+    times -= (nperseg / 2) / sample_rate
+    return times
+
+
+def decimation_factor(sample_rate, segment_duration=DEFAULT_SEGMENT_DURATION, max_freq=DEFAULT_MAX_FREQ):
+    """
+    Chooses an integer decimation factor for the detection band.
+
+    The factor is the largest one that keeps the decimated rate at least DECIMATION_MARGIN times twice
+    max_freq and divides both the STFT segment length and overlap, so decimated frames and bins line up
+    exactly with the frames and bins of the full-rate STFT.
+
+    Parameters:
+    - sample_rate (int): Native sample rate in Hz.
+    - segment_duration (float): Duration of each STFT segment in seconds.
+    - max_freq (float): Upper edge of the detection band in Hz.
+
+    Returns:
+    - int: Decimation factor (1 when the signal cannot be decimated).
+    """
+    nperseg, noverlap = stft_segment(sample_rate, segment_duration)
+    max_factor = int(sample_rate // (2 * max_freq * DECIMATION_MARGIN))
+    for factor in range(max_factor, 1, -1):
+        if nperseg % factor == 0 and noverlap % factor == 0:
+            return factor
+    return 1
+
+
+def decimation_filter(factor):
+    """
+    Designs the FIR anti-aliasing filter used to decimate by the given factor.
+
+    Parameters:
+    - factor (int): Decimation factor.
+
+    Returns:
+    - numpy.ndarray: Filter coefficients.
+    """
+    return firwin(2 * DECIMATION_HALF_LENGTH * factor + 1, 1.0 / factor,
+                  window=('kaiser', DECIMATION_KAISER_BETA))
+
+
+def decimation_gain(frequencies, sample_rate, factor):
+    """
+    Returns the magnitude response of the anti-aliasing filter at the given frequencies.
+
+    STFT magnitudes are normalised by the window sum, so a fixed segment duration keeps them comparable
+    across sample rates; the only remaining difference after decimation is the filter's passband ripple.
+
+    Parameters:
+    - frequencies (numpy.ndarray): Frequencies in Hz.
+    - sample_rate (int): Native sample rate in Hz.
+    - factor (int): Decimation factor.
+
+    Returns:
+    - float or numpy.ndarray: Gain at each frequency (1.0 when the signal is not decimated).
+    """
+    if factor == 1:
+        return 1.0
+    _, response = freqz(decimation_filter(factor), worN=np.asarray(frequencies, dtype=np.float64), fs=sample_rate)
+    return np.abs(response)
+
+
+def decimate_signal(audio_data, factor):
+    """
+    Low-pass filters and downsamples the signal with a polyphase filter.
+
+    Parameters:
+    - audio_data (numpy.ndarray): Audio samples.
+    - factor (int): Decimation factor.
+
+    Returns:
+    - numpy.ndarray: The decimated signal as float32.
+    """
+    if factor == 1:
+        return audio_data
+    return resample_poly(audio_data, 1, factor, window=decimation_filter(factor)).astype(np.float32)
+
+
+def stft_window(nperseg):
+    """
+    Returns the STFT analysis window with the 'spectrum' scaling of scipy.signal.stft folded in.
+
+    Parameters:
+    - nperseg (int): Segment length in samples.
+
+    Returns:
+    - numpy.ndarray: Periodic Hann window divided by its sum, as float32.
+    """
+    window = get_window('hann', nperseg)
+    return (window / window.sum()).astype(np.float32)
+
+
+def stft_band_magnitude(signal, nperseg, noverlap, band=slice(None), window=None, workers=None, frame_buffer=None,
+                        frames=None):
+    """
+    Computes the STFT magnitude of the given rows for every full segment of the signal, or only some of them.
+
+    This is scipy.signal.stft with boundary=None and padded=False, but in single precision throughout:
+    segments are strided views of the float32 signal, windowed into a reusable frame buffer, transformed
+    in place with scipy.fft.rfft (in parallel when workers is set) and reduced to the band rows only.
+
+    Parameters:
+    - signal (numpy.ndarray): float32 samples.
+    - nperseg (int): Segment length in samples.
+    - noverlap (int): Segment overlap in samples.
+    - band (slice): Frequency rows to return (default is all of them).
+    - window (numpy.ndarray): Scaled window from stft_window (computed when not given).
+    - workers (int): Threads for the FFT (default is scipy's, one unless set with scipy.fft.set_workers;
+      -1 uses every CPU).
+    - frame_buffer (numpy.ndarray): float32 buffer of shape (frames, nperseg) to reuse if large enough.
+    - frames (numpy.ndarray): Indices of the segments to transform (default is every segment).
+
+    Returns:
+    - tuple: (magnitude, frame_buffer) where magnitude has shape (band rows, frames) and is float32.
+    """
+    hop = nperseg - noverlap
+    segments = sliding_window_view(signal, nperseg)[::hop][:max(0, (len(signal) - nperseg) // hop + 1)]
+    if frames is not None:
+        segments = segments[frames]
+    n_frames = len(segments)
+    if window is None:
+        window = stft_window(nperseg)
+    if frame_buffer is None or frame_buffer.shape[0] < n_frames or frame_buffer.shape[1] != nperseg:
+        frame_buffer = np.empty((n_frames, nperseg), dtype=np.float32)
+
+    windowed = frame_buffer[:n_frames]
+    np.multiply(segments, window, out=windowed)
+    spectrum = rfft(windowed, axis=1, workers=workers, overwrite_x=True)
+
+    rows = spectrum[:, band]
+    magnitude = np.empty((rows.shape[1], n_frames), dtype=np.float32)
+    np.abs(rows.T, out=magnitude)
+    return magnitude, frame_buffer
+
+
+def band_limited_stft(audio_data, sample_rate, segment_duration=DEFAULT_SEGMENT_DURATION,
+                      max_freq=DEFAULT_MAX_FREQ, decimate=False, workers=None):
+    """
+    Computes the STFT magnitude of the signal, optionally after decimating it to the detection band.
+
+    Frequencies and times always follow the full-rate STFT, so the decimated matrix is simply the
+    low-frequency rows of the full-rate one.
+
+    Parameters:
+    - audio_data (numpy.ndarray): DC-free audio samples.
+    - sample_rate (int): Sample rate of the audio data in Hz.
+    - segment_duration (float): Duration of each STFT segment in seconds.
+    - max_freq (float): Upper edge of the detection band in Hz, used to choose the decimation factor.
+    - decimate (bool): Decimate before the STFT.
+    - workers (int): Threads for the FFT, see stft_band_magnitude.
+
+    Returns:
+    - tuple: (frequencies, times, magnitude, gain) where gain is the per-row anti-aliasing filter response
+             that thresholds should be multiplied by.
+    """
+    nperseg, noverlap = stft_segment(sample_rate, segment_duration)
+    factor = decimation_factor(sample_rate, segment_duration, max_freq) if decimate else 1
+
+    working_nperseg = nperseg // factor
+    working_hop = working_nperseg - noverlap // factor
+
+    # Zero boundaries and padding to a whole number of segments, as scipy.signal.stft applies them
+    signal = np.asarray(decimate_signal(audio_data, factor), dtype=np.float32)
+    padded_length = len(signal) + 2 * (working_nperseg // 2)
+    extra = (-(padded_length - working_nperseg) % working_hop) % working_nperseg
+    signal = np.concatenate((
+        np.zeros(working_nperseg // 2, dtype=np.float32), signal,
+        np.zeros(working_nperseg // 2 + extra, dtype=np.float32)
+    ))
+    magnitude, _ = stft_band_magnitude(signal, working_nperseg, noverlap // factor, workers=workers)
+
+    frequencies = rfftfreq(nperseg, 1 / sample_rate)[:magnitude.shape[0]]
+    times = stft_frame_times(magnitude.shape[1], nperseg, noverlap, sample_rate)
+    return frequencies, times, magnitude, decimation_gain(frequencies, sample_rate, factor)
+
+
+def band_slice(frequencies, min_freq, max_freq):
+    """
+    Returns the slice of STFT rows whose frequency lies strictly between min_freq and max_freq.
+
+    Parameters:
+    - frequencies (numpy.ndarray): Sorted STFT bin frequencies in Hz.
+    - min_freq (float): Lower band edge in Hz (exclusive).
+    - max_freq (float): Upper band edge in Hz (exclusive).
+
+    Returns:
+    - slice: Row slice selecting the band bins.
+    """
+    start = int(np.searchsorted(frequencies, min_freq, side='right'))
+    stop = int(np.searchsorted(frequencies, max_freq, side='left'))
+    return slice(start, max(start, stop))
+
+
+def row_thresholds(threshold, band):
+    """
+    Selects the band rows of a per-frequency threshold so it broadcasts against the band magnitude.
+
+    Parameters:
+    - threshold (float or numpy.ndarray): A single threshold, or one threshold per STFT row.
+    - band (slice): Band row slice, see band_slice.
+
+    Returns:
+    - float or numpy.ndarray: The scalar threshold, or a column of per-row thresholds.
+    """
+    if np.ndim(threshold) == 0:
+        return threshold
+    return np.asarray(threshold)[band, np.newaxis]
+
+
+def first_impulse_bins(magnitude, frequencies, min_mag=DEFAULT_MIN_MAG, max_mag=DEFAULT_MAX_MAG,
+                       min_freq=DEFAULT_MIN_FREQ, max_freq=DEFAULT_MAX_FREQ):
+    """
+    Finds the frames with an in-band magnitude inside the threshold window and the lowest such bin of each.
+
+    Parameters:
+    - magnitude, frequencies, min_mag, max_mag, min_freq, max_freq: See find_impulse_frames.
+
+    Returns:
+    - tuple: (frames, bins, magnitudes) where frames are column indices, bins are row indices into
+             frequencies and magnitudes are the values at those positions, in time order.
+    """
+    band = band_slice(frequencies, min_freq, max_freq)
+    band_magnitude = magnitude[band]
+    mask = (band_magnitude < row_thresholds(max_mag, band)) & (band_magnitude > row_thresholds(min_mag, band))
+
+    active_frames = np.flatnonzero(mask.any(axis=0))
+    if active_frames.size == 0:
+        return active_frames, np.empty(0, dtype=np.intp), np.empty(0, dtype=magnitude.dtype)
+    first_bins = mask[:, active_frames].argmax(axis=0)
+    return active_frames, band.start + first_bins, band_magnitude[first_bins, active_frames]
+
+
+def find_impulse_frames(magnitude, frequencies, times, min_mag=DEFAULT_MIN_MAG, max_mag=DEFAULT_MAX_MAG,
+                        min_freq=DEFAULT_MIN_FREQ, max_freq=DEFAULT_MAX_FREQ):
+    """
+    Finds the STFT frames that contain at least one in-band bin with a magnitude inside the threshold window.
+
+    Only the lowest qualifying bin of each frame is reported: every further bin in the same frame
+    lies 0 seconds after the first one and is ignored by the merge step anyway.
+
+    Parameters:
+    - magnitude (numpy.ndarray): STFT magnitude matrix of shape (frequencies, frames).
+    - frequencies (numpy.ndarray): Frequency of each row in Hz.
+    - times (numpy.ndarray): Time of each column in seconds.
+    - min_mag (float or numpy.ndarray): The magnitude minimum for event detection (exclusive),
+      either a single value or one value per row.
+    - max_mag (float or numpy.ndarray): The magnitude maximum for event detection (exclusive).
+    - min_freq (float): The minimum frequency for event detection (exclusive).
+    - max_freq (float): The maximum frequency for event detection (exclusive).
+
+    Returns:
+    - tuple: (hit_times, hit_frequencies, hit_magnitudes), one entry per qualifying frame in time order.
+    """
+    frames, bins, magnitudes = first_impulse_bins(magnitude, frequencies, min_mag, max_mag, min_freq, max_freq)
+    return np.asarray(times)[frames], np.asarray(frequencies)[bins], magnitudes
+
+
+class ImpulseHits:
+    """
+    The frame-level impulse hits of one recording, kept so the merge step can be re-run without the audio.
+
+    The hits depend on the magnitude window, band and noise gate used when they were found;
+    time_threshold and min_impulses can be changed freely afterwards.
+    """
+
+    def __init__(self, hits, frequencies):
+        self.hits = hits
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+
+    @classmethod
+    def from_batches(cls, batches, frequencies):
+        """
+        Collects hit batches found frame by frame.
+
+        Parameters:
+        - batches (list): (hit_times, bins, hit_magnitudes) tuples, in time order.
+        - frequencies (numpy.ndarray): Frequency table the bins index into.
+
+        Returns:
+        - ImpulseHits: All hits of the recording.
+        """
+        hits = np.empty(sum(len(hit_times) for hit_times, _, _ in batches), dtype=HIT_DTYPE)
+        position = 0
+        for hit_times, bins, hit_magnitudes in batches:
+            batch = hits[position:position + len(hit_times)]
+            batch['time_s'] = hit_times
+            batch['bin'] = bins
+            batch['magnitude'] = hit_magnitudes
+            position += len(hit_times)
+        return cls(hits, frequencies)
+
+    def merge(self, time_threshold=DEFAULT_TIME_THRESHOLD, min_impulses=DEFAULT_MIN_IMPULSES):
+        """
+        Merges the hits into saw call events, see merge_impulses.
+
+        Returns:
+        - numpy.ndarray: Detected saw calls as an EVENT_DTYPE structured array.
+        """
+        return merge_impulses(self.hits['time_s'], self.frequencies[self.hits['bin']], self.hits['magnitude'],
+                              time_threshold, min_impulses)
+
+    def save(self, file):
+        """
+        Writes the hits to a file or file-like object in NumPy .npz format.
+        """
+        np.savez_compressed(file, hits=self.hits, frequencies=self.frequencies)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Reads hits written by save.
+
+        Returns:
+        - ImpulseHits: The stored hits.
+        """
+        with np.load(file) as data:
+            return cls(data['hits'], data['frequencies'])
+
+
+class BandEnvelope:
+    """
+    Low-resolution envelope of the detection band, collected frame by frame while detecting.
+
+    Each window of 1/rate seconds holds the mean band energy and the peak band magnitude of the STFT
+    frames that start in it, which is enough for coverage charts and threshold previews without
+    reading the audio again. Windows without frames (only possible when frames are further apart than
+    a window) or with a frame skipped as silent by an ActivityGate are NaN.
+    """
+
+    def __init__(self, rate=ENVELOPE_RATE):
+        self.rate = rate
+        self._frames = []
+        self._values = None
+
+    def feed(self, times, band_magnitude):
+        """
+        Adds a batch of frames. Frames can no longer be added once values has been read.
+
+        Parameters:
+        - times (numpy.ndarray): Frame times in seconds, following every frame fed so far.
+        - band_magnitude (numpy.ndarray): STFT magnitudes of the band rows, shape (bins, frames).
+        """
+        if self._values is not None:
+            raise RuntimeError("The envelope is already complete")
+        if len(times) == 0:
+            return
+        energy = np.square(band_magnitude, dtype=np.float64).sum(axis=0)
+        peak = band_magnitude.max(axis=0) if len(band_magnitude) else np.zeros(len(times), dtype=np.float32)
+        self._frames.append((np.asarray(times, dtype=np.float64), energy, peak))
+
+    def extend(self, envelope):
+        """
+        Adds the frames fed to another envelope, e.g. the one of the next time shard of the recording.
+
+        Parameters:
+        - envelope (BandEnvelope): Envelope fed with frames following every frame fed so far, whose
+          values have not been read yet.
+        """
+        if self._values is not None or envelope._values is not None:
+            raise RuntimeError("The envelope is already complete")
+        self._frames.extend(envelope._frames)
+
+    @property
+    def values(self):
+        """
+        The envelope as an ENVELOPE_DTYPE array with one record per window.
+        """
+        if self._values is None:
+            self._values = self._collapse()
+            # Only the compact envelope is kept, e.g. when it is sent back from a worker process
+            self._frames = []
+        return self._values
+
+    def downsample(self, max_points):
+        """
+        Reduces the envelope to at most max_points windows for display.
+
+        Parameters:
+        - max_points (int): Maximum number of windows to return.
+
+        Returns:
+        - tuple: (times, energy, peak) with the start time of each merged window in seconds, its mean
+                 energy and its largest peak.
+        """
+        values = self.values
+        step = max(1, -(-len(values) // max(1, max_points)))
+        starts = np.arange(0, len(values), step)
+        if starts.size == 0:
+            return np.empty(0), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+
+        energy = values['energy'].astype(np.float64)
+        present = ~np.isnan(energy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_energy = np.add.reduceat(np.where(present, energy, 0), starts) / np.add.reduceat(present, starts)
+        peak = np.fmax.reduceat(values['peak'], starts)
+        return starts / self.rate, mean_energy.astype(np.float32), peak
+
+    def save(self, file):
+        """
+        Writes the envelope to a file or file-like object in NumPy .npz format.
+        """
+        np.savez_compressed(file, envelope=self.values, rate=self.rate)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Reads an envelope written by save.
+
+        Returns:
+        - BandEnvelope: The stored envelope.
+        """
+        with np.load(file) as data:
+            envelope = cls(float(data['rate']))
+            envelope._values = data['envelope']
+        return envelope
+
+    def _collapse(self):
+        if not self._frames:
+            return np.empty(0, dtype=ENVELOPE_DTYPE)
+        times = np.concatenate([frame_times for frame_times, _, _ in self._frames])
+        energy = np.concatenate([frame_energy for _, frame_energy, _ in self._frames])
+        peak = np.concatenate([frame_peak for _, _, frame_peak in self._frames])
+
+        # Frame times are multiples of the hop; the tolerance keeps rounding from moving a frame back a window
+        windows = np.floor(times * self.rate + 1e-9).astype(np.intp)
+        occupied, starts = np.unique(windows, return_index=True)
+        counts = np.diff(np.append(starts, len(windows)))
+
+        values = np.full(windows[-1] + 1, np.nan, dtype=ENVELOPE_DTYPE)
+        # A frame skipped by an ActivityGate is NaN and makes its whole window NaN
+        values['energy'][occupied] = np.add.reduceat(energy, starts) / counts
+        values['peak'][occupied] = np.maximum.reduceat(peak, starts)
+        return values
+
+
+class SpectralGate:
+    """
+    Spectral gating noise reduction applied to STFT magnitudes before they are thresholded.
+
+    This replaces the noisereduce pass the notebooks ran to write *_reduced.wav copies before detection.
+    As in its non-stationary mode, the noise level of each bin is its magnitude smoothed over time, and
+    bins that do not rise noise_gate times above it are set to zero. The smoothing is a one-pole filter
+    run forward over the frames, so the gate works on the band-limited matrix block by block with no
+    inverse STFT; bins that pass keep their magnitude, so the detection window still applies as is.
+    """
+
+    def __init__(self, frame_step, noise_gate, time_constant=DEFAULT_NOISE_TIME_CONSTANT):
+        # Frame steps derived from frame times carry rounding; nanoseconds keep every path on one coefficient
+        alpha = min(1.0, round(frame_step, 9) / time_constant)
+        self.b = np.array([alpha])
+        self.a = np.array([1.0, alpha - 1.0])
+        self.noise_gate = noise_gate
+        self.warm_up_frames = int(np.ceil(NOISE_GATE_WARM_UP / alpha))
+        self.state = None
+
+    def process(self, magnitude):
+        """
+        Gates the next frames.
+
+        Parameters:
+        - magnitude (numpy.ndarray): STFT magnitudes of shape (bins, frames), following the frames
+          processed so far.
+
+        Returns:
+        - numpy.ndarray: The gated magnitudes as float32.
+        """
+        if magnitude.shape[1] == 0:
+            return np.asarray(magnitude, dtype=np.float32)
+        if self.state is None:
+            # The noise level starts at the first frame instead of rising from silence
+            self.state = lfilter_zi(self.b, self.a) * np.asarray(magnitude[:, :1], dtype=np.float64)
+        noise, self.state = lfilter(self.b, self.a, magnitude, axis=1, zi=self.state)
+        return np.where(magnitude > self.noise_gate * noise, magnitude, 0).astype(np.float32)
+
+
+class NoiseFloor:
+    """
+    Streaming per-bin noise floor estimate for detection thresholds that adapt to each recorder's gain.
+
+    Frames are collected in chunks of a fixed number of frames, counted from the start of the recording.
+    When a chunk is complete, the quantile of each bin over the chunk is taken, and the floor is the
+    median of that quantile over the last few chunks, which a call lasting a few seconds barely moves.
+    The chunk's frames are then released together with the floor. The estimate runs in the same pass
+    as the STFT and holds only one chunk of frames and a few quantiles, but frames are released up to
+    one chunk late.
+
+    The floor only depends on a fixed window of chunks, so a floor started warm_up_frames before a
+    chunk boundary gives exactly the floor of a run from the start, e.g. for time shards.
+    """
+
+    def __init__(self, frame_step, quantile=DEFAULT_NOISE_QUANTILE, chunk_duration=NOISE_FLOOR_CHUNK_DURATION,
+                 chunks=NOISE_FLOOR_CHUNKS, start_frame=0):
+        # Frame steps derived from frame times carry rounding; nanoseconds keep every path on one chunk size
+        self.chunk_frames = max(1, int(round(chunk_duration / round(frame_step, 9))))
+        self.quantile = quantile
+        self.warm_up_frames = (chunks - 1) * self.chunk_frames
+        self.history = deque(maxlen=chunks)
+        self.next_frame = start_frame
+        self.pending = []
+
+    def chunk_start(self, frame):
+        """
+        Returns the first frame of the chunk holding the given frame.
+        """
+        return frame - frame % self.chunk_frames
+
+    def process(self, times, magnitude):
+        """
+        Adds the next frames.
+
+        Parameters:
+        - times (numpy.ndarray): Frame times in seconds, following the frames added so far.
+        - magnitude (numpy.ndarray): STFT magnitudes of shape (bins, frames).
+
+        Returns:
+        - list: (first_frame, times, magnitude, floor) for every chunk completed by these frames, where
+                first_frame is the chunk's frame number and floor holds one value per bin.
+        """
+        chunks = []
+        start = 0
+        while start < len(times):
+            pending_frames = sum(len(pending_times) for pending_times, _ in self.pending)
+            needed = self.chunk_frames - (self.next_frame + pending_frames) % self.chunk_frames
+            stop = min(len(times), start + needed)
+            self.pending.append((times[start:stop], magnitude[:, start:stop]))
+            if stop - start == needed:
+                chunks.append(self._release())
+            start = stop
+        return chunks
+
+    def flush(self):
+        """
+        Releases the frames of the last, partial chunk.
+
+        Returns:
+        - list: The chunk as returned by process, if any frames were pending.
+        """
+        return [self._release()] if self.pending else []
+
+    def _release(self):
+        times = np.concatenate([pending_times for pending_times, _ in self.pending])
+        magnitude = np.concatenate([pending_magnitude for _, pending_magnitude in self.pending], axis=1)
+        self.pending = []
+        self.history.append(np.quantile(magnitude, self.quantile, axis=1))
+        floor = np.median(np.stack(self.history), axis=0)
+        first_frame = self.next_frame
+        self.next_frame += len(times)
+        return first_frame, times, magnitude, floor
+
+
+class ActivityGate:
+    """
+    Energy pre-gate that skips the STFT of frames too quiet to hold an impulse, and counts what it skipped.
+
+    This takes the place of the auditok activity detection of the V1 notebook, but it is exact: with the
+    window normalised to sum to one, no bin of a frame can exceed the largest window value times the sum
+    of the frame's absolute samples. That sum comes from per-hop block sums, one cheap pass over the
+    signal, and frames whose bound stays at or below the lowest detection threshold are never transformed.
+    Every frame that could produce an impulse is still computed, so the detected calls do not change.
+
+    Pass one ActivityGate per recording; skipped frames have NaN magnitudes, and so do their band envelope
+    windows.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.skipped_frames = 0
+
+    @property
+    def skipped_fraction(self):
+        """
+        The fraction of frames whose STFT was skipped.
+        """
+        return self.skipped_frames / self.frames if self.frames else 0.0
+
+    def add(self, gate):
+        """
+        Adds the counts of another gate, e.g. the one of the next time shard of the recording.
+        """
+        self.frames += gate.frames
+        self.skipped_frames += gate.skipped_frames
+
+    def active_frames(self, signal, n_frames, nperseg, hop, window, floor):
+        """
+        Finds the frames that could hold a bin above floor.
+
+        Parameters:
+        - signal (numpy.ndarray): Samples covering the frames, starting at the first one.
+        - n_frames (int): Number of frames.
+        - nperseg (int): Segment length in samples.
+        - hop (int): Distance between frames in samples.
+        - window (numpy.ndarray): Scaled STFT window, see stft_window.
+        - floor (float): Lowest magnitude that counts as an impulse.
+
+        Returns:
+        - numpy.ndarray: Boolean mask of the frames to transform.
+        """
+        # A frame covers `span` consecutive hop-long blocks, so its absolute sum is at most theirs
+        span = -(-nperseg // hop)
+        block_sums = np.add.reduceat(np.abs(signal), np.arange(0, len(signal), hop), dtype=np.float64)
+        block_sums = np.pad(block_sums, (0, max(0, n_frames - 1 + span - len(block_sums))))
+        frame_sums = sliding_window_view(block_sums, span)[:n_frames].sum(axis=1)
+
+        active = frame_sums * float(window.max()) * (1 + ACTIVITY_BOUND_MARGIN) > floor
+        self.frames += n_frames
+        self.skipped_frames += n_frames - int(np.count_nonzero(active))
+        return active
+
+
+class EventMerger:
+    """
+    Merges impulse frames into saw call events, one batch of impulses at a time.
+
+    An impulse more than time_threshold seconds after the previous one starts a new event. An impulse
+    between MIN_IMPULSE_SPACING and time_threshold seconds after the previous one extends the current
+    event, and the event keeps the frequency of its strongest impulse. The time of the last impulse and
+    the still open event are carried between batches, so feeding a recording block by block gives the
+    same events as feeding it in one go.
+    """
+
+    def __init__(self, time_threshold=DEFAULT_TIME_THRESHOLD, min_impulses=DEFAULT_MIN_IMPULSES):
+        self.time_threshold = time_threshold
+        self.min_impulses = min_impulses
+        self.last_event_time_seconds = None
+        self.open_event = None
+
+    def feed(self, hit_times, hit_frequencies, hit_magnitudes):
+        """
+        Adds a batch of impulses that follow every impulse fed so far.
+
+        Parameters:
+        - hit_times (numpy.ndarray): Impulse times in seconds, in increasing order.
+        - hit_frequencies (numpy.ndarray): Frequency of each impulse in Hz.
+        - hit_magnitudes (numpy.ndarray): Magnitude of each impulse.
+
+        Returns:
+        - numpy.ndarray: Events (EVENT_DTYPE) closed by this batch that have at least min_impulses impulses.
+        """
+        hit_times = np.asarray(hit_times)
+        if hit_times.size == 0:
+            return empty_events()
+
+        previous_times = np.concatenate((
+            [np.nan if self.last_event_time_seconds is None else self.last_event_time_seconds],
+            hit_times[:-1]
+        ))
+        time_diffs = hit_times - previous_times
+        starts_event = time_diffs > self.time_threshold
+        extends_event = (time_diffs <= self.time_threshold) & (time_diffs > MIN_IMPULSE_SPACING)
+        if self.last_event_time_seconds is None:
+            starts_event[0] = True
+        self.last_event_time_seconds = hit_times[-1]
+
+        # Keep only impulses that open or extend an event; the rest are too close to their predecessor
+        contributing = np.flatnonzero(starts_event | extends_event)
+        if contributing.size == 0:
+            return empty_events()
+        times = hit_times[contributing]
+        frequencies = np.asarray(hit_frequencies)[contributing]
+        magnitudes = np.asarray(hit_magnitudes)[contributing]
+
+        # Group 0 holds the impulses that extend the event left open by the previous batch (it may be empty)
+        group_starts = np.concatenate(([0], np.flatnonzero(starts_event[contributing])))
+        group_ends = np.append(group_starts[1:], contributing.size) - 1
+        impulse_counts = group_ends - group_starts + 1
+
+        # Peak impulse of each event; ties keep the earliest impulse
+        non_empty = np.flatnonzero(impulse_counts > 0)
+        peak_magnitudes = np.zeros(group_starts.size, dtype=magnitudes.dtype)
+        peak_magnitudes[non_empty] = np.maximum.reduceat(magnitudes, group_starts[non_empty])
+        group_ids = np.repeat(np.arange(group_starts.size), impulse_counts)
+        peak_candidates = np.flatnonzero(magnitudes == peak_magnitudes[group_ids])
+        _, first_candidate = np.unique(group_ids[peak_candidates], return_index=True)
+        peak_indices = np.zeros(group_starts.size, dtype=np.intp)
+        peak_indices[non_empty] = peak_candidates[first_candidate]
+
+        if impulse_counts[0] > 0:
+            peak = peak_indices[0]
+            self.open_event['end_s'] = times[group_ends[0]]
+            self.open_event['impulse_count'] += impulse_counts[0]
+            if magnitudes[peak] > self.open_event['peak_mag'][0]:
+                self.open_event['peak_mag'] = magnitudes[peak]
+                self.open_event['peak_freq'] = frequencies[peak]
+
+        if group_starts.size == 1:
+            return empty_events()
+
+        # Every new event but the last is complete; the last one stays open for the next batch
+        new_events = np.empty(group_starts.size - 1, dtype=EVENT_DTYPE)
+        new_events['start_s'] = times[group_starts[1:]]
+        new_events['end_s'] = times[group_ends[1:]]
+        new_events['peak_freq'] = frequencies[peak_indices[1:]]
+        new_events['peak_mag'] = magnitudes[peak_indices[1:]]
+        new_events['impulse_count'] = impulse_counts[1:]
+
+        closed_events = new_events[:-1]
+        if self.open_event is not None:
+            closed_events = np.concatenate((self.open_event, closed_events))
+        self.open_event = new_events[-1:].copy()
+        return closed_events[closed_events['impulse_count'] >= self.min_impulses]
+
+    def expire(self, current_time):
+        """
+        Closes the open event once no later impulse can extend it any more.
+
+        Every impulse still to come lies after current_time, so if current_time is already more than
+        time_threshold seconds after the last impulse, the next impulse will start a new event.
+
+        Parameters:
+        - current_time (float): Time in seconds of the latest frame that has been checked for impulses.
+
+        Returns:
+        - numpy.ndarray: The open event (EVENT_DTYPE) if it was closed and has at least min_impulses impulses.
+        """
+        if self.open_event is None or current_time - self.last_event_time_seconds <= self.time_threshold:
+            return empty_events()
+        return self.flush()
+
+    def flush(self):
+        """
+        Closes the open event at the end of the recording.
+
+        Returns:
+        - numpy.ndarray: The open event (EVENT_DTYPE) if it has at least min_impulses impulses.
+        """
+        events, self.open_event = self.open_event, None
+        if events is None:
+            return empty_events()
+        return events[events['impulse_count'] >= self.min_impulses]
+
+
+def merge_impulses(hit_times, hit_frequencies, hit_magnitudes, time_threshold=DEFAULT_TIME_THRESHOLD,
+                   min_impulses=DEFAULT_MIN_IMPULSES):
+    """
+    Merges the impulse frames of a whole recording into saw call events, see EventMerger.
+
+    Parameters:
+    - hit_times (numpy.ndarray): Impulse times in seconds, in increasing order.
+    - hit_frequencies (numpy.ndarray): Frequency of each impulse in Hz.
+    - hit_magnitudes (numpy.ndarray): Magnitude of each impulse.
+    - time_threshold (float): Time threshold in seconds for merging events (default is 5s).
+    - min_impulses (int): Minimum number of impulses for an event to be kept (default is 3).
+
+    Returns:
+    - numpy.ndarray: Detected saw calls as an EVENT_DTYPE structured array.
+    """
+    merger = EventMerger(time_threshold, min_impulses)
+    return np.concatenate((merger.feed(hit_times, hit_frequencies, hit_magnitudes), merger.flush()))
+
+
+def detect_events(magnitude, frequencies, times, min_mag=DEFAULT_MIN_MAG, max_mag=DEFAULT_MAX_MAG,
+                  min_freq=DEFAULT_MIN_FREQ, max_freq=DEFAULT_MAX_FREQ, time_threshold=DEFAULT_TIME_THRESHOLD,
+                  min_impulses=DEFAULT_MIN_IMPULSES, return_hits=False, envelope=None, noise_gate=DEFAULT_NOISE_GATE,
+                  noise_time_constant=DEFAULT_NOISE_TIME_CONSTANT, noise_floor=DEFAULT_NOISE_FLOOR,
+                  noise_floor_max=DEFAULT_NOISE_FLOOR_MAX, noise_quantile=DEFAULT_NOISE_QUANTILE):
+    """
+    Detects saw call events in an STFT magnitude matrix.
+
+    Parameters:
+    - magnitude (numpy.ndarray): STFT magnitude matrix of shape (frequencies, frames).
+    - frequencies (numpy.ndarray): Frequency of each row in Hz.
+    - times (numpy.ndarray): Time of each column in seconds.
+    - min_mag, max_mag, min_freq, max_freq: Detection window, see find_impulse_frames.
+    - time_threshold, min_impulses: Merge parameters, see merge_impulses.
+    - return_hits (bool): Also return the impulse hits the events were merged from.
+    - envelope (BandEnvelope): Envelope to feed with the band rows of every frame, before gating
+      (default is none).
+    - noise_gate (float): Spectral gate threshold, see SpectralGate (default is no gating).
+    - noise_time_constant (float): Noise level smoothing of the gate in seconds.
+    - noise_floor (float): Adaptive minimum as a multiple of each bin's noise floor, replacing min_mag
+      (default is the fixed window), see NoiseFloor.
+    - noise_floor_max (float): Adaptive maximum as a multiple of the noise floor (default is max_mag).
+    - noise_quantile (float): Quantile of each bin's magnitudes taken as its noise floor.
+
+    Returns:
+    - numpy.ndarray: Detected saw calls as an EVENT_DTYPE structured array, followed by the
+      ImpulseHits when return_hits is set.
+    """
+    times = np.asarray(times)
+    frame_step = times[1] - times[0] if len(times) > 1 else NOISE_FLOOR_CHUNK_DURATION
+    if envelope is not None:
+        envelope.feed(times, magnitude[band_slice(frequencies, min_freq, max_freq)])
+    if noise_floor:
+        floor = NoiseFloor(frame_step, noise_quantile)
+        chunks = floor.process(times, magnitude) + floor.flush()
+    else:
+        chunks = [(0, times, magnitude, None)]
+    gate = SpectralGate(frame_step, noise_gate, noise_time_constant) if noise_gate else None
+
+    hit_batches = []
+    for _, chunk_times, chunk_magnitude, chunk_floor in chunks:
+        if gate is not None:
+            chunk_magnitude = gate.process(chunk_magnitude)
+        if chunk_floor is not None:
+            min_mag = noise_floor * chunk_floor
+            if noise_floor_max:
+                max_mag = noise_floor_max * chunk_floor
+        frames, bins, hit_magnitudes = first_impulse_bins(chunk_magnitude, frequencies, min_mag, max_mag,
+                                                          min_freq, max_freq)
+        hit_batches.append((chunk_times[frames], bins, hit_magnitudes))
+    hits = ImpulseHits.from_batches(hit_batches, frequencies)
+    events = hits.merge(time_threshold, min_impulses)
+    if return_hits:
+        return events, hits
+    return events
+
+
+class StreamingDecimator:
+    """
+    Polyphase decimator that accepts the signal in blocks.
+
+    Produces the same samples as decimate_signal on the whole signal, keeping only the filter
+    history between blocks. A decimator started at a later output sample expects the input from
+    input_start on and produces the same samples from there.
+    """
+
+    def __init__(self, factor, start=0):
+        self.factor = factor
+        self.filter = decimation_filter(factor)
+        self.half_length = DECIMATION_HALF_LENGTH * factor
+        # Input samples still needed, starting with the zeros the filter sees before the signal. When
+        # starting at a later output sample, input starts at the first sample that output's filter reaches
+        self.buffer_start = start * factor - self.half_length
+        self.buffer = np.zeros(max(0, -self.buffer_start), dtype=np.float32)
+        self.input_start = max(0, self.buffer_start)
+        self.input_length = self.input_start
+        self.next_output = start
+
+    def process(self, block):
+        """
+        Decimates the next block of the signal.
+
+        Parameters:
+        - block (numpy.ndarray): The next input samples.
+
+        Returns:
+        - numpy.ndarray: Every output sample whose filter support is now complete, as float32.
+        """
+        self.buffer = np.concatenate((self.buffer, block))
+        self.input_length += len(block)
+        return self._drain((self.input_length - 1 - self.half_length) // self.factor)
+
+    def flush(self):
+        """
+        Decimates the end of the signal, treating everything after it as zeros.
+
+        Returns:
+        - numpy.ndarray: The remaining output samples, as float32.
+        """
+        self.buffer = np.concatenate((self.buffer, np.zeros(self.half_length + self.factor, dtype=np.float32)))
+        return self._drain(-(-self.input_length // self.factor) - 1)
+
+    def _drain(self, last_output):
+        count = last_output - self.next_output + 1
+        if count <= 0:
+            return np.empty(0, dtype=np.float32)
+
+        # Output n is sum_k h[k] x[n * factor + half_length - k]
+        segment_start = self.next_output * self.factor - self.half_length
+        segment_stop = last_output * self.factor + self.half_length + 1
+        segment = self.buffer[segment_start - self.buffer_start:segment_stop - self.buffer_start]
+        offset = 2 * self.half_length // self.factor
+        output = upfirdn(self.filter, segment, 1, self.factor)[offset:offset + count]
+
+        self.next_output = last_output + 1
+        keep_from = self.next_output * self.factor - self.half_length
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return output.astype(np.float32)
+
+
+class StreamingSTFT:
+    """
+    Computes the band-limited STFT magnitude of a signal that arrives in blocks.
+
+    The frames are exactly those scipy.signal.stft produces for the whole (zero-padded) signal, but
+    only the samples of one partial frame are kept between blocks and only the band rows are returned.
+
+    Setting start_frame and stop_frame computes only those frames of the signal, e.g. for one time shard.
+    The input must then start at input_start, and only the samples before input_stop are needed.
+
+    With an activity_gate, frames that cannot reach activity_floor are not transformed and come out as NaN.
+    """
+
+    def __init__(self, sample_rate, segment_duration=DEFAULT_SEGMENT_DURATION, min_freq=DEFAULT_MIN_FREQ,
+                 max_freq=DEFAULT_MAX_FREQ, decimate=False, workers=None, start_frame=0, stop_frame=None,
+                 activity_gate=None, activity_floor=None):
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.activity_gate = activity_gate
+        self.activity_floor = activity_floor
+        self.nperseg, self.noverlap = stft_segment(sample_rate, segment_duration)
+        self.factor = decimation_factor(sample_rate, segment_duration, max_freq) if decimate else 1
+
+        # Segment length, overlap and hop at the (possibly decimated) working rate
+        self.working_rate = sample_rate / self.factor
+        self.working_nperseg = self.nperseg // self.factor
+        self.working_noverlap = self.noverlap // self.factor
+        self.working_hop = self.working_nperseg - self.working_noverlap
+
+        # Working-rate sample the first frame starts at, negative inside the leading zero padding
+        first_sample = start_frame * self.working_hop - self.working_nperseg // 2
+        self.decimator = StreamingDecimator(self.factor, max(0, first_sample)) if self.factor > 1 else None
+        self.input_start = self.decimator.input_start if self.decimator is not None else max(0, first_sample)
+        self.stop_frame = stop_frame
+        self.input_stop = None
+        if stop_frame is not None:
+            # Working-rate samples up to the end of the last frame, and the input their filters reach
+            working_stop = (stop_frame - 1) * self.working_hop + self.working_nperseg - self.working_nperseg // 2
+            self.input_stop = working_stop
+            if self.decimator is not None:
+                self.input_stop = (working_stop - 1) * self.factor + self.decimator.half_length + 1
+
+        frequencies = rfftfreq(self.nperseg, 1 / sample_rate)[:self.working_nperseg // 2 + 1]
+        self.band = band_slice(frequencies, min_freq, max_freq)
+        self.frequencies = frequencies[self.band]
+        self.gain = decimation_gain(self.frequencies, sample_rate, self.factor)
+        self.window = stft_window(self.working_nperseg)
+        self.frame_buffer = None
+
+        # Working-rate samples of the zero-padded signal that the next frames still need
+        self.buffer = np.zeros(max(0, -first_sample), dtype=np.float32)
+        self.signal_length = max(0, first_sample)
+        self.frames_done = start_frame
+
+    def process(self, block):
+        """
+        Adds the next block of DC-free float32 samples.
+
+        Parameters:
+        - block (numpy.ndarray): The next samples at the native sample rate.
+
+        Returns:
+        - tuple: (times, magnitude) for every frame completed by this block, magnitude holding band rows only.
+        """
+        if self.decimator is not None:
+            block = self.decimator.process(block)
+        self.signal_length += len(block)
+        return self._append(block)
+
+    def flush(self):
+        """
+        Finishes the signal with the same zero padding scipy.signal.stft applies.
+
+        Returns:
+        - tuple: (times, magnitude) for the remaining frames.
+        """
+        tail = self.decimator.flush() if self.decimator is not None else np.empty(0, dtype=np.float32)
+        self.signal_length += len(tail)
+        padded_length = self.signal_length + 2 * (self.working_nperseg // 2)
+        extra = (-(padded_length - self.working_nperseg) % self.working_hop) % self.working_nperseg
+        return self._append(np.concatenate((
+            tail, np.zeros(self.working_nperseg // 2 + extra, dtype=np.float32)
+        )))
+
+    def _append(self, samples):
+        self.buffer = np.concatenate((self.buffer, samples))
+        n_frames = (len(self.buffer) - self.working_nperseg) // self.working_hop + 1
+        if self.stop_frame is not None:
+            n_frames = min(n_frames, self.stop_frame - self.frames_done)
+        if n_frames <= 0:
+            return np.empty(0), np.empty((len(self.frequencies), 0), dtype=np.float32)
+
+        used = (n_frames - 1) * self.working_hop + self.working_nperseg
+        if self.activity_gate is None:
+            magnitude, self.frame_buffer = stft_band_magnitude(
+                self.buffer[:used], self.working_nperseg, self.working_noverlap, self.band, self.window,
+                self.workers, self.frame_buffer
+            )
+        else:
+            active = self.activity_gate.active_frames(self.buffer[:used], n_frames, self.working_nperseg,
+                                                      self.working_hop, self.window, self.activity_floor)
+            magnitude = np.full((len(self.frequencies), n_frames), np.nan, dtype=np.float32)
+            if active.any():
+                magnitude[:, active], self.frame_buffer = stft_band_magnitude(
+                    self.buffer[:used], self.working_nperseg, self.working_noverlap, self.band, self.window,
+                    self.workers, self.frame_buffer, np.flatnonzero(active)
+                )
+
+        times = stft_frame_times(n_frames, self.nperseg, self.noverlap, self.sample_rate, self.frames_done)
+        self.frames_done += n_frames
+        self.buffer = self.buffer[n_frames * self.working_hop:]
+        return times, magnitude
+
+
+class StreamingDetector:
+    """
+    Detects saw calls incrementally in a signal that arrives block by block, e.g. from a live recorder.
+
+    A call is returned as soon as it is final: when the next impulse starts a new call, or when the
+    processed audio has moved more than time_threshold seconds past the call's last impulse. A call is
+    therefore reported about time_threshold + segment_duration seconds after its last impulse, and only
+    one partial STFT frame and the open call are held between blocks. With adaptive thresholds (see
+    NoiseFloor), one chunk of frames is held as well and calls are reported up to a chunk later.
+    """
+
+    def __init__(self, sample_rate, dc_offset=0.0, min_mag=DEFAULT_MIN_MAG, max_mag=DEFAULT_MAX_MAG,
+                 min_freq=DEFAULT_MIN_FREQ, max_freq=DEFAULT_MAX_FREQ, segment_duration=DEFAULT_SEGMENT_DURATION,
+                 time_threshold=DEFAULT_TIME_THRESHOLD, min_impulses=DEFAULT_MIN_IMPULSES, decimate=False,
+                 keep_hits=False, envelope=None, fft_workers=None, start_frame=0, stop_frame=None,
+                 noise_gate=DEFAULT_NOISE_GATE, noise_time_constant=DEFAULT_NOISE_TIME_CONSTANT, activity_gate=None,
+                 noise_floor=DEFAULT_NOISE_FLOOR, noise_floor_max=DEFAULT_NOISE_FLOOR_MAX,
+                 noise_quantile=DEFAULT_NOISE_QUANTILE):
+        self.dc_offset = np.float32(dc_offset)
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.gate = None
+        self.floor = None
+        self.start_frame = start_frame
+        self.stop_frame = stop_frame
+        self.noise_floor = noise_floor
+        self.noise_floor_max = noise_floor_max
+        nperseg, noverlap = stft_segment(sample_rate, segment_duration)
+        first_frame = start_frame
+        if noise_gate:
+            self.gate = SpectralGate((nperseg - noverlap) / sample_rate, noise_gate, noise_time_constant)
+            # A gate starting mid-recording first runs over earlier frames to reach the right noise level
+            first_frame = max(0, first_frame - self.gate.warm_up_frames)
+        if noise_floor:
+            self.floor = NoiseFloor((nperseg - noverlap) / sample_rate, noise_quantile)
+            # The floor is estimated over whole chunks, including the chunks before a later start frame
+            # that it is a median over and the rest of the chunk holding the stop frame
+            first_frame = self.floor.chunk_start(max(0, min(first_frame, start_frame - self.floor.warm_up_frames)))
+            self.floor.next_frame = first_frame
+            if stop_frame is not None:
+                stop_frame = self.floor.chunk_start(stop_frame + self.floor.chunk_frames - 1)
+        self.spectrogram = StreamingSTFT(sample_rate, segment_duration, min_freq, max_freq, decimate, fft_workers,
+                                         first_frame, stop_frame)
+        self.merger = EventMerger(time_threshold, min_impulses)
+        self.band_min_mag = min_mag * self.spectrogram.gain
+        self.band_max_mag = max_mag * self.spectrogram.gain
+        # The noise gate's level and the noise floor follow every frame, so frames are only skipped without them
+        if activity_gate is not None and self.gate is None and self.floor is None:
+            self.spectrogram.activity_gate = activity_gate
+            self.spectrogram.activity_floor = float(np.min(self.band_min_mag, initial=np.inf))
+        self.keep_hits = keep_hits
+        self.hit_batches = []
+        self.envelope = envelope
+
+    def process(self, block):
+        """
+        Adds the next block of samples.
+
+        Parameters:
+        - block (numpy.ndarray): The next mono samples.
+
+        Returns:
+        - numpy.ndarray: Calls (EVENT_DTYPE) that became final with this block.
+        """
+        block = np.asarray(block, dtype=np.float32) - self.dc_offset
+        return self._merge_frames(*self.spectrogram.process(block))
+
+    def flush(self):
+        """
+        Ends the signal and closes the open call.
+
+        Returns:
+        - numpy.ndarray: The remaining calls (EVENT_DTYPE).
+        """
+        return np.concatenate((self._merge_frames(*self.spectrogram.flush(), flush=True), self.merger.flush()))
+
+    @property
+    def hits(self):
+        """
+        The impulse hits found so far (only collected when keep_hits is set).
+        """
+        return ImpulseHits.from_batches(self.hit_batches, self.spectrogram.frequencies)
+
+    def _own_frames(self, first_frame, n_frames):
+        """Returns the slice of a batch of frames that lies between start_frame and stop_frame"""
+        stop = n_frames if self.stop_frame is None else min(n_frames, max(0, self.stop_frame - first_frame))
+        return slice(min(stop, max(0, self.start_frame - first_frame)), stop)
+
+    def _merge_frames(self, times, magnitude, flush=False):
+        first_frame = self.spectrogram.frames_done - len(times)
+        if self.envelope is not None:
+            own = self._own_frames(first_frame, len(times))
+            if own.stop > own.start:
+                self.envelope.feed(times[own], magnitude[:, own])
+
+        if self.floor is None:
+            batches = [(first_frame, times, magnitude, None)]
+        else:
+            batches = self.floor.process(times, magnitude) + (self.floor.flush() if flush else [])
+
+        calls = [empty_events()]
+        for first_frame, times, magnitude, floor in batches:
+            # Warm-up frames before start_frame only run through the gate
+            if self.gate is not None:
+                magnitude = self.gate.process(magnitude)
+            own = self._own_frames(first_frame, len(times))
+            times, magnitude = times[own], magnitude[:, own]
+            if len(times) == 0:
+                continue
+
+            min_mag, max_mag = self.band_min_mag, self.band_max_mag
+            if floor is not None:
+                min_mag = self.noise_floor * floor
+                if self.noise_floor_max:
+                    max_mag = self.noise_floor_max * floor
+            frames, bins, hit_magnitudes = first_impulse_bins(magnitude, self.spectrogram.frequencies, min_mag,
+                                                              max_mag, self.min_freq, self.max_freq)
+            hit_times = times[frames]
+            if self.keep_hits:
+                self.hit_batches.append((hit_times, bins, hit_magnitudes))
+            calls.append(self.merger.feed(hit_times, self.spectrogram.frequencies[bins], hit_magnitudes))
+            calls.append(self.merger.expire(times[-1]))
+        return np.concatenate(calls)
+
+
+def detect_events_streaming(blocks, sample_rate, dc_offset=0.0, return_hits=False, **params):
+    """
+    Detects saw call events in a signal delivered as consecutive blocks.
+
+    Only one block, the partial STFT frame and the open event are held at any time, so memory does not
+    grow with the length of the recording.
+
+    Parameters:
+    - blocks (iterable): Consecutive mono sample arrays.
+    - sample_rate (int): Sample rate of the audio data in Hz.
+    - dc_offset (float): Mean of the whole signal, subtracted from every block.
+    - return_hits (bool): Also return the impulse hits the events were merged from.
+    - params: Detection parameters of StreamingDetector: min_mag, max_mag, min_freq, max_freq (detection
+      window, see find_impulse_frames), segment_duration, time_threshold, min_impulses (see EventMerger),
+      decimate (decimate to the detection band before the STFT), envelope (a BandEnvelope to feed
+      with the band rows of every frame), fft_workers (FFT threads, see stft_band_magnitude),
+      noise_gate, noise_time_constant (spectral gating before thresholding, see SpectralGate),
+      noise_floor, noise_floor_max, noise_quantile (thresholds relative to each bin's noise floor, see
+      detect_events) and activity_gate (an ActivityGate that skips silent frames and counts them).
+
+    Returns:
+    - numpy.ndarray: Detected saw calls as an EVENT_DTYPE structured array, followed by the
+      ImpulseHits when return_hits is set.
+    """
+    detector = StreamingDetector(sample_rate, dc_offset, keep_hits=return_hits, **params)
+    events = [detector.process(block) for block in blocks]
+    events.append(detector.flush())
+    events = np.concatenate(events)
+    if return_hits:
+        return events, detector.hits
+    return events
+
+
+def detect_saw_calls(audio_data, sample_rate, dc_offset=None, block_duration=DEFAULT_BLOCK_DURATION, **params):
+    """
+    Detects saw calls in an already-loaded or streamed signal.
+
+    This is the single detection engine used by the processing pipeline, the notebook-era
+    find_events_within_threshold and the file helpers below. Loaded arrays are fed through the
+    streaming STFT in blocks, so the STFT never holds more than one block either way.
+
+    Parameters:
+    - audio_data (numpy.ndarray or iterable): The loaded audio data (multi-channel arrays use their first
+      channel), or an iterable of consecutive mono blocks.
+    - sample_rate (int): The sample rate of the audio data.
+    - dc_offset (float): Mean of the whole signal. Measured for loaded arrays when not given; streamed
+      blocks are assumed to be DC-free unless it is given.
+    - block_duration (float): Length in seconds of the blocks a loaded array is processed in.
+    - params: Detection parameters, see detect_events_streaming.
+
+    Returns:
+    - numpy.ndarray: Detected saw calls as an EVENT_DTYPE structured array (and the ImpulseHits when
+      params ask for them, see detect_events_streaming).
+    """
+    blocks = audio_data
+    if isinstance(audio_data, (np.ndarray, PCM24Array)):
+        signal = channel_view(audio_data)
+        if dc_offset is None:
+            dc_offset = float(np.mean(signal, dtype=np.float64)) if signal.size else 0.0
+        block_size = max(1, int(block_duration * sample_rate))
+        blocks = (signal[start:start + block_size] for start in range(0, len(signal), block_size))
+
+    return detect_events_streaming(blocks, sample_rate, dc_offset=dc_offset or 0.0, **params)
+
+
+def load_wav(file_path):
+    """
+    Memory-maps a WAV file instead of reading it into memory.
+
+    The samples stay in the OS page cache, so nothing is copied until a block is converted to float32,
+    and processing the same file again reads it from memory rather than disk. The header is parsed by
+    wav_reader.map_wav, which also maps the packed 24-bit PCM, WAVE_FORMAT_EXTENSIBLE headers and
+    odd-sized metadata chunks Song Meter recorders write; scipy.io.wavfile covers the rest (e.g. RF64).
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+
+    Returns:
+    - tuple: (sample_rate, audio_data) where audio_data is a numpy.memmap (or a PCM24Array for 24-bit
+             PCM) of shape (frames,) or (frames, channels) with the sample values scipy.io.wavfile.read
+             returns.
+
+    Raises:
+    - ValueError: If the sample format cannot be memory-mapped.
+    """
+    try:
+        return map_wav(file_path)
+    except ValueError:
+        return wavfile.read(file_path, mmap=True)
+
+
+def channel_view(audio_data, channel=0):
+    """
+    Returns one channel of a (frames, channels) array as a strided view, without copying.
+
+    Parameters:
+    - audio_data (numpy.ndarray): Mono or multi-channel samples.
+    - channel (int): Channel to select from multi-channel data.
+
+    Returns:
+    - numpy.ndarray: The selected channel.
+    """
+    return audio_data[:, channel] if audio_data.ndim == 2 else audio_data
+
+
+def iter_wav_blocks(file_path, block_duration=DEFAULT_BLOCK_DURATION, channel=0, start=0, stop=None):
+    """
+    Reads one channel of a WAV file in fixed-size blocks with soundfile.
+
+    Used for files load_wav cannot memory-map.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - block_duration (float): Length of each block in seconds.
+    - channel (int): Channel to read from multi-channel files.
+    - start (int): First sample to read.
+    - stop (int): Sample to stop reading at (default is the end of the file).
+
+    Yields:
+    - numpy.ndarray: Consecutive blocks with the sample values scipy.io.wavfile.read would return.
+    """
+    with sf.SoundFile(file_path) as wav_file:
+        dtype = WAV_SUBTYPE_DTYPES.get(wav_file.subtype, 'int16')
+        block_size = max(1, int(block_duration * wav_file.samplerate))
+        wav_file.seek(start)
+        frames = -1 if stop is None else max(0, min(stop, wav_file.frames) - start)
+        for block in wav_file.blocks(blocksize=block_size, frames=frames, dtype=dtype, always_2d=True):
+            yield block[:, channel]
+
+
+def iter_wav_range(file_path, start=0, stop=None, block_duration=DEFAULT_BLOCK_DURATION, channel=0):
+    """
+    Reads samples start to stop of one channel of a WAV file in blocks, memory-mapped when possible.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - start (int): First sample to read.
+    - stop (int): Sample to stop reading at (default is the end of the file).
+    - block_duration (float): Length of each block in seconds.
+    - channel (int): Channel to read from multi-channel files.
+
+    Yields:
+    - numpy.ndarray: Consecutive blocks with the sample values scipy.io.wavfile.read would return.
+    """
+    try:
+        sample_rate, audio_data = load_wav(file_path)
+    except ValueError:
+        yield from iter_wav_blocks(file_path, block_duration, channel, start, stop)
+        return
+
+    signal = channel_view(audio_data, channel)[start:stop]
+    block_size = max(1, int(block_duration * sample_rate))
+    for block_start in range(0, len(signal), block_size):
+        yield signal[block_start:block_start + block_size]
+
+
+def wav_duration(file_path):
+    """
+    Reads the duration of a WAV file from its header.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+
+    Returns:
+    - float: Duration in seconds.
+    """
+    return sf.info(file_path).duration
+
+
+def open_wav_blocks(file_path, block_duration=DEFAULT_BLOCK_DURATION):
+    """
+    Opens one channel of a WAV file as consecutive blocks without loading it into memory.
+
+    The file is memory-mapped and sliced into blocks. Formats that cannot be memory-mapped are read
+    with soundfile instead, in which case the file is read once up front to measure the DC offset.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - block_duration (float): Length of the blocks in seconds.
+
+    Returns:
+    - tuple: (blocks, sample_rate, n_samples, dc_offset) where blocks is an iterator over the samples.
+    """
+    try:
+        sample_rate, audio_data = load_wav(file_path)
+    except ValueError:
+        pass
+    else:
+        signal = channel_view(audio_data)
+        dc_offset = float(np.mean(signal, dtype=np.float64)) if signal.size else 0.0
+        block_size = max(1, int(block_duration * sample_rate))
+        blocks = (signal[start:start + block_size] for start in range(0, len(signal), block_size))
+        return blocks, sample_rate, len(signal), dc_offset
+
+    sample_rate = sf.info(file_path).samplerate
+    total = 0.0
+    n_samples = 0
+    for block in iter_wav_blocks(file_path, block_duration):
+        total += float(np.sum(block, dtype=np.float64))
+        n_samples += len(block)
+    dc_offset = total / n_samples if n_samples else 0.0
+    return iter_wav_blocks(file_path, block_duration), sample_rate, n_samples, dc_offset
+
+
+def detect_events_in_file(file_path, block_duration=DEFAULT_BLOCK_DURATION, cache=None, return_hits=False,
+                          **params):
+    """
+    Detects saw call events in a WAV file without loading it into memory, see open_wav_blocks.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - block_duration (float): Length of the processing blocks in seconds.
+    - cache (SpectrogramCache): Cache of band-limited STFT magnitudes to read from and fill (default is none).
+    - return_hits (bool): Also return the impulse hits the events were merged from.
+    - params: Detection parameters, see detect_events_streaming.
+
+    Returns:
+    - tuple: (events, sample_rate, n_samples), events as returned by detect_saw_calls, followed by the
+             ImpulseHits when return_hits is set.
+    """
+    # The cached matrix holds every frame, silent or not, so skipping silent frames streams the file instead
+    if cache is not None and params.get('activity_gate') is None:
+        # The cached magnitude is the same matrix the streaming STFT produces, only kept whole
+        params = dict(params)
+        segment_duration = params.pop('segment_duration', DEFAULT_SEGMENT_DURATION)
+        decimate = params.pop('decimate', False)
+        fft_workers = params.pop('fft_workers', None)
+        params.pop('activity_gate', None)
+        frequencies, times, magnitude, gain, sample_rate, n_samples = file_band_magnitude(
+            file_path, params.get('min_freq', DEFAULT_MIN_FREQ), params.get('max_freq', DEFAULT_MAX_FREQ),
+            segment_duration, decimate, block_duration, cache, fft_workers
+        )
+        result = detect_events(magnitude, frequencies, times, return_hits=return_hits,
+                               **scaled_thresholds(params, gain))
+    else:
+        blocks, sample_rate, n_samples, dc_offset = open_wav_blocks(file_path, block_duration)
+        result = detect_saw_calls(blocks, sample_rate, dc_offset=dc_offset, return_hits=return_hits, **params)
+
+    if return_hits:
+        events, hits = result
+        return events, sample_rate, n_samples, hits
+    return result, sample_rate, n_samples
+
+
+def band_magnitude_streaming(blocks, sample_rate, dc_offset=0.0, min_freq=DEFAULT_MIN_FREQ,
+                             max_freq=DEFAULT_MAX_FREQ, segment_duration=DEFAULT_SEGMENT_DURATION, decimate=False,
+                             fft_workers=None):
+    """
+    Computes the band-limited STFT magnitude of a signal delivered as consecutive blocks.
+
+    Only the band rows are kept, so the matrix of a long recording stays small (about 30 rows at the
+    default band and segment duration).
+
+    Parameters:
+    - blocks (iterable): Consecutive mono sample arrays.
+    - sample_rate (int): Sample rate of the audio data in Hz.
+    - dc_offset (float): Mean of the whole signal, subtracted from every block.
+    - min_freq (float): Lower band edge in Hz (exclusive).
+    - max_freq (float): Upper band edge in Hz (exclusive).
+    - segment_duration (float): Duration of each STFT segment in seconds.
+    - decimate (bool): Decimate to the band before the STFT.
+    - fft_workers (int): Threads for the FFT, see stft_band_magnitude.
+
+    Returns:
+    - tuple: (frequencies, times, magnitude, gain) for the band rows, as returned by band_limited_stft.
+    """
+    spectrogram = StreamingSTFT(sample_rate, segment_duration, min_freq, max_freq, decimate, fft_workers)
+    chunks = [spectrogram.process(np.asarray(block, dtype=np.float32) - np.float32(dc_offset)) for block in blocks]
+    chunks.append(spectrogram.flush())
+    times = np.concatenate([chunk_times for chunk_times, _ in chunks])
+    magnitude = np.concatenate([chunk_magnitude for _, chunk_magnitude in chunks], axis=1)
+    return spectrogram.frequencies, times, magnitude, spectrogram.gain
+
+
+def parameter_grid(**choices):
+    """
+    Expands lists of candidate values into every combination of detection parameters.
+
+    Parameters:
+    - choices: Detection parameter names mapped to a list of values to try,
+      e.g. min_mag=[3000, 3500], time_threshold=[3, 5].
+
+    Returns:
+    - list: One dictionary of detection parameters per combination.
+    """
+    names = list(choices)
+    return [dict(zip(names, values)) for values in itertools.product(*(choices[name] for name in names))]
+
+
+def scaled_thresholds(params, gain):
+    """
+    Returns a copy of the detection parameters with the magnitude window scaled by the filter gain.
+
+    Parameters:
+    - params (dict): Detection parameters; missing magnitude limits use the defaults.
+    - gain (float or numpy.ndarray): Per-row filter gain, see band_limited_stft.
+
+    Returns:
+    - dict: The scaled parameters.
+    """
+    params = dict(params)
+    params['min_mag'] = params.get('min_mag', DEFAULT_MIN_MAG) * gain
+    params['max_mag'] = params.get('max_mag', DEFAULT_MAX_MAG) * gain
+    return params
+
+
+def sweep_parameters(magnitude, frequencies, times, parameter_sets, gain=1.0):
+    """
+    Evaluates several sets of detection parameters against one STFT magnitude matrix.
+
+    Parameters:
+    - magnitude (numpy.ndarray): STFT magnitude matrix covering every band in parameter_sets.
+    - frequencies (numpy.ndarray): Frequency of each row in Hz.
+    - times (numpy.ndarray): Time of each column in seconds.
+    - parameter_sets (list): Dictionaries of detection parameters (min_mag, max_mag, min_freq, max_freq,
+      time_threshold, min_impulses); missing parameters use the defaults.
+    - gain (float or numpy.ndarray): Per-row filter gain that magnitude thresholds are scaled by.
+
+    Returns:
+    - list: The detected events (EVENT_DTYPE array) of each parameter set, in the same order.
+    """
+    return [detect_events(magnitude, frequencies, times, **scaled_thresholds(params, gain))
+            for params in parameter_sets]
+
+
+def file_band_magnitude(file_path, min_freq=DEFAULT_MIN_FREQ, max_freq=DEFAULT_MAX_FREQ,
+                        segment_duration=DEFAULT_SEGMENT_DURATION, decimate=False,
+                        block_duration=DEFAULT_BLOCK_DURATION, cache=None, fft_workers=None):
+    """
+    Computes the band-limited STFT magnitude of a WAV file, or reads it from the cache.
+
+    On a cache hit the file is only read to hash it and the magnitude is memory-mapped from the cache,
+    so no STFT is computed.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - min_freq (float): Lower band edge in Hz (exclusive).
+    - max_freq (float): Upper band edge in Hz (exclusive).
+    - segment_duration (float): Duration of each STFT segment in seconds.
+    - decimate (bool): Decimate to the band before the STFT.
+    - block_duration (float): Length of the processing blocks in seconds.
+    - cache (SpectrogramCache): Cache to read from and fill (default is none).
+    - fft_workers (int): Threads for the FFT, see stft_band_magnitude.
+
+    Returns:
+    - tuple: (frequencies, times, magnitude, gain, sample_rate, n_samples), see band_magnitude_streaming.
+    """
+    if cache is not None:
+        key = cache.key(file_path, segment_duration, min_freq, max_freq, decimate)
+        entry = cache.get(key)
+        if entry is not None:
+            gain = entry['gain'] if entry['gain'].ndim else float(entry['gain'])
+            return (entry['frequencies'], entry['times'], entry['magnitude'], gain,
+                    int(entry['sample_rate']), int(entry['n_samples']))
+
+    blocks, sample_rate, n_samples, dc_offset = open_wav_blocks(file_path, block_duration)
+    frequencies, times, magnitude, gain = band_magnitude_streaming(
+        blocks, sample_rate, dc_offset, min_freq, max_freq, segment_duration, decimate, fft_workers
+    )
+    if cache is not None:
+        cache.put(key, magnitude, frequencies=frequencies, times=times, gain=gain,
+                  sample_rate=sample_rate, n_samples=n_samples)
+    return frequencies, times, magnitude, gain, sample_rate, n_samples
+
+
+def sweep_file(file_path, parameter_sets, segment_duration=DEFAULT_SEGMENT_DURATION, decimate=False,
+               block_duration=DEFAULT_BLOCK_DURATION, cache=None):
+    """
+    Runs a parameter sweep on a WAV file, computing its STFT only once.
+
+    The magnitude matrix covers the widest band of all parameter sets, and each set then only repeats
+    the threshold and merge steps. Without decimation every set gets exactly the events a separate
+    detect_events_in_file run would give; with decimation the factor is chosen for the widest band.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - parameter_sets (list): Dictionaries of detection parameters, see sweep_parameters.
+    - segment_duration (float): Duration of each STFT segment in seconds (shared by all sets).
+    - decimate (bool): Decimate to the widest band before the STFT.
+    - block_duration (float): Length of the processing blocks in seconds.
+    - cache (SpectrogramCache): Cache of band-limited STFT magnitudes to read from and fill (default is none).
+
+    Returns:
+    - tuple: (results, sample_rate, n_samples) where results holds the events of each parameter set.
+    """
+    min_freq = min(params.get('min_freq', DEFAULT_MIN_FREQ) for params in parameter_sets)
+    max_freq = max(params.get('max_freq', DEFAULT_MAX_FREQ) for params in parameter_sets)
+
+    frequencies, times, magnitude, gain, sample_rate, n_samples = file_band_magnitude(
+        file_path, min_freq, max_freq, segment_duration, decimate, block_duration, cache
+    )
+    return sweep_parameters(magnitude, frequencies, times, parameter_sets, gain), sample_rate, n_samples
+
+
+def _limit_worker_memory(memory_limit_mb):
+    """Caps the address space of a batch worker process (where the platform supports it)"""
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = int(memory_limit_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _detect_file_task(file_path, params, skip_silence=False):
+    """Runs detect_events_in_file in a batch worker, turning failures into a result the parent can log"""
+    envelope = BandEnvelope()
+    activity_gate = ActivityGate() if skip_silence else None
+    try:
+        events, sample_rate, n_samples, hits = detect_events_in_file(file_path, return_hits=True, envelope=envelope,
+                                                                     activity_gate=activity_gate, **params)
+        envelope.values  # Collapse to the compact envelope before it is sent back to the parent
+    except MemoryError:
+        return {'error': "Worker memory limit exceeded"}
+    except Exception as e:
+        return {'error': str(e)}
+    return {'events': events, 'sample_rate': sample_rate, 'n_samples': n_samples, 'hits': hits,
+            'envelope': envelope, 'activity_gate': activity_gate}
+
+
+def _detect_shard_task(file_path, start_frame, stop_frame, sample_rate, dc_offset, block_duration, params):
+    """Finds the impulse hits, envelope frames and activity counts of one time shard, see detect_events_sharded"""
+    envelope = BandEnvelope()
+    detector = StreamingDetector(sample_rate, dc_offset, keep_hits=True, envelope=envelope, start_frame=start_frame,
+                                 stop_frame=stop_frame, **params)
+    # The shard's own events are discarded: calls crossing its edges are only complete once the hits
+    # of every shard are merged together
+    spectrogram = detector.spectrogram
+    for block in iter_wav_range(file_path, spectrogram.input_start, spectrogram.input_stop, block_duration):
+        detector.process(block)
+    detector.flush()
+    return detector.hits, envelope, params.get('activity_gate')
+
+
+def detect_events_sharded(file_path, max_workers=None, shard_duration=DEFAULT_SHARD_DURATION,
+                          block_duration=DEFAULT_BLOCK_DURATION, memory_limit_mb=None, return_hits=False,
+                          envelope=None, **params):
+    """
+    Detects saw calls in one long WAV file by splitting it into time shards processed in parallel.
+
+    Each shard is a range of STFT frames. Its worker also reads the samples just outside the range that
+    its first and last frames (and the decimation filter) overlap, so every frame is computed exactly as
+    in a serial run. Workers return the impulse hits of their frames, and the hits of all shards are
+    merged once in time order, so calls crossing shard boundaries come out the same as with
+    detect_events_in_file.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - max_workers (int): Number of worker processes (default is the number of CPUs).
+    - shard_duration (float): Approximate length of each shard in seconds.
+    - block_duration (float): Length of the processing blocks in seconds.
+    - memory_limit_mb (float): Address space limit of each worker process in MB (default is no limit).
+    - return_hits (bool): Also return the impulse hits the events were merged from.
+    - envelope (BandEnvelope): Envelope to feed with the band rows of every frame (default is none).
+    - params: Detection parameters, see detect_events_streaming.
+
+    Returns:
+    - tuple: (events, sample_rate, n_samples), followed by the ImpulseHits when return_hits is set.
+    """
+    _, sample_rate, n_samples, dc_offset = open_wav_blocks(file_path, block_duration)
+    activity_gate = params.pop('activity_gate', None)
+    if activity_gate is not None:
+        # Every shard counts into its own copy, added up below
+        params['activity_gate'] = ActivityGate()
+
+    # Shards start at frames inside the signal, the last one runs to the end of the padded signal
+    nperseg, noverlap = stft_segment(sample_rate, params.get('segment_duration', DEFAULT_SEGMENT_DURATION))
+    signal_frames = n_samples // (nperseg - noverlap)
+    n_shards = max(1, min(round(n_samples / (shard_duration * sample_rate)), signal_frames))
+    starts = [shard * (signal_frames // n_shards) for shard in range(n_shards)]
+    stops = starts[1:] + [None]
+
+    task_args = (itertools.repeat(file_path), starts, stops, itertools.repeat(sample_rate),
+                 itertools.repeat(dc_offset), itertools.repeat(block_duration), itertools.repeat(params))
+    if n_shards == 1:
+        shards = list(map(_detect_shard_task, *task_args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, n_shards),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_limit_worker_memory, initargs=(memory_limit_mb,)) as executor:
+            shards = list(executor.map(_detect_shard_task, *task_args))
+
+    hits = ImpulseHits(np.concatenate([shard_hits.hits for shard_hits, _, _ in shards]), shards[0][0].frequencies)
+    for _, shard_envelope, shard_gate in shards:
+        if envelope is not None:
+            envelope.extend(shard_envelope)
+        if activity_gate is not None:
+            activity_gate.add(shard_gate)
+    events = hits.merge(params.get('time_threshold', DEFAULT_TIME_THRESHOLD),
+                        params.get('min_impulses', DEFAULT_MIN_IMPULSES))
+    if return_hits:
+        return events, sample_rate, n_samples, hits
+    return events, sample_rate, n_samples
+
+
+def detect_files_parallel(file_paths, max_workers=None, chunksize=1, memory_limit_mb=None, skip_silence=False,
+                          **params):
+    """
+    Detects saw calls in many WAV files at once with a pool of worker processes.
+
+    Workers only run the detection engine; they never touch the database. Each one sends back a small
+    result per file, and the parent stores it (see process_audio's detection_result).
+
+    Parameters:
+    - file_paths (list): Paths of the WAV files to process.
+    - max_workers (int): Number of worker processes (default is the number of CPUs).
+    - chunksize (int): Number of files handed to a worker at a time.
+    - memory_limit_mb (float): Address space limit of each worker process in MB (default is no limit).
+    - skip_silence (bool): Skip the STFT of silent frames, counting them in an ActivityGate per file.
+    - params: Detection parameters, see detect_events_in_file.
+
+    Yields:
+    - tuple: (file_path, result) in the order of file_paths, where result is either
+             {'events': events, 'sample_rate': sr, 'n_samples': n, 'hits': ImpulseHits,
+             'envelope': BandEnvelope, 'activity_gate': ActivityGate or None} or {'error': message}.
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+    max_workers = min(max_workers or os.cpu_count() or 1, len(file_paths))
+
+    # Spawned workers start from a clean interpreter instead of a copy of the web server's threads
+    # and database connections
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_limit_worker_memory, initargs=(memory_limit_mb,)) as executor:
+        results = executor.map(_detect_file_task, file_paths, itertools.repeat(params),
+                               itertools.repeat(skip_silence), chunksize=chunksize)
+        yield from zip(file_paths, results)
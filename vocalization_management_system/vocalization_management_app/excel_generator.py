@@ -165,3 +165,80 @@ def generate_excel_reports_for_processed_files():
             failed_count += 1
     
     return success_count, failed_count
+
+
+def generate_sweep_report(parameter_sets, file_results, excel_path):
+    """
+    Write an Excel report comparing the saw calls found with each set of detection parameters.
+
+    Parameters:
+    - parameter_sets: List of detection parameter dictionaries, see detection_engine.sweep_parameters
+    - file_results: List of (file name, events per parameter set) tuples
+    - excel_path: Path of the Excel file to write
+
+    Returns:
+    - str: Path to the generated Excel file
+    """
+    from .audio_processing import seconds_to_timestamp
+
+    summary = []
+    counts = []
+    calls = []
+    for setting, params in enumerate(parameter_sets, start=1):
+        setting_calls = 0
+        setting_impulses = 0
+        files_with_calls = 0
+        for file_name, results in file_results:
+            events = results[setting - 1]
+            impulses = int(events['impulse_count'].sum())
+            counts.append({
+                'Setting': setting,
+                'File Name': file_name,
+                'Saw Calls': len(events),
+                'Impulses': impulses
+            })
+            setting_calls += len(events)
+            setting_impulses += impulses
+            files_with_calls += 1 if len(events) else 0
+
+            for event in events:
+                calls.append({
+                    'Setting': setting,
+                    'File Name': file_name,
+                    'Start Time': seconds_to_timestamp(event['start_s']),
+                    'End Time': seconds_to_timestamp(event['end_s']),
+                    'Duration (s)': round(float(event['end_s'] - event['start_s']), 2),
+                    'Impulses': int(event['impulse_count']),
+                    'Frequency (Hz)': round(float(event['peak_freq']), 2),
+                    'Magnitude': round(float(event['peak_mag']), 2)
+                })
+
+        row = {'Setting': setting}
+        row.update(params)
+        row.update({
+            'Saw Calls': setting_calls,
+            'Impulses': setting_impulses,
+            'Files With Calls': files_with_calls
+        })
+        summary.append(row)
+
+    call_columns = ['Setting', 'File Name', 'Start Time', 'End Time', 'Duration (s)', 'Impulses',
+                    'Frequency (Hz)', 'Magnitude']
+    sheets = {
+        'Summary': pd.DataFrame(summary),
+        'Counts per File': pd.DataFrame(counts, columns=['Setting', 'File Name', 'Saw Calls', 'Impulses']),
+        'Saw Calls': pd.DataFrame(calls, columns=call_columns)
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(excel_path)), exist_ok=True)
+    with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+            worksheet = writer.sheets[sheet_name]
+
+            # Auto-adjust column widths
+            for col in worksheet.columns:
+                max_len = max(len(str(cell.value)) for cell in col if cell.value is not None) + 2
+                worksheet.column_dimensions[col[0].column_letter].width = max_len
+
+    return excel_path
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from .detection_engine import StreamingDetector, channel_view, load_wav
+from .wav_reader import decode_frames, read_wav_header
+
+# Default length of the blocks read from live sources, in seconds; detection latency grows with it
+DEFAULT_LIVE_BLOCK_DURATION = 0.1
+
+
+def detect_calls_live(blocks, sample_rate, dc_offset=0.0, **params):
+    """
+    Detects saw calls in a live feed, yielding each call as soon as it is final.
+
+    Parameters:
+    - blocks (iterable): Consecutive mono sample arrays as they arrive, e.g. from read_pcm_blocks,
+      follow_wav_file or replay_wav_realtime.
+    - sample_rate (int): Sample rate of the feed in Hz.
+    - dc_offset (float): DC offset of the recorder, subtracted from every block (default is 0).
+    - params: Detection parameters, see StreamingDetector.
+
+    Yields:
+    - numpy.void: One EVENT_DTYPE record per saw call, see StreamingDetector for when it is reported.
+    """
+    detector = StreamingDetector(sample_rate, dc_offset, **params)
+    for block in blocks:
+        yield from detector.process(block)
+    yield from detector.flush()
+
+
+async def adetect_calls_live(blocks, sample_rate, dc_offset=0.0, **params):
+    """
+    Async version of detect_calls_live for feeds read with asyncio (e.g. aread_pcm_blocks on a socket).
+
+    Blocks are short, so each one is processed inline on the event loop.
+
+    Parameters:
+    - blocks (async iterable): Consecutive mono sample arrays as they arrive.
+    - sample_rate (int): Sample rate of the feed in Hz.
+    - dc_offset (float): DC offset of the recorder, subtracted from every block (default is 0).
+    - params: Detection parameters, see StreamingDetector.
+
+    Yields:
+    - numpy.void: One EVENT_DTYPE record per saw call.
+    """
+    detector = StreamingDetector(sample_rate, dc_offset, **params)
+    async for block in blocks:
+        for call in detector.process(block):
+            yield call
+    for call in detector.flush():
+        yield call
+
+
+def _frames_to_block(data, dtype, channels, channel):
+    """Converts interleaved PCM bytes holding whole frames into one channel of samples"""
+    samples = np.frombuffer(data, dtype=dtype)
+    return channel_view(samples.reshape(-1, channels), channel) if channels > 1 else samples
+
+
+def read_pcm_blocks(stream, sample_rate, dtype='int16', channels=1, channel=0,
+                    block_duration=DEFAULT_LIVE_BLOCK_DURATION):
+    """
+    Reads raw interleaved PCM from a binary stream such as a pipe, sys.stdin.buffer or socket.makefile('rb').
+
+    Parameters:
+    - stream: Binary file-like object; read(n) blocks until n bytes arrive or the stream ends.
+    - sample_rate (int): Sample rate of the stream in Hz.
+    - dtype (str): Sample type of the stream (e.g. 'int16', 'int32', 'float32').
+    - channels (int): Number of interleaved channels.
+    - channel (int): Channel to detect on.
+    - block_duration (float): Length of each block in seconds.
+
+    Yields:
+    - numpy.ndarray: Consecutive blocks of the selected channel.
+    """
+    frame_size = np.dtype(dtype).itemsize * channels
+    block_size = max(1, int(block_duration * sample_rate)) * frame_size
+    pending = b''
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % frame_size
+        pending = data[usable:]
+        if usable:
+            yield _frames_to_block(data[:usable], dtype, channels, channel)
+
+
+async def aread_pcm_blocks(reader, sample_rate, dtype='int16', channels=1, channel=0,
+                           block_duration=DEFAULT_LIVE_BLOCK_DURATION):
+    """
+    Async version of read_pcm_blocks for an asyncio.StreamReader (e.g. from asyncio.open_connection).
+
+    Yields:
+    - numpy.ndarray: Consecutive blocks of the selected channel.
+    """
+    frame_size = np.dtype(dtype).itemsize * channels
+    block_size = max(1, int(block_duration * sample_rate)) * frame_size
+    while True:
+        try:
+            data = await reader.readexactly(block_size)
+        except asyncio.IncompleteReadError as e:
+            data = e.partial[:len(e.partial) - len(e.partial) % frame_size]
+            if data:
+                yield _frames_to_block(data, dtype, channels, channel)
+            break
+        yield _frames_to_block(data, dtype, channels, channel)
+
+
+def follow_wav_file(file_path, block_duration=DEFAULT_LIVE_BLOCK_DURATION, channel=0, poll_interval=0.5,
+                    idle_timeout=None):
+    """
+    Reads a WAV file that a recorder is still writing, like `tail -f`.
+
+    Parameters:
+    - file_path (str): Path to the growing WAV file.
+    - block_duration (float): Length of each block in seconds.
+    - channel (int): Channel to read from multi-channel files.
+    - poll_interval (float): Seconds to wait before checking for new samples again.
+    - idle_timeout (float): Stop after this many seconds without new samples (default is to follow forever).
+
+    Returns:
+    - tuple: (sample_rate, blocks) where blocks yields each new block of the selected channel as soon
+             as it is written.
+    """
+    wav_file = open(file_path, 'rb')
+    try:
+        wav_format = read_wav_header(wav_file)
+    except Exception:
+        wav_file.close()
+        raise
+    frame_size = wav_format['block_align']
+    block_size = max(1, int(block_duration * wav_format['sample_rate'])) * frame_size
+
+    def blocks():
+        with wav_file:
+            position = wav_format['data_offset']
+            idle_since = time.monotonic()
+            while True:
+                available = os.fstat(wav_file.fileno()).st_size - position
+                available -= available % frame_size
+                if available <= 0:
+                    if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                wav_file.seek(position)
+                data = wav_file.read(min(available, block_size))
+                position += len(data)
+                idle_since = time.monotonic()
+                yield channel_view(decode_frames(data, wav_format), channel)
+
+    return wav_format['sample_rate'], blocks()
+
+
+def replay_wav_realtime(file_path, block_duration=DEFAULT_LIVE_BLOCK_DURATION, speed=1.0, channel=0):
+    """
+    Replays a finished WAV file as if it were being recorded, for testing the live detection path.
+
+    Each block is released only once its last sample would have been recorded, so a consumer sees the
+    file at real-time speed (or speed times faster).
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+    - block_duration (float): Length of each block in seconds.
+    - speed (float): Replay speed relative to real time.
+    - channel (int): Channel to replay from multi-channel files.
+
+    Returns:
+    - tuple: (sample_rate, blocks) where blocks is a generator of consecutive sample arrays.
+    """
+    sample_rate, audio_data = load_wav(file_path)
+    signal = channel_view(audio_data, channel)
+    block_size = max(1, int(block_duration * sample_rate))
+
+    def blocks():
+        started = time.monotonic()
+        for start in range(0, len(signal), block_size):
+            block = signal[start:start + block_size]
+            release_at = started + (start + len(block)) / sample_rate / speed
+            delay = release_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield block
+
+    return sample_rate, blocks()
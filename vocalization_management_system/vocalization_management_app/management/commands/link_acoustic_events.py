@@ -0,0 +1,53 @@
+from collections import Counter
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...audio_processing import link_acoustic_events, parse_audio_filename
+from ...models import OriginalAudioFile
+
+
+class Command(BaseCommand):
+    help = ("Link saw calls detected by several recorders at the same time into acoustic events, so each call "
+            "is counted once per day.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Only link recordings made on this day (YYYY-MM-DD, from the filename)")
+        parser.add_argument('--animal-type', choices=[choice for choice, _ in OriginalAudioFile.ANIMAL_CHOICES],
+                            help="Only link recordings of this animal type")
+        parser.add_argument('--tolerance', type=float,
+                            help="Link detections less than this many seconds apart (default is "
+                                 "TRIANGULATION_MAX_LAG_SECONDS)")
+
+    def handle(self, *args, **options):
+        audio_files = OriginalAudioFile.objects.filter(database_entry__status='Processed')
+        if options['animal_type']:
+            audio_files = audio_files.filter(animal_type=options['animal_type'])
+        audio_files = list(audio_files.distinct().order_by('file_id'))
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date format. Expected YYYY-MM-DD.")
+            audio_files = [audio_file for audio_file in audio_files if self.recording_day(audio_file) == day]
+        if not audio_files:
+            raise CommandError("No processed audio files were found.")
+
+        events = link_acoustic_events(audio_files, tolerance=options['tolerance'])
+        events_per_day = Counter(event.start_time.date() for event in events)
+        detections_per_day = Counter()
+        for event in events:
+            detections_per_day[event.start_time.date()] += event.detection_count
+        for day in sorted(events_per_day):
+            self.stdout.write(f"{day}: {events_per_day[day]} acoustic events from {detections_per_day[day]} detections")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Linked {sum(detections_per_day.values())} detections into {len(events)} acoustic events"
+        ))
+
+    def recording_day(self, audio_file):
+        """Returns the day a recording was made according to its filename, or None if it cannot be parsed"""
+        try:
+            return parse_audio_filename(audio_file.audio_file_name)[1].date()
+        except ValueError:
+            return None
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...tasks import process_pending_audio_files_batch
+
+
+class Command(BaseCommand):
+    help = ("Process pending audio files in one batch, detecting saw calls in a pool of worker processes. The files "
+            "are claimed and leased like the background processor's, so both can run at the same time.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            help="Worker processes (default is AUDIO_PROCESSING_WORKERS)")
+        parser.add_argument('--chunksize', type=int,
+                            help="Files handed to a worker at a time (default is AUDIO_PROCESSING_CHUNKSIZE)")
+        parser.add_argument('--memory-limit', type=int,
+                            help="Address space limit of each worker in MB (default is AUDIO_PROCESSING_TASK_MEMORY_MB)")
+        parser.add_argument('--limit', type=int,
+                            help="Most files to process (default is every pending file)")
+
+    def handle(self, *args, **options):
+        for option in ('workers', 'chunksize', 'limit'):
+            if options[option] is not None and options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1.")
+
+        started = time.perf_counter()
+        processed_count, failed_count = process_pending_audio_files_batch(
+            max_workers=options['workers'], chunksize=options['chunksize'],
+            memory_limit_mb=options['memory_limit'], limit=options['limit']
+        )
+        elapsed = time.perf_counter() - started
+        if failed_count:
+            self.stdout.write(self.style.WARNING(
+                f"Failed to process {failed_count} audio files. Check logs for details."
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed_count} audio files ({elapsed:.1f}s)"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...audio_processing import remerge_saw_calls
+from ...detection_engine import DEFAULT_MIN_IMPULSES, DEFAULT_TIME_THRESHOLD
+from ...excel_generator import generate_excel_report_for_processed_file
+from ...models import OriginalAudioFile
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the detected saw calls of processed recordings with new merge parameters, "
+            "using the impulse hits stored when they were processed instead of the audio.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_ids', nargs='*', type=int,
+                            help="IDs of the audio files to re-merge (default is every file with stored hits)")
+        parser.add_argument('--animal-type', choices=[choice for choice, _ in OriginalAudioFile.ANIMAL_CHOICES],
+                            help="Only re-merge files of this animal type")
+        parser.add_argument('--time-threshold', type=float, default=DEFAULT_TIME_THRESHOLD,
+                            help="Time threshold in seconds for merging impulses into one saw call")
+        parser.add_argument('--min-impulses', type=int, default=DEFAULT_MIN_IMPULSES,
+                            help="Minimum number of impulses for a saw call to be kept")
+        parser.add_argument('--no-report', action='store_true',
+                            help="Do not regenerate the Excel reports of the re-merged files")
+
+    def handle(self, *args, **options):
+        audio_files = OriginalAudioFile.objects.filter(database_entry__status='Processed').exclude(impulse_hits='')
+        audio_files = audio_files.exclude(impulse_hits__isnull=True)
+        if options['file_ids']:
+            audio_files = audio_files.filter(file_id__in=options['file_ids'])
+        if options['animal_type']:
+            audio_files = audio_files.filter(animal_type=options['animal_type'])
+        audio_files = list(audio_files.distinct().order_by('file_id'))
+        if not audio_files:
+            raise CommandError("No processed audio files with stored impulse hits were found.")
+
+        for audio_file in audio_files:
+            started = time.perf_counter()
+            saw_calls = remerge_saw_calls(audio_file, options['time_threshold'], options['min_impulses'])
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if not options['no_report']:
+                generate_excel_report_for_processed_file(audio_file.file_id)
+            self.stdout.write(f"{audio_file.audio_file_name}: {saw_calls} saw calls ({elapsed_ms:.1f} ms)")
+
+        self.stdout.write(self.style.SUCCESS(f"Re-merged {len(audio_files)} audio files"))
@@ -0,0 +1,52 @@
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import tasks
+
+
+class Command(BaseCommand):
+    help = ("Run the background audio processor as a dedicated worker process. Any number of these can share one "
+            "queue, on one machine or several. SIGTERM or Ctrl+C drains it: the files in progress are finished and "
+            "nothing new is claimed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            help="Worker threads (default is AUDIO_PROCESSOR_CONCURRENCY)")
+        parser.add_argument('--poll-interval', type=float, default=tasks.processing_interval,
+                            help="Seconds between checks for new uploads while the queue is empty")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] is not None and options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if options['poll_interval'] <= 0:
+            raise CommandError("--poll-interval must be positive.")
+
+        # Uploads in the web server cannot wake a separate process, so idle workers poll instead
+        tasks.processing_interval = options['poll_interval']
+        draining = threading.Event()
+
+        def drain(signum, frame):
+            if draining.is_set():
+                raise KeyboardInterrupt  # A second signal stops without waiting; the leases re-queue the files
+            self.stdout.write(f"Received {signal.Signals(signum).name}, finishing the files in progress...")
+            draining.set()
+
+        previous_handlers = {signum: signal.signal(signum, drain) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if not tasks.start_background_processor(options['concurrency']):
+                raise CommandError("The background processor is already running in this process.")
+            self.stdout.write(f"Processor running with {tasks.get_processor_workers()} workers (pid {os.getpid()})")
+
+            while not draining.wait(1.0):
+                if not tasks.get_processor_workers():
+                    raise CommandError("Every worker thread exited unexpectedly.")
+
+            tasks.stop_background_processor(timeout=None)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write(self.style.SUCCESS("Processor stopped"))
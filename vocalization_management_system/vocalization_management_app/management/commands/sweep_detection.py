@@ -0,0 +1,96 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from ...audio_processing import get_spectrogram_cache
+from ...detection_engine import (
+    DEFAULT_MAX_FREQ, DEFAULT_MAX_MAG, DEFAULT_MIN_FREQ, DEFAULT_MIN_IMPULSES, DEFAULT_MIN_MAG, DEFAULT_NOISE_FLOOR,
+    DEFAULT_NOISE_GATE, DEFAULT_SEGMENT_DURATION, DEFAULT_TIME_THRESHOLD, parameter_grid, sweep_file
+)
+from ...excel_generator import generate_sweep_report
+from ...models import OriginalAudioFile
+
+
+class Command(BaseCommand):
+    help = ("Compare saw call detection parameters on uploaded recordings. Each file's STFT is computed once "
+            "and every combination of the given parameter values is evaluated against it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_ids', nargs='*', type=int, help="IDs of the uploaded audio files to sweep")
+        parser.add_argument('--animal-type', choices=[choice for choice, _ in OriginalAudioFile.ANIMAL_CHOICES],
+                            help="Sweep every uploaded file of this animal type")
+        parser.add_argument('--path', action='append', default=[], dest='paths',
+                            help="WAV file outside the database to include (can be repeated)")
+
+        parser.add_argument('--min-mag', nargs='+', type=float, default=[DEFAULT_MIN_MAG])
+        parser.add_argument('--max-mag', nargs='+', type=float, default=[DEFAULT_MAX_MAG])
+        parser.add_argument('--min-freq', nargs='+', type=float, default=[DEFAULT_MIN_FREQ])
+        parser.add_argument('--max-freq', nargs='+', type=float, default=[DEFAULT_MAX_FREQ])
+        parser.add_argument('--time-threshold', nargs='+', type=float, default=[DEFAULT_TIME_THRESHOLD])
+        parser.add_argument('--min-impulses', nargs='+', type=int, default=[DEFAULT_MIN_IMPULSES])
+        parser.add_argument('--noise-gate', nargs='+', type=float, default=[DEFAULT_NOISE_GATE],
+                            help="Spectral gate thresholds to compare (0 for no gating)")
+        parser.add_argument('--noise-floor', nargs='+', type=float, default=[DEFAULT_NOISE_FLOOR],
+                            help="Adaptive minimums to compare, as multiples of each bin's noise floor "
+                                 "(0 for the fixed --min-mag window)")
+        parser.add_argument('--segment-duration', type=float, default=DEFAULT_SEGMENT_DURATION,
+                            help="STFT segment duration in seconds, shared by every setting")
+        parser.add_argument('--decimate', action='store_true',
+                            help="Decimate to the widest swept band before the STFT")
+
+        parser.add_argument('--output', help="Excel report path (default is MEDIA_ROOT/sweep_reports/)")
+
+    def handle(self, *args, **options):
+        files = [(audio_file.audio_file_name, audio_file.audio_file.path)
+                 for audio_file in self.get_audio_files(options)]
+        files += [(os.path.basename(path), path) for path in options['paths']]
+        if not files:
+            raise CommandError("No audio files to sweep. Give file IDs, --animal-type or --path.")
+
+        parameter_sets = parameter_grid(
+            min_mag=options['min_mag'],
+            max_mag=options['max_mag'],
+            min_freq=options['min_freq'],
+            max_freq=options['max_freq'],
+            time_threshold=options['time_threshold'],
+            min_impulses=options['min_impulses'],
+            noise_gate=options['noise_gate'],
+            noise_floor=options['noise_floor']
+        )
+        self.stdout.write(f"Sweeping {len(parameter_sets)} settings over {len(files)} files")
+
+        cache = get_spectrogram_cache()
+        file_results = []
+        for file_name, file_path in files:
+            try:
+                results, sample_rate, n_samples = sweep_file(
+                    file_path, parameter_sets,
+                    segment_duration=options['segment_duration'], decimate=options['decimate'], cache=cache
+                )
+            except Exception as e:
+                self.stderr.write(f"Skipping {file_name}: {str(e)}")
+                continue
+            file_results.append((file_name, results))
+            counts = ', '.join(str(len(events)) for events in results)
+            self.stdout.write(f"{file_name} ({n_samples / sample_rate:.1f}s): {counts}")
+
+        output = options['output']
+        if not output:
+            timestamp = now().strftime('%Y%m%d_%H%M%S')
+            output = os.path.join(settings.MEDIA_ROOT, 'sweep_reports', f"detection_sweep_{timestamp}.xlsx")
+        generate_sweep_report(parameter_sets, file_results, output)
+        self.stdout.write(self.style.SUCCESS(f"Sweep report written to {output}"))
+
+    def get_audio_files(self, options):
+        """Returns the uploaded audio files selected by ID and/or animal type"""
+        audio_files = OriginalAudioFile.objects.none()
+        if options['file_ids']:
+            audio_files = OriginalAudioFile.objects.filter(file_id__in=options['file_ids'])
+            missing = set(options['file_ids']) - set(audio_files.values_list('file_id', flat=True))
+            if missing:
+                raise CommandError(f"Unknown audio file IDs: {', '.join(map(str, sorted(missing)))}")
+        if options['animal_type']:
+            audio_files = audio_files | OriginalAudioFile.objects.filter(animal_type=options['animal_type'])
+        return audio_files.order_by('file_id')
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...audio_processing import triangulate_saw_calls
+from ...models import OriginalAudioFile
+
+
+class Command(BaseCommand):
+    help = ("Find the time difference of arrival of detected saw calls between recorders that ran at the same "
+            "time, grouping processed recordings by the device and timestamp in their filenames.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_ids', nargs='*', type=int,
+                            help="IDs of the audio files to triangulate (default is every processed file)")
+        parser.add_argument('--animal-type', choices=[choice for choice, _ in OriginalAudioFile.ANIMAL_CHOICES],
+                            help="Only triangulate files of this animal type")
+        parser.add_argument('--max-lag', type=float,
+                            help="Largest time difference searched in seconds (default is "
+                                 "TRIANGULATION_MAX_LAG_SECONDS)")
+
+    def handle(self, *args, **options):
+        audio_files = OriginalAudioFile.objects.filter(database_entry__status='Processed')
+        if options['file_ids']:
+            audio_files = audio_files.filter(file_id__in=options['file_ids'])
+        if options['animal_type']:
+            audio_files = audio_files.filter(animal_type=options['animal_type'])
+        audio_files = list(audio_files.distinct().order_by('file_id'))
+        if not audio_files:
+            raise CommandError("No processed audio files were found.")
+
+        started = time.perf_counter()
+        results = triangulate_saw_calls(audio_files, max_lag=options['max_lag'])
+        for audio_file, other_file, count in results:
+            self.stdout.write(f"{audio_file.audio_file_name} -> {other_file.audio_file_name}: {count} saw calls")
+
+        if not results:
+            self.stdout.write("No simultaneous recordings from different devices were found")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Triangulated {sum(count for _, _, count in results)} saw calls across {len(results)} recording pairs "
+            f"({elapsed:.1f}s)"
+        ))
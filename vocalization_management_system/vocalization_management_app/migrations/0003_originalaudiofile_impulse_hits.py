@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vocalization_management_app', '0002_alter_originalaudiofile_duration_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='originalaudiofile',
+            name='impulse_hits',
+            field=models.FileField(blank=True, null=True, upload_to='impulse_hits/'),
+        ),
+    ]
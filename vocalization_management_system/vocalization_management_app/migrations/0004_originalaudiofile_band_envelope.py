@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vocalization_management_app', '0003_originalaudiofile_impulse_hits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='originalaudiofile',
+            name='band_envelope',
+            field=models.FileField(blank=True, null=True, upload_to='band_envelopes/'),
+        ),
+    ]
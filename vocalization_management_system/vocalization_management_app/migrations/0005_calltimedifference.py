@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vocalization_management_app', '0004_originalaudiofile_band_envelope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallTimeDifference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.CharField(max_length=20)),
+                ('other_device', models.CharField(max_length=20)),
+                ('tdoa_seconds', models.FloatField()),
+                ('correlation', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_differences', to='vocalization_management_app.detectednoiseaudiofile')),
+                ('other_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='call_time_differences', to='vocalization_management_app.originalaudiofile')),
+            ],
+        ),
+    ]
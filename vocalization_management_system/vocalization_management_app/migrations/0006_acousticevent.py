@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vocalization_management_app', '0005_calltimedifference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcousticEvent',
+            fields=[
+                ('event_id', models.AutoField(primary_key=True, serialize=False)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('device_count', models.IntegerField()),
+                ('detection_count', models.IntegerField()),
+                ('frequency', models.FloatField(blank=True, null=True)),
+                ('magnitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='detectednoiseaudiofile',
+            name='acoustic_event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='detections', to='vocalization_management_app.acousticevent'),
+        ),
+    ]
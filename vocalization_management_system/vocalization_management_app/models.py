@@ -95,6 +95,8 @@ class OriginalAudioFile(models.Model):
     upload_date = models.DateTimeField(default=now)
     uploaded_by = models.ForeignKey(AdminProfile, on_delete=models.CASCADE, related_name="uploaded_audio", blank=True, null=True)
     analysis_excel = models.FileField(upload_to='analysis_excel/', null=True, blank=True)
+    impulse_hits = models.FileField(upload_to='impulse_hits/', null=True, blank=True)  # Frame-level hits for re-merging
+    band_envelope = models.FileField(upload_to='band_envelopes/', null=True, blank=True)  # 10 Hz saw-call band energy
     duration_seconds = models.FloatField(blank=True, null=True, default=0.0)
     duration = models.CharField(max_length=20, blank=True, null=True)
     sample_rate = models.IntegerField(blank=True, null=True)
@@ -123,6 +125,21 @@ class ProcessedAudioFile(models.Model):
         return f"Processed: {self.audio_file_name}"
 
 
+# One call as heard by every recorder that detected it, linking its detections across devices
+class AcousticEvent(models.Model):
+    event_id = models.AutoField(primary_key=True)
+    start_time = models.DateTimeField()  # Earliest start of its detections
+    end_time = models.DateTimeField()  # Latest end of its detections
+    device_count = models.IntegerField()
+    detection_count = models.IntegerField()
+    frequency = models.FloatField(blank=True, null=True)  # Frequency of the loudest detection in Hz
+    magnitude = models.FloatField(blank=True, null=True)  # Magnitude of the loudest detection
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Acoustic Event {self.start_time:%Y-%m-%d %H:%M:%S} ({self.device_count} devices)"
+
+
 # Detected Noise in Audio Files
 class DetectedNoiseAudioFile(models.Model):
     detected_noise_file_id = models.AutoField(primary_key=True)
@@ -136,6 +153,8 @@ class DetectedNoiseAudioFile(models.Model):
     upload_date = models.DateTimeField(default=now)
     frequency = models.FloatField(blank=True, null=True)  # Frequency in Hz
     magnitude = models.FloatField(blank=True, null=True)  # Magnitude of the detected call
+    acoustic_event = models.ForeignKey(AcousticEvent, on_delete=models.SET_NULL, related_name="detections",
+                                       blank=True, null=True)  # The same call detected by other recorders
 
     # Automatically determine if the noise should be verified
     def save(self, *args, **kwargs):
@@ -146,6 +165,20 @@ class DetectedNoiseAudioFile(models.Model):
         return f"Detected Noise: {self.detected_noise_file_path}"
 
 
+# Time difference of arrival of a detected saw call at another recorder running at the same time
+class CallTimeDifference(models.Model):
+    detection = models.ForeignKey(DetectedNoiseAudioFile, on_delete=models.CASCADE, related_name="time_differences")
+    other_file = models.ForeignKey(OriginalAudioFile, on_delete=models.CASCADE, related_name="call_time_differences")
+    device = models.CharField(max_length=20)  # Device of the detection, e.g. SMM07257
+    other_device = models.CharField(max_length=20)
+    tdoa_seconds = models.FloatField()  # Delay at the other device; positive when the call reached this one first
+    correlation = models.FloatField()  # Peak of the normalised cross-correlation
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"TDOA {self.device}-{self.other_device}: {self.tdoa_seconds * 1000:.1f} ms"
+
+
 # Spectrogram Table
 class Spectrogram(models.Model):
     audio_file = models.ForeignKey(OriginalAudioFile, on_delete=models.CASCADE, related_name='spectrograms')
@@ -219,6 +252,12 @@ class Database(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processing_start_time = models.DateTimeField(null=True, blank=True)
     processing_end_time = models.DateTimeField(null=True, blank=True)
+    # Lease of the worker processing the file, renewed by its heartbeat; an expired lease means the worker died
+    # and the file goes back to the queue (see tasks.requeue_expired_jobs)
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Database entry for {self.audio_file.audio_file_name}"
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import argparse
+
+# Add the project root to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vocalization_management_system.settings')
+
+import django
+django.setup()
+
+# Now we can import from the app
+from vocalization_management_app.audio_processing import seconds_to_timestamp
+from vocalization_management_app.detection_engine import DEFAULT_TIME_THRESHOLD
+from vocalization_management_app.live_detection import detect_calls_live, replay_wav_realtime
+
+
+def main():
+    """Replay a WAV file at real-time speed through the live detector and report each call's latency"""
+    parser = argparse.ArgumentParser(description="Replay a recording through the live saw call detector")
+    parser.add_argument('wav_file', help="WAV file to replay")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed relative to real time")
+    parser.add_argument('--block-duration', type=float, default=0.1, help="Length of each replayed block in seconds")
+    parser.add_argument('--time-threshold', type=float, default=DEFAULT_TIME_THRESHOLD,
+                        help="Time threshold in seconds for merging impulses into one call")
+    args = parser.parse_args()
+
+    sample_rate, blocks = replay_wav_realtime(args.wav_file, block_duration=args.block_duration, speed=args.speed)
+    print(f"\n===== Live replay of {os.path.basename(args.wav_file)} at {args.speed:g}x =====\n")
+
+    started = time.monotonic()
+    latencies = []
+    for call in detect_calls_live(blocks, sample_rate, time_threshold=args.time_threshold):
+        # Recording time that had elapsed when the call was reported, minus the call's last impulse
+        latency = (time.monotonic() - started) * args.speed - call['end_s']
+        latencies.append(latency)
+        print(f"{seconds_to_timestamp(call['start_s'])} - {seconds_to_timestamp(call['end_s'])}  "
+              f"{int(call['impulse_count']):3d} impulses  {call['peak_freq']:7.2f}Hz  "
+              f"reported {latency:5.2f}s after the last impulse")
+
+    print(f"\n{len(latencies)} calls detected")
+    if latencies:
+        print(f"Latency after the last impulse: max {max(latencies):.2f}s "
+              f"(time threshold {args.time_threshold:g}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# Bytes read at a time while hashing audio files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """
+    Hashes the contents of a file, so renamed or re-uploaded copies of a recording share cache entries.
+
+    Parameters:
+    - file_path (str): Path to the file.
+
+    Returns:
+    - str: SHA-256 hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SpectrogramCache:
+    """
+    Content-addressed disk cache of band-limited STFT magnitudes.
+
+    Each entry is a magnitude matrix saved as a .npy file, which is memory-mapped when read, and a small
+    .npz file with its frequencies, frame times and other metadata. Reading an entry marks it as recently
+    used; when the cache grows past max_bytes the least recently used entries are deleted.
+
+    Entries are written to temporary files and renamed into place, so several processes can share one
+    cache directory.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, file_path, segment_duration, min_freq, max_freq, decimate=False):
+        """
+        Builds the cache key of a file's band-limited STFT.
+
+        Parameters:
+        - file_path (str): Path to the audio file.
+        - segment_duration (float): Duration of each STFT segment in seconds.
+        - min_freq (float): Lower band edge in Hz.
+        - max_freq (float): Upper band edge in Hz.
+        - decimate (bool): Whether the signal is decimated before the STFT.
+
+        Returns:
+        - str: The file digest followed by the STFT settings.
+        """
+        settings = f"{float(segment_duration)}_{float(min_freq)}_{float(max_freq)}_{int(bool(decimate))}"
+        return f"{file_digest(file_path)}_{settings}"
+
+    def get(self, key):
+        """
+        Reads a cache entry.
+
+        Parameters:
+        - key (str): Cache key, see key().
+
+        Returns:
+        - dict: The metadata arrays stored with the entry plus 'magnitude' (a read-only memory map),
+                or None if the entry is not cached.
+        """
+        magnitude_path, metadata_path = self._paths(key)
+        try:
+            with np.load(metadata_path) as metadata:
+                entry = {name: metadata[name] for name in metadata.files}
+            entry['magnitude'] = np.load(magnitude_path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # The modification time records the last use, which is what eviction orders by
+        for path in (magnitude_path, metadata_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return entry
+
+    def put(self, key, magnitude, **metadata):
+        """
+        Stores a cache entry and evicts old entries if the cache is over budget.
+
+        Parameters:
+        - key (str): Cache key, see key().
+        - magnitude (numpy.ndarray): Magnitude matrix to store.
+        - metadata: Small arrays or scalars to store with the matrix.
+
+        Returns:
+        - bool: Whether the entry was stored (entries larger than the whole budget are not).
+        """
+        magnitude = np.ascontiguousarray(magnitude)
+        if self.max_bytes is not None and magnitude.nbytes > self.max_bytes:
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        magnitude_path, metadata_path = self._paths(key)
+        self._write_atomic(metadata_path, lambda f: np.savez(f, **metadata))
+        self._write_atomic(magnitude_path, lambda f: np.save(f, magnitude))
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+        - int: Number of entries deleted.
+        """
+        if self.max_bytes is None:
+            return 0
+
+        entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            key, extension = os.path.splitext(name)
+            if extension not in ('.npy', '.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            size, last_used = entries.get(key, (0, 0.0))
+            entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        evicted = 0
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+        return evicted
+
+    def _paths(self, key):
+        return os.path.join(self.directory, f"{key}.npy"), os.path.join(self.directory, f"{key}.npz")
+
+    def _write_atomic(self, path, write):
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -2,7 +2,8 @@ from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .models import OriginalAudioFile, Database, ProcessingLog, StaffProfile, Spectrogram, DetectedNoiseAudioFile
-from .audio_processing import process_pending_audio_files, get_processing_status
+from .audio_processing import get_processing_status
+from .tasks import notify_new_uploads
 import os
 
 @login_required
@@ -43,6 +44,7 @@ def staff_home(request):
         'processed_files': status_data['processed'],
         'failed_files': status_data['failed'],
         'processor_status': status_data['processor_status'],
+        'processor_workers': status_data['processor_workers'],
         'recent_logs': recent_logs,
         'pending_files_details': pending_files_details,
         'processing_files_details': processing_files_details,
@@ -68,17 +70,11 @@ def process_audio_files(request):
         return redirect('staff_home')
     
     try:
-        # Process all pending audio files
-        processed_count, failed_count = process_pending_audio_files()
-        
-        if processed_count > 0:
-            messages.success(request, f"Successfully processed {processed_count} audio files.")
-        
-        if failed_count > 0:
-            messages.warning(request, f"Failed to process {failed_count} audio files. Check logs for details.")
-            
+        # Hand the pending files to the background processor, which owns all processing; the request returns at once
+        notify_new_uploads()
+        messages.success(request, f"{pending_count} pending audio files were handed to the background processor.")
     except Exception as e:
-        messages.error(request, f"Error during batch processing: {str(e)}")
+        messages.error(request, f"Error starting the background processor: {str(e)}")
     
     return redirect('staff_home')
 
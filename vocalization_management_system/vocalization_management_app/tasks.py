@@ -1,20 +1,30 @@
-import time
 import threading
 import logging
 import os
+import socket
+from collections import deque
+from datetime import timedelta
+from itertools import count
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import connections, transaction
+from django.db.models import F
 from .models import Database, ProcessingLog, OriginalAudioFile
-from .audio_processing import process_audio
+from .audio_processing import get_detection_params, get_shard_duration, get_spectrogram_cache, process_audio
+from .detection_engine import detect_files_parallel
 from .excel_generator import generate_excel_report_for_processed_file
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Global variables to control the background processor
-processor_running = False
-processor_thread = None
-processing_interval = 10  # seconds between checking for new files
+processor = None
+processor_lock = threading.Lock()
+processor_numbers = count(1)
+# Uploads notify the idle workers through this condition; the counter tells a worker whether it missed a notification
+processor_condition = threading.Condition()
+processor_notifications = 0
+processing_interval = 10  # seconds between checking for files added by other processes once the queue is empty
 
 
 def get_pending_audio_files():
@@ -25,19 +35,36 @@ def get_pending_audio_files():
     return OriginalAudioFile.objects.filter(database_entry__status='Pending')
 
 
-def mark_file_as_processing(audio_file):
+def get_lease_duration():
     """
-    Mark a file as currently being processed
+    Get how long a claimed file stays leased to its worker without a heartbeat (AUDIO_PROCESSING_LEASE_SECONDS)
+    """
+    return timedelta(seconds=getattr(settings, 'AUDIO_PROCESSING_LEASE_SECONDS', 300))
+
+
+def get_worker_id():
+    """
+    Get an ID for the calling thread that is unique across every process and host sharing the database
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def mark_file_as_processing(audio_file, worker_id=None):
+    """
+    Mark a file as currently being processed and lease it to the calling worker
+    The status is changed by a single conditional update, so of several workers claiming the same file only one succeeds
+    The lease expires unless the worker's LeaseHeartbeat keeps renewing it
     """
     with transaction.atomic():
-        db_entry = Database.objects.select_for_update().get(audio_file=audio_file)
-        if db_entry.status != 'Pending':
+        started = timezone.now()
+        claimed = Database.objects.filter(audio_file=audio_file, status='Pending').update(
+            status='Processing', processing_start_time=started, attempts=F('attempts') + 1,
+            lease_owner=worker_id or get_worker_id(), heartbeat_at=started,
+            lease_expires_at=started + get_lease_duration()
+        )
+        if not claimed:
             return False  # File is no longer pending, skip it
         
-        db_entry.status = 'Processing'
-        db_entry.processing_start_time = timezone.now()
-        db_entry.save()
-        
         # Log the start of processing
         ProcessingLog.objects.create(
             audio_file=audio_file,
@@ -47,19 +74,212 @@ def mark_file_as_processing(audio_file):
         return True
 
 
-def process_single_file(audio_file):
+def renew_leases(worker_id):
+    """
+    Extend the leases of every file the worker is processing
+    Returns the number of renewed leases
+    """
+    renewed = timezone.now()
+    return Database.objects.filter(lease_owner=worker_id, status='Processing').update(
+        heartbeat_at=renewed, lease_expires_at=renewed + get_lease_duration()
+    )
+
+
+def requeue_expired_jobs():
+    """
+    Hand files whose lease expired back to the queue, e.g. after the server restarted or a worker was killed
+    A file is re-queued until it was attempted AUDIO_PROCESSING_MAX_ATTEMPTS times, and then marked as failed
+    Files processed without a lease (process_audio called directly) are left alone, however long they take
+    Returns the number of files re-queued or failed
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, 'AUDIO_PROCESSING_MAX_ATTEMPTS', 3)
+    expired = Database.objects.filter(status='Processing', lease_expires_at__lt=now).select_related('audio_file')
+    
+    recovered = 0
+    for db_entry in expired:
+        failed = db_entry.attempts >= max_attempts
+        # Only if the lease is still the expired one, so a late heartbeat or another worker's recovery wins
+        updated = Database.objects.filter(
+            pk=db_entry.pk, status='Processing', lease_expires_at=db_entry.lease_expires_at
+        ).update(
+            status='Failed' if failed else 'Pending', lease_owner='', lease_expires_at=None,
+            processing_end_time=now if failed else None
+        )
+        if not updated:
+            continue
+        
+        recovered += 1
+        owner = db_entry.lease_owner or 'unknown worker'
+        if failed:
+            message = f"Lease of {owner} expired; giving up after {db_entry.attempts} attempts"
+        else:
+            message = f"Lease of {owner} expired during attempt {db_entry.attempts}; file re-queued"
+        ProcessingLog.objects.create(
+            audio_file=db_entry.audio_file,
+            message=message,
+            level="ERROR" if failed else "WARNING"
+        )
+        logger.warning(f"{db_entry.audio_file.audio_file_name}: {message}")
+    
+    return recovered
+
+
+class LeaseHeartbeat:
+    """
+    Renews the leases of the files a worker has claimed, from a thread of its own, for as long as the worker runs
+    A worker that crashes or is killed stops renewing, so its leases expire and its files are re-queued
+    """
+    
+    def __init__(self, worker_id, interval=None):
+        self.worker_id = worker_id
+        # Renew well before the lease runs out, so one slow renewal does not lose it
+        self.interval = interval or get_lease_duration().total_seconds() / 3
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, name=f"{threading.current_thread().name}-heartbeat",
+                                       daemon=True)
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+    
+    def run(self):
+        try:
+            while not self.stop_event.wait(self.interval):
+                try:
+                    renew_leases(self.worker_id)
+                except Exception as e:
+                    logger.error(f"Failed to renew the leases of {self.worker_id}: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def claim_pending_files(limit=None, worker_id=None):
+    """
+    Claim up to limit of the longest waiting pending files in one transaction, after re-queueing files of workers
+    that died
+    The files are leased to worker_id like mark_file_as_processing does, but with a fixed number of queries for the
+    whole batch instead of several per file
+    Returns the claimed OriginalAudioFile objects, oldest first
+    """
+    requeue_expired_jobs()
+    worker_id = worker_id or get_worker_id()
+    while True:
+        with transaction.atomic():
+            # Rows locked by a worker in another process or on another machine are skipped instead of waited for
+            pending = list(Database.objects.select_for_update(skip_locked=True).filter(
+                status='Pending'
+            ).order_by('uploaded_at', 'pk').values_list('pk', flat=True)[:limit])
+            if not pending:
+                return []
+            
+            started = timezone.now()
+            Database.objects.filter(pk__in=pending, status='Pending').update(
+                status='Processing', processing_start_time=started, attempts=F('attempts') + 1,
+                lease_owner=worker_id, heartbeat_at=started, lease_expires_at=started + get_lease_duration()
+            )
+            # Databases without row locks (SQLite) ignore select_for_update; rows another worker claimed in between
+            # kept their own claim and are told apart by the claim time
+            claimed = list(Database.objects.filter(
+                pk__in=pending, status='Processing', lease_owner=worker_id, processing_start_time=started
+            ).select_related('audio_file').order_by('uploaded_at', 'pk'))
+            
+            # Log the start of processing
+            ProcessingLog.objects.bulk_create([
+                ProcessingLog(
+                    audio_file=db_entry.audio_file,
+                    message=f"Started processing file: {db_entry.audio_file.audio_file_name}",
+                    level="INFO"
+                )
+                for db_entry in claimed
+            ])
+        if claimed:
+            return [db_entry.audio_file for db_entry in claimed]
+        # Other workers claimed every one of them first, try the next ones
+
+
+def claim_next_pending_file(worker_id=None):
+    """
+    Claim the longest waiting pending file for the calling worker
+    Returns the claimed OriginalAudioFile, or None if no file is pending
+    """
+    claimed = claim_pending_files(1, worker_id)
+    return claimed[0] if claimed else None
+
+
+def release_claimed_files(audio_files, worker_id,
+                          message="Processor stopped before the file was started; file returned to the queue"):
+    """
+    Put files a worker claimed but never started back in the queue, without counting the attempt
+    Returns the number of released files
+    """
+    with transaction.atomic():
+        released = list(Database.objects.filter(
+            audio_file__in=audio_files, status='Processing', lease_owner=worker_id
+        ).select_related('audio_file'))
+        Database.objects.filter(pk__in=[db_entry.pk for db_entry in released]).update(
+            status='Pending', attempts=F('attempts') - 1, processing_start_time=None, lease_owner='',
+            lease_expires_at=None
+        )
+        ProcessingLog.objects.bulk_create([
+            ProcessingLog(
+                audio_file=db_entry.audio_file,
+                message=message,
+                level="INFO"
+            )
+            for db_entry in released
+        ])
+    return len(released)
+
+
+def get_processor_prefetch():
+    """
+    Get how many files the background processor claims beyond its free workers (AUDIO_PROCESSOR_PREFETCH)
+    """
+    return max(0, getattr(settings, 'AUDIO_PROCESSOR_PREFETCH', 0))
+
+
+def get_processor_concurrency():
+    """
+    Get the number of worker threads the background processor runs (AUDIO_PROCESSOR_CONCURRENCY, None for one per CPU)
+    """
+    concurrency = getattr(settings, 'AUDIO_PROCESSOR_CONCURRENCY', 1)
+    return max(1, concurrency or os.cpu_count() or 1)
+
+
+def process_single_file(audio_file, detection_result=None):
     """
     Process a single audio file and update its status
     Returns True if processing was successful, False otherwise
     """
     try:
         # Mark the file as processing
-        if not mark_file_as_processing(audio_file):
+        worker_id = get_worker_id()
+        if not mark_file_as_processing(audio_file, worker_id):
             return False  # File was already being processed or is not pending
         
+        with LeaseHeartbeat(worker_id):
+            return complete_file_processing(audio_file, detection_result)
+    except Exception as e:
+        return handle_processing_error(audio_file, e)
+
+
+def complete_file_processing(audio_file, detection_result=None, concurrency=1):
+    """
+    Process a file already marked as processing and generate its Excel report
+    detection_result holds the output of detect_files_parallel when detection ran in a worker process
+    concurrency is the number of files processed alongside it, which share the CPUs
+    Returns True if processing was successful, False otherwise
+    """
+    try:
         # Process the audio file
         file_path = audio_file.audio_file.path
-        success = process_audio(file_path, audio_file)
+        success = process_audio(file_path, audio_file, detection_result=detection_result, concurrency=concurrency)
         
         if success:
             # Generate Excel report after successful processing
@@ -80,141 +300,311 @@ def process_single_file(audio_file):
         
         return success
     except Exception as e:
-        # Log the error
-        ProcessingLog.objects.create(
-            audio_file=audio_file,
-            message=f"Unexpected error during processing: {str(e)}",
-            level="ERROR"
-        )
-        
-        # Update database entry to Failed status
-        try:
-            db_entry = Database.objects.get(audio_file=audio_file)
-            db_entry.status = 'Failed'
-            db_entry.processing_end_time = timezone.now()
-            db_entry.save()
-        except Exception:
-            pass
-        
-        return False
+        return handle_processing_error(audio_file, e)
 
 
-def process_pending_files_continuously():
+def handle_processing_error(audio_file, error):
     """
-    Continuously process pending audio files one by one
-    This function runs in a separate thread
+    Log an unexpected processing error and mark the file as failed
+    Always returns False
     """
-    global processor_running
+    # Log the error
+    ProcessingLog.objects.create(
+        audio_file=audio_file,
+        message=f"Unexpected error during processing: {str(error)}",
+        level="ERROR"
+    )
     
-    logger.info("Background audio processor started")
+    # Update database entry to Failed status
+    try:
+        db_entry = Database.objects.get(audio_file=audio_file)
+        db_entry.status = 'Failed'
+        db_entry.processing_end_time = timezone.now()
+        db_entry.save(update_fields=['status', 'processing_end_time'])
+    except Exception:
+        pass
     
-    while processor_running:
-        try:
-            # Get the next pending file
-            pending_files = get_pending_audio_files()
-            
-            if pending_files.exists():
-                # Process one file at a time
-                audio_file = pending_files.first()
-                logger.info(f"Processing file: {audio_file.audio_file_name}")
-                
-                # Process the file
-                success = process_single_file(audio_file)
-                
-                if success:
-                    logger.info(f"Successfully processed file: {audio_file.audio_file_name}")
-                else:
-                    logger.warning(f"Failed to process file: {audio_file.audio_file_name}")
-            else:
-                # No pending files, log and wait
-                logger.info("No pending files to process. Waiting for new uploads.")
-            
-            # Sleep for a while before checking again
-            time.sleep(processing_interval)
-            
-        except Exception as e:
-            logger.error(f"Error in background processor: {str(e)}")
-            time.sleep(processing_interval)  # Sleep and try again
+    return False
+
+
+def wait_for_pending_files(stop_event, seen_notifications):
+    """
+    Wait until new files are uploaded, the processor is stopped or processing_interval passes
+    Returns at once if an upload was notified since seen_notifications was read
+    """
+    with processor_condition:
+        if processor_notifications == seen_notifications and not stop_event.is_set():
+            processor_condition.wait(processing_interval)
+
+
+def wake_background_processor():
+    """
+    Wake every idle worker of the background processor
+    """
+    global processor_notifications
     
-    logger.info("Background audio processor stopped")
+    with processor_condition:
+        processor_notifications += 1
+        processor_condition.notify_all()
 
 
-def start_background_processor():
+def notify_new_uploads():
+    """
+    Hand newly uploaded files to the background processor, starting it if it is not running
+    The workers are woken once the upload's transaction commits, so they see the new files straight away
+    With AUDIO_PROCESSOR_EMBEDDED off, dedicated run_processor workers pick the files up on their next poll instead
     """
-    Start the background processing thread if it's not already running
+    if not getattr(settings, 'AUDIO_PROCESSOR_EMBEDDED', False):
+        return
+    if get_processor_status() != "Running":
+        start_background_processor()
+    transaction.on_commit(wake_background_processor)
+
+
+class BackgroundProcessor:
+    """
+    One run of the background processor: its worker threads and the files it has claimed for them
+    Files are claimed in batches sized to the free workers plus AUDIO_PROCESSOR_PREFETCH, so with many short files
+    the queue is not queried for every file. The batches are leased to the processor as a whole and renewed by a
+    single heartbeat; files still waiting locally when it stops are released back to the queue.
     """
-    global processor_running, processor_thread
     
-    if processor_running and processor_thread and processor_thread.is_alive():
-        logger.info("Background processor is already running")
-        return False
+    def __init__(self, concurrency):
+        self.processor_id = f"{socket.gethostname()}:{os.getpid()}:processor-{next(processor_numbers)}"
+        self.stop_event = threading.Event()
+        self.claim_lock = threading.Lock()
+        self.claimed_files = deque()
+        self.busy_workers = 0
+        self.threads = [
+            threading.Thread(target=self.process_pending_files_continuously,
+                             name=f"audio-processor-{index + 1}", daemon=True)  # Threads exit with the main program
+            for index in range(max(1, concurrency))
+        ]
+        self.supervisor = threading.Thread(target=self.supervise, name="audio-processor-supervisor", daemon=True)
     
-    processor_running = True
-    processor_thread = threading.Thread(target=process_pending_files_continuously)
-    processor_thread.daemon = True  # Thread will exit when main program exits
-    processor_thread.start()
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        self.supervisor.start()
     
-    logger.info("Started background audio processor")
-    return True
+    def stop(self, timeout=5.0):
+        """
+        Stop the workers; they finish the file they are processing, and the files they never started are released
+        """
+        self.stop_event.set()
+        wake_background_processor()
+        for thread in self.threads + [self.supervisor]:
+            thread.join(timeout=timeout)  # Wait for the workers to finish
+    
+    def live_workers(self):
+        return sum(thread.is_alive() for thread in self.threads)
+    
+    def take_file(self):
+        """
+        Take the next claimed file for a worker, claiming a new batch when none are left
+        Returns the OriginalAudioFile, or None if no file is pending
+        """
+        with self.claim_lock:
+            if not self.claimed_files and not self.stop_event.is_set():
+                free_workers = len(self.threads) - self.busy_workers
+                self.claimed_files.extend(claim_pending_files(free_workers + get_processor_prefetch(),
+                                                              self.processor_id))
+            if not self.claimed_files or self.stop_event.is_set():
+                return None
+            self.busy_workers += 1
+            return self.claimed_files.popleft()
+    
+    def file_done(self):
+        with self.claim_lock:
+            self.busy_workers -= 1
+    
+    def process_pending_files_continuously(self):
+        """
+        Continuously process pending audio files, one after the other without pausing
+        Every worker thread runs this; a worker only waits while no file is pending, until notify_new_uploads wakes it
+        """
+        worker_name = threading.current_thread().name
+        logger.info(f"Background audio worker {worker_name} started")
+        
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    # Uploads notified from here on are not missed, even if the claim below comes up empty
+                    seen_notifications = processor_notifications
+                    
+                    # Take the next claimed file
+                    audio_file = self.take_file()
+                    
+                    if audio_file is None:
+                        # No pending files, wait for new uploads (stopping the processor ends the wait early)
+                        logger.info("No pending files to process. Waiting for new uploads.")
+                        wait_for_pending_files(self.stop_event, seen_notifications)
+                        continue
+                    
+                    logger.info(f"Processing file: {audio_file.audio_file_name} ({worker_name})")
+                    
+                    # Process the file; the FFT threads and shard processes are split between the workers
+                    try:
+                        success = complete_file_processing(audio_file, concurrency=len(self.threads))
+                    finally:
+                        self.file_done()
+                    
+                    if success:
+                        logger.info(f"Successfully processed file: {audio_file.audio_file_name}")
+                    else:
+                        logger.warning(f"Failed to process file: {audio_file.audio_file_name}")
+                    
+                except Exception as e:
+                    logger.error(f"Error in background processor: {str(e)}")
+                    self.stop_event.wait(processing_interval)  # Wait and try again
+        finally:
+            # Django opens a database connection per thread, close this worker's
+            connections.close_all()
+        
+        logger.info(f"Background audio worker {worker_name} stopped")
+    
+    def supervise(self):
+        """
+        Keep the processor's leases alive while any worker runs, then release the files no worker started
+        """
+        try:
+            with LeaseHeartbeat(self.processor_id):
+                for thread in self.threads:
+                    thread.join()
+            with self.claim_lock:
+                unstarted = list(self.claimed_files)
+                self.claimed_files.clear()
+            if unstarted:
+                released = release_claimed_files(unstarted, self.processor_id)
+                logger.info(f"Released {released} claimed files back to the queue")
+        except Exception as e:
+            logger.error(f"Error stopping the background processor: {str(e)}")
+        finally:
+            connections.close_all()
 
 
-def stop_background_processor():
+def start_background_processor(concurrency=None):
     """
-    Stop the background processing thread
+    Start the background processor's worker threads if they're not already running
+    concurrency is the number of worker threads (default is AUDIO_PROCESSOR_CONCURRENCY)
     """
-    global processor_running, processor_thread
+    global processor
     
-    if not processor_running or not processor_thread:
-        logger.info("Background processor is not running")
-        return False
+    with processor_lock:
+        if get_processor_status() == "Running":
+            logger.info("Background processor is already running")
+            return False
+        
+        # A new processor each time, so workers still finishing a file after a stop never resume
+        processor = BackgroundProcessor(get_processor_concurrency() if concurrency is None else concurrency)
+        processor.start()
     
-    processor_running = False
-    processor_thread.join(timeout=5.0)  # Wait for thread to finish
-    processor_thread = None
+    logger.info(f"Started background audio processor with {len(processor.threads)} workers")
+    return True
+
+
+def stop_background_processor(timeout=5.0):
+    """
+    Stop the background processor's worker threads
+    Workers finish the file they are processing before they exit; timeout is how long to wait for each of them
+    (None waits until every worker has finished and the unstarted files are released)
+    """
+    with processor_lock:
+        if get_processor_status() != "Running":
+            logger.info("Background processor is not running")
+            return False
+        
+        processor.stop(timeout)
     
     logger.info("Stopped background audio processor")
     return True
 
 
+def get_processor_workers():
+    """
+    Get the number of background processor worker threads that are alive
+    After a stop this counts the workers still finishing their file
+    """
+    return processor.live_workers() if processor else 0
+
+
 def get_processor_status():
     """
     Get the current status of the background processor
     """
-    global processor_running, processor_thread
-    
-    if processor_running and processor_thread and processor_thread.is_alive():
+    if get_processor_workers() and not processor.stop_event.is_set():
         return "Running"
     else:
         return "Stopped"
 
 
-def process_pending_audio_files_batch():
+def process_pending_audio_files_batch(max_workers=None, chunksize=None, memory_limit_mb=None, limit=None):
     """
-    Process all pending audio files in a batch (one by one)
-    This is for manual triggering of processing
+    Process the pending audio files in a batch, at most limit of them (default is all)
+    Detection runs in a pool of worker processes; results are stored from this process as they arrive.
+    This is run by the process_batch command, e.g. to work through a backlog of uploads
     Returns a tuple of (processed_count, failed_count)
     """
-    pending_files = get_pending_audio_files()
+    if max_workers is None:
+        max_workers = getattr(settings, 'AUDIO_PROCESSING_WORKERS', None)
+    if chunksize is None:
+        chunksize = getattr(settings, 'AUDIO_PROCESSING_CHUNKSIZE', 1)
+    if memory_limit_mb is None:
+        memory_limit_mb = getattr(settings, 'AUDIO_PROCESSING_TASK_MEMORY_MB', None)
+    
+    # Claim the files first so the background processor doesn't pick them up meanwhile
+    worker_id = get_worker_id()
+    claimed_files = claim_pending_files(limit, worker_id=worker_id)
     processed_count = 0
     failed_count = 0
     
-    for audio_file in pending_files:
-        # Process the file
-        success = process_single_file(audio_file)
+    # Long recordings would keep one worker busy long after the others finish, so they are left out of
+    # the pool and afterwards split into time shards that every worker shares
+    long_files = [audio_file for audio_file in claimed_files if get_shard_duration(audio_file.audio_file.path)]
+    claimed_files = [audio_file for audio_file in claimed_files if audio_file not in long_files]
+    
+    # The heartbeat keeps every claimed file leased until its results are stored
+    with LeaseHeartbeat(worker_id):
+        results = detect_files_parallel(
+            [audio_file.audio_file.path for audio_file in claimed_files],
+            max_workers=max_workers, chunksize=chunksize, memory_limit_mb=memory_limit_mb,
+            cache=get_spectrogram_cache(), skip_silence=getattr(settings, 'AUDIO_PROCESSING_SKIP_SILENCE', False),
+            **get_detection_params()
+        )
+        for index, audio_file in enumerate(claimed_files):
+            try:
+                _, detection_result = next(results)
+            except Exception as e:
+                # The pool broke (e.g. a worker process was killed) and has no more results: this file is marked
+                # as failed and the files after it go back to the queue for the background processor
+                handle_processing_error(audio_file, e)
+                failed_count += 1
+                release_claimed_files(claimed_files[index + 1:], worker_id,
+                                      message="Batch worker pool failed before the file was processed; "
+                                              "file returned to the queue")
+                break
+            
+            # Store the results
+            success = complete_file_processing(audio_file, detection_result)
         
-        if success:
-            processed_count += 1
-        else:
-            failed_count += 1
+            if success:
+                processed_count += 1
+            else:
+                failed_count += 1
+    
+        for audio_file in long_files:
+            if complete_file_processing(audio_file):
+                processed_count += 1
+            else:
+                failed_count += 1
     
     return processed_count, failed_count
 
 
 def process_pending_audio_files():
     """
-    Process all pending audio files in a batch (one by one)
-    This is a wrapper function for process_pending_audio_files_batch that can be called from views
+    Process all pending audio files in the background
+    The files are handed to the background processor, so no request starts processing of its own
     """
-    # Start processing in a separate thread to avoid blocking the request
-    threading.Thread(target=process_pending_audio_files_batch).start()
+    notify_new_uploads()
     return {'status': 'Processing started in background'}
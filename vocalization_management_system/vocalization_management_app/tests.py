@@ -1,3 +1,920 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import soundfile as sf
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from scipy.io import wavfile
+from scipy.signal import stft
+
+from .audio_processing import get_fft_workers, get_shard_workers, process_audio, remerge_saw_calls
+from .benchmarks import legacy_detect_events, synthetic_magnitude
+from .detection_engine import (
+    EVENT_DTYPE, ActivityGate, BandEnvelope, EventMerger, ImpulseHits, band_limited_stft, decimate_signal, decimation_factor,
+    detect_events, detect_events_in_file, detect_events_sharded, detect_saw_calls, find_impulse_frames, iter_wav_range, parameter_grid,
+    stft_segment, sweep_file
+)
+from .live_detection import (
+    adetect_calls_live, aread_pcm_blocks, detect_calls_live, follow_wav_file, read_pcm_blocks, replay_wav_realtime
+)
+from .models import AcousticEvent, CallTimeDifference, CustomUser, Database, DetectedNoiseAudioFile, OriginalAudioFile, ProcessingLog
+from .spectrogram_cache import SpectrogramCache
+from . import tasks
+from .tasks import process_pending_audio_files_batch
+from .triangulation import link_overlapping_detections
+from .wav_reader import PCM24Array, map_wav
+
+
+def synthetic_recording(seed, sample_rate=48000, seconds=60, n_calls=8):
+    """Noisy recording with saw-call-like trains of low frequency tone bursts"""
+    rng = np.random.default_rng(seed)
+    audio = (800 * rng.standard_normal(sample_rate * seconds)).astype(np.float32)
+    t = np.arange(audio.size) / sample_rate
+    for _ in range(n_calls):
+        call_start = rng.uniform(0, seconds - 3)
+        for pulse in range(5):
+            start = int((call_start + pulse * 0.4) * sample_rate)
+            stop = start + int(0.12 * sample_rate)
+            tone = rng.uniform(6000, 15000) * np.sin(2 * np.pi * rng.uniform(40, 250) * t[start:stop])
+            audio[start:stop] += tone.astype(np.float32)
+    audio -= np.mean(audio)
+    return audio
+
+
+class DetectionKernelTests(SimpleTestCase):
+    def assert_same_events(self, expected, actual):
+        self.assertEqual(actual.dtype, EVENT_DTYPE)
+        self.assertEqual(len(expected), len(actual))
+        fields = {'start_seconds': 'start_s', 'end_seconds': 'end_s', 'frequency': 'peak_freq',
+                  'magnitude': 'peak_mag', 'impulse_count': 'impulse_count'}
+        for exp, act in zip(expected, actual):
+            for key, field in fields.items():
+                self.assertEqual(exp[key], act[field], key)
+
+    def test_matches_legacy_loop_on_random_matrices(self):
+        for seed, density in [(0, 0.0005), (1, 0.002), (2, 0.02), (3, 0.2)]:
+            magnitude, frequencies, times = synthetic_magnitude(seed, density=density)
+            with self.subTest(seed=seed):
+                self.assert_same_events(
+                    legacy_detect_events(magnitude, frequencies, times),
+                    detect_events(magnitude, frequencies, times)
+                )
+
+    def test_matches_legacy_loop_with_custom_parameters(self):
+        magnitude, frequencies, times = synthetic_magnitude(4, density=0.01)
+        params = dict(min_mag=5000, max_mag=9000, min_freq=40, max_freq=200, time_threshold=1.5)
+        self.assert_same_events(
+            legacy_detect_events(magnitude, frequencies, times, **params),
+            detect_events(magnitude, frequencies, times, **params)
+        )
+
+    def test_no_events_in_silence(self):
+        magnitude, frequencies, times = synthetic_magnitude(5, density=0.0)
+        self.assertEqual(len(detect_events(magnitude, frequencies, times)), 0)
+
+
+class DecimationTests(SimpleTestCase):
+    def test_factor_keeps_frames_aligned(self):
+        self.assertEqual(decimation_factor(48000), 60)
+        self.assertEqual(decimation_factor(44100), 49)
+        self.assertEqual(decimation_factor(8000), 10)
+        # An odd segment length cannot be split evenly, so the signal is left alone
+        self.assertEqual(decimation_factor(22050), 1)
+
+    def test_decimated_detection_matches_full_rate(self):
+        audio = synthetic_recording(0)
+        full = band_limited_stft(audio, 48000)
+        decimated = band_limited_stft(audio, 48000, decimate=True)
+        self.assertEqual(decimated[2].shape, (41, full[2].shape[1]))
+        np.testing.assert_array_equal(decimated[1], full[1])
+
+        expected = detect_events(full[2], full[0], full[1])
+        gain = decimated[3]
+        actual = detect_events(decimated[2], decimated[0], decimated[1], min_mag=3500 * gain, max_mag=10000 * gain)
+        self.assertGreater(len(expected), 0)
+        for field in ('start_s', 'end_s', 'impulse_count'):
+            np.testing.assert_array_equal(expected[field], actual[field])
+
+
+class SinglePrecisionSTFTTests(SimpleTestCase):
+    def reference_stft(self, audio, sample_rate, decimate):
+        """Magnitude from scipy.signal.stft, which the detection path used before"""
+        nperseg, noverlap = stft_segment(sample_rate)
+        factor = decimation_factor(sample_rate) if decimate else 1
+        _, _, Zxx = stft(decimate_signal(audio, factor), fs=sample_rate / factor,
+                         nperseg=nperseg // factor, noverlap=noverlap // factor)
+        return np.abs(Zxx)
+
+    def test_magnitude_matches_scipy_stft(self):
+        audio = synthetic_recording(2, seconds=20)
+        for decimate in (False, True):
+            with self.subTest(decimate=decimate):
+                _, _, magnitude, _ = band_limited_stft(audio, 48000, decimate=decimate)
+                self.assertEqual(magnitude.dtype, np.float32)
+                np.testing.assert_allclose(magnitude, self.reference_stft(audio, 48000, decimate),
+                                           rtol=1e-4, atol=1e-3)
+
+    def test_events_match_scipy_stft_and_fft_workers(self):
+        audio = synthetic_recording(3)
+        frequencies, times, magnitude, _ = band_limited_stft(audio, 48000)
+        expected = detect_events(self.reference_stft(audio, 48000, False), frequencies, times)
+        self.assertGreater(len(expected), 0)
+        for actual in (detect_events(magnitude, frequencies, times), detect_saw_calls(audio, 48000, fft_workers=2)):
+            for field in ('start_s', 'end_s', 'peak_freq', 'impulse_count'):
+                np.testing.assert_array_equal(actual[field], expected[field])
+            np.testing.assert_allclose(actual['peak_mag'], expected['peak_mag'], rtol=1e-5)
+
+
+class StreamingDetectionTests(SimpleTestCase):
+    def setUp(self):
+        self.audio = np.clip(synthetic_recording(1, seconds=90, n_calls=10), -32768, 32767).astype(np.int16)
+        handle, self.wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(handle)
+        wavfile.write(self.wav_path, 48000, self.audio)
+
+    def tearDown(self):
+        os.remove(self.wav_path)
+
+    def event_keys(self, events):
+        return [(e['start_s'], e['end_s'], e['impulse_count'], e['peak_freq']) for e in events]
+
+    def test_merger_state_carries_across_batches(self):
+        magnitude, frequencies, times = synthetic_magnitude(6, density=0.002)
+        hits = find_impulse_frames(magnitude, frequencies, times)
+        expected = detect_events(magnitude, frequencies, times)
+        for batch in (1, 7, 100):
+            merger = EventMerger()
+            events = [merger.feed(*(values[start:start + batch] for values in hits))
+                      for start in range(0, hits[0].size, batch)]
+            events = np.concatenate(events + [merger.flush()])
+            with self.subTest(batch=batch):
+                self.assertEqual(self.event_keys(expected), self.event_keys(events))
+
+    def test_block_size_does_not_change_events(self):
+        signal = self.audio.astype(np.float32)
+        signal -= np.mean(signal)
+        frequencies, times, magnitude, _ = band_limited_stft(signal, 48000)
+        expected = detect_events(magnitude, frequencies, times)
+        self.assertGreater(len(expected), 0)
+        for block_duration in (0.37, 10, 120):
+            events, sample_rate, n_samples = detect_events_in_file(self.wav_path, block_duration=block_duration)
+            with self.subTest(block_duration=block_duration):
+                self.assertEqual((sample_rate, n_samples), (48000, self.audio.size))
+                self.assertEqual(self.event_keys(expected), self.event_keys(events))
+
+    def test_sweep_matches_separate_runs(self):
+        parameter_sets = parameter_grid(min_mag=[3000, 3500], max_freq=[200, 300], time_threshold=[2, 5])
+        results, sample_rate, n_samples = sweep_file(self.wav_path, parameter_sets)
+        self.assertEqual((sample_rate, n_samples), (48000, self.audio.size))
+        self.assertEqual(len(results), 8)
+        for params, events in zip(parameter_sets, results):
+            with self.subTest(**params):
+                expected, _, _ = detect_events_in_file(self.wav_path, **params)
+                self.assertEqual(self.event_keys(expected), self.event_keys(events))
+
+    def test_cached_spectrogram_gives_the_same_events(self):
+        expected, _, _ = detect_events_in_file(self.wav_path)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SpectrogramCache(cache_dir)
+            first, _, _ = detect_events_in_file(self.wav_path, cache=cache)
+            self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith('.npy')]), 1)
+            with mock.patch('vocalization_management_app.detection_engine.open_wav_blocks') as open_blocks:
+                second, sample_rate, n_samples = detect_events_in_file(self.wav_path, cache=cache)
+            open_blocks.assert_not_called()
+        self.assertEqual((sample_rate, n_samples), (48000, self.audio.size))
+        self.assertEqual(self.event_keys(expected), self.event_keys(first))
+        self.assertEqual(self.event_keys(expected), self.event_keys(second))
+
+    def test_impulse_hits_remerge_like_a_full_detection(self):
+        events, _, _, hits = detect_events_in_file(self.wav_path, return_hits=True)
+        self.assertEqual(self.event_keys(events), self.event_keys(hits.merge()))
+
+        buffer = io.BytesIO()
+        hits.save(buffer)
+        buffer.seek(0)
+        stored = ImpulseHits.load(buffer)
+        for time_threshold, min_impulses in [(1, 3), (2, 2), (10, 5)]:
+            expected, _, _ = detect_events_in_file(self.wav_path, time_threshold=time_threshold,
+                                                   min_impulses=min_impulses)
+            with self.subTest(time_threshold=time_threshold, min_impulses=min_impulses):
+                remerged = stored.merge(time_threshold, min_impulses)
+                self.assertEqual(self.event_keys(expected), self.event_keys(remerged))
+
+    def test_band_envelope_summarises_the_detection_band(self):
+        signal = self.audio.astype(np.float32)
+        signal -= np.mean(signal)
+        frequencies, times, magnitude, _ = band_limited_stft(signal, 48000)
+        band = magnitude[(frequencies > 15) & (frequencies < 300)].astype(np.float64)
+
+        envelope = BandEnvelope()
+        detect_events_in_file(self.wav_path, block_duration=7, envelope=envelope)
+        self.assertEqual(len(envelope.values), 901)
+        # Frames are 50ms apart, so each 100ms window averages two of them
+        np.testing.assert_allclose(envelope.values['energy'][:900],
+                                   (band ** 2).sum(axis=0)[:1800].reshape(900, 2).mean(axis=1), rtol=1e-5)
+        np.testing.assert_allclose(envelope.values['peak'][:900], band.max(axis=0)[:1800].reshape(900, 2).max(axis=1),
+                                   rtol=1e-5)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cached = BandEnvelope()
+            detect_events_in_file(self.wav_path, cache=SpectrogramCache(cache_dir), envelope=cached)
+        np.testing.assert_allclose(cached.values['energy'], envelope.values['energy'], rtol=1e-6)
+
+        buffer = io.BytesIO()
+        envelope.save(buffer)
+        buffer.seek(0)
+        times, energy, peak = BandEnvelope.load(buffer).downsample(100)
+        self.assertEqual(len(times), 91)
+        self.assertEqual(peak.max(), envelope.values['peak'].max())
+
+    def test_time_shards_match_a_serial_run(self):
+        for params in ({}, {'decimate': True}, {'noise_gate': 2.0}, {'noise_floor': 100, 'decimate': True}):
+            serial_envelope, sharded_envelope = BandEnvelope(), BandEnvelope()
+            expected, _, _, expected_hits = detect_events_in_file(self.wav_path, block_duration=7, return_hits=True,
+                                                                  envelope=serial_envelope, **params)
+            events, sample_rate, n_samples, hits = detect_events_sharded(
+                self.wav_path, max_workers=2, shard_duration=17, block_duration=7, return_hits=True,
+                envelope=sharded_envelope, **params
+            )
+            with self.subTest(**params):
+                self.assertEqual((sample_rate, n_samples), (48000, self.audio.size))
+                self.assertGreater(len(expected), 0)
+                np.testing.assert_array_equal(events, expected)
+                np.testing.assert_array_equal(hits.hits, expected_hits.hits)
+                np.testing.assert_array_equal(sharded_envelope.values, serial_envelope.values)
+
+    def test_loaded_and_streamed_signals_give_the_same_events(self):
+        events_from_file, _, _ = detect_events_in_file(self.wav_path)
+        stereo = np.stack([self.audio, np.zeros_like(self.audio)], axis=1)
+        self.assertEqual(self.event_keys(events_from_file), self.event_keys(detect_saw_calls(stereo, 48000)))
+
+
+class SpectralGateTests(SimpleTestCase):
+    def setUp(self):
+        # A steady in-band hum inside the magnitude window over the second half hides the calls there
+        audio = synthetic_recording(1, seconds=90, n_calls=10)
+        hum = 9000 * np.sin(2 * np.pi * 100 * np.arange(audio.size) / 48000)
+        hum[:audio.size // 2] = 0
+        self.audio = np.clip(audio + hum, -32768, 32767).astype(np.int16)
+
+    def test_gate_recovers_calls_masked_by_a_steady_hum(self):
+        plain = detect_saw_calls(self.audio, 48000)
+        gated = detect_saw_calls(self.audio, 48000, noise_gate=2.0)
+        self.assertEqual(np.count_nonzero(plain['start_s'] > 45), 0)
+        self.assertGreater(np.count_nonzero(gated['start_s'] > 45), 0)
+        np.testing.assert_array_equal(gated[gated['end_s'] < 45], plain[plain['end_s'] < 45])
+
+    def test_gating_the_whole_matrix_matches_the_streaming_gate(self):
+        signal = self.audio.astype(np.float32)
+        signal -= np.mean(signal)
+        frequencies, times, magnitude, _ = band_limited_stft(signal, 48000)
+        for noise_gate, noise_time_constant in [(2.0, 2.0), (1.5, 0.5)]:
+            with self.subTest(noise_gate=noise_gate, noise_time_constant=noise_time_constant):
+                params = dict(noise_gate=noise_gate, noise_time_constant=noise_time_constant)
+                np.testing.assert_array_equal(detect_saw_calls(self.audio, 48000, block_duration=7, **params),
+                                              detect_events(magnitude, frequencies, times, **params))
+
+
+class NoiseFloorTests(SimpleTestCase):
+    def setUp(self):
+        self.audio = synthetic_recording(1, seconds=90, n_calls=10)
+
+    def test_adaptive_thresholds_follow_the_recorder_gain(self):
+        # A recorder at a quarter of the gain misses every call with the fixed window
+        expected = detect_saw_calls(self.audio, 48000)
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(len(detect_saw_calls(self.audio * 0.25, 48000)), 0)
+
+        adaptive = detect_saw_calls(self.audio, 48000, noise_floor=100)
+        quiet = detect_saw_calls(self.audio * 0.25, 48000, noise_floor=100)
+        np.testing.assert_array_equal(adaptive['start_s'], expected['start_s'])
+        np.testing.assert_array_equal(quiet[['start_s', 'end_s', 'impulse_count']],
+                                      adaptive[['start_s', 'end_s', 'impulse_count']])
+        np.testing.assert_array_equal(quiet['peak_mag'], adaptive['peak_mag'] * 0.25)
+
+    def test_whole_matrix_and_streaming_floors_match(self):
+        signal = self.audio - np.mean(self.audio)
+        frequencies, times, magnitude, _ = band_limited_stft(signal, 48000)
+        for params in ({'noise_floor': 100}, {'noise_floor': 50, 'noise_floor_max': 2000, 'noise_quantile': 0.25},
+                       {'noise_floor': 100, 'noise_gate': 2.0}):
+            with self.subTest(**params):
+                np.testing.assert_array_equal(detect_saw_calls(self.audio, 48000, block_duration=7, **params),
+                                              detect_events(magnitude, frequencies, times, **params))
+
+
+class ActivityGateTests(SimpleTestCase):
+    def setUp(self):
+        # Calls separated by long quiet stretches, like most field recordings
+        self.audio = np.clip(synthetic_recording(4, seconds=120, n_calls=5), -32768, 32767).astype(np.int16)
+
+    def test_skipping_silent_frames_gives_the_same_calls(self):
+        for params in ({}, {'decimate': True}):
+            envelope, gated_envelope, activity_gate = BandEnvelope(), BandEnvelope(), ActivityGate()
+            expected, expected_hits = detect_saw_calls(self.audio, 48000, return_hits=True, envelope=envelope,
+                                                       **params)
+            events, hits = detect_saw_calls(self.audio, 48000, return_hits=True, envelope=gated_envelope,
+                                            activity_gate=activity_gate, **params)
+            with self.subTest(**params):
+                self.assertGreater(len(expected), 0)
+                self.assertGreater(activity_gate.skipped_fraction, 0.5)
+                np.testing.assert_array_equal(events, expected)
+                np.testing.assert_array_equal(hits.hits, expected_hits.hits)
+                measured = ~np.isnan(gated_envelope.values['energy'])
+                self.assertEqual(len(gated_envelope.values), len(envelope.values))
+                np.testing.assert_array_equal(gated_envelope.values[measured], envelope.values[measured])
+
+    def test_time_shards_add_up_their_skipped_frames(self):
+        handle, wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(handle)
+        try:
+            wavfile.write(wav_path, 48000, self.audio)
+            serial_gate, sharded_gate = ActivityGate(), ActivityGate()
+            expected, _, _ = detect_events_in_file(wav_path, activity_gate=serial_gate)
+            events, _, _ = detect_events_sharded(wav_path, max_workers=2, shard_duration=40,
+                                                 activity_gate=sharded_gate)
+        finally:
+            os.remove(wav_path)
+        np.testing.assert_array_equal(events, expected)
+        self.assertEqual((sharded_gate.frames, sharded_gate.skipped_frames),
+                         (serial_gate.frames, serial_gate.skipped_frames))
+
+
+class TriangulationTests(SimpleTestCase):
+    def test_sweep_links_the_same_detections_as_pairwise_overlap(self):
+        rng = np.random.default_rng(0)
+        starts = rng.uniform(0, 3600, 400)
+        ends = starts + rng.uniform(0.5, 10, starts.size)
+        events = link_overlapping_detections(starts, ends, tolerance=1.0)
+
+        # Connected components of the pairwise overlap graph
+        components = np.arange(starts.size)
+        for i in range(starts.size):
+            for j in range(starts.size):
+                if starts[j] <= ends[i] + 1.0 and starts[i] <= ends[j] + 1.0:
+                    components[components == components[j]] = components[i]
+        same_event = events[:, np.newaxis] == events
+        np.testing.assert_array_equal(same_event, components[:, np.newaxis] == components)
+        self.assertTrue(np.all(np.diff(events[np.argsort(starts)]) >= 0))
+
+
+class WavReaderTests(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        audio = synthetic_recording(9, seconds=40, n_calls=4)
+        self.stereo = np.stack([audio, -audio], axis=1) / 2 ** 15
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def wav_with_chunk(self, name, samples, metadata, pad, data_size=None):
+        """Writes a 16-bit mono WAV file with an extra chunk before fmt, optionally without its pad byte"""
+        data = samples.astype('<i2').tobytes()
+        chunks = b'guan' + struct.pack('<I', len(metadata)) + metadata + (b'\0' if pad and len(metadata) % 2 else b'')
+        chunks += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 48000, 96000, 2, 16)
+        chunks += b'data' + struct.pack('<I', len(data) if data_size is None else data_size) + data
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as wav_file:
+            wav_file.write(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks)
+        return path
+
+    def test_24_bit_and_extensible_files_are_memory_mapped(self):
+        for subtype, file_format in (('PCM_24', 'WAV'), ('PCM_24', 'WAVEX'), ('PCM_16', 'WAVEX'), ('FLOAT', 'WAVEX')):
+            path = os.path.join(self.temp_dir, f'{subtype}_{file_format}.wav')
+            sf.write(path, self.stereo, 48000, subtype=subtype, format=file_format)
+            sample_rate, audio_data = map_wav(path)
+            expected = sf.read(path, dtype='float32' if subtype == 'FLOAT' else 'int32')[0]
+            if subtype == 'PCM_16':
+                expected >>= 16
+            with self.subTest(subtype=subtype, file_format=file_format):
+                self.assertEqual(sample_rate, 48000)
+                self.assertEqual(isinstance(audio_data, PCM24Array), subtype == 'PCM_24')
+                np.testing.assert_array_equal(np.asarray(audio_data), expected)
+                np.testing.assert_array_equal(np.asarray(audio_data[1000:2000, 1]), expected[1000:2000, 1])
+
+        # 24-bit recordings are streamed from the memory map, not decoded by soundfile. The samples are
+        # left-justified in int32, so the file is scaled for them to land in the usual magnitude range
+        path = os.path.join(self.temp_dir, 'quiet.wav')
+        sf.write(path, self.stereo / 2 ** 16, 48000, subtype='PCM_24')
+        expected = detect_saw_calls(sf.read(path, dtype='int32')[0], 48000)
+        with mock.patch('soundfile.SoundFile', side_effect=AssertionError("soundfile was used")):
+            events, _, _ = detect_events_in_file(path)
+            _, blocks = follow_wav_file(path, block_duration=0.5, idle_timeout=0)
+            calls = list(detect_calls_live(blocks, 48000))
+        self.assertGreater(len(expected), 0)
+        np.testing.assert_array_equal(events, expected)
+        np.testing.assert_array_equal(np.array(calls, dtype=EVENT_DTYPE), expected)
+
+    def test_odd_sized_chunks_with_or_without_pad_byte(self):
+        samples = np.arange(-500, 501, dtype=np.int16)
+        for metadata in (b'GUANO|', b'GUANO|Version:1.0'):
+            for pad in (True, False):
+                path = self.wav_with_chunk('chunk.wav', samples, metadata, pad)
+                with self.subTest(size=len(metadata), pad=pad):
+                    np.testing.assert_array_equal(map_wav(path)[1], samples)
+
+        # A data size that was never finalised is read up to the last whole frame in the file
+        path = self.wav_with_chunk('unfinished.wav', samples, b'GUANO|', True, data_size=0xFFFFFFFF)
+        with open(path, 'ab') as wav_file:
+            wav_file.write(b'\1')
+        np.testing.assert_array_equal(map_wav(path)[1], samples)
+
+        # Recorders that write placeholder sizes of 0 until the file is closed: the samples run to the end of the file
+        path = self.wav_with_chunk('placeholder.wav', samples, b'GUANO|', True, data_size=0)
+        np.testing.assert_array_equal(map_wav(path)[1], samples)
+        with open(path, 'r+b') as wav_file:
+            wav_file.seek(4)
+            wav_file.write(struct.pack('<I', 0))
+            wav_file.seek(-2 * len(samples), os.SEEK_END)
+            wav_file.seek(-4, os.SEEK_CUR)
+            wav_file.write(struct.pack('<I', 200))
+        np.testing.assert_array_equal(map_wav(path)[1], samples)
+
+
+class LiveDetectionTests(SimpleTestCase):
+    def setUp(self):
+        self.audio = np.clip(synthetic_recording(8, seconds=60, n_calls=6), -32768, 32767).astype(np.int16)
+        handle, self.wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(handle)
+        wavfile.write(self.wav_path, 48000, self.audio)
+        self.expected = detect_saw_calls(self.audio, 48000, dc_offset=0.0)
+
+    def tearDown(self):
+        os.remove(self.wav_path)
+
+    def test_calls_are_reported_while_the_replay_is_running(self):
+        sample_rate, blocks = replay_wav_realtime(self.wav_path, speed=2000)
+        replayed_seconds = []
+
+        def counted(blocks):
+            for block in blocks:
+                replayed_seconds.append(len(block) / sample_rate)
+                yield block
+
+        calls = []
+        for call in detect_calls_live(counted(blocks), sample_rate):
+            calls.append(call)
+            if len(calls) < len(self.expected):
+                # Reported within time_threshold plus one STFT segment and one block of the last impulse
+                self.assertLess(sum(replayed_seconds) - call['end_s'], 5 + 0.1 + 0.1 + 1e-6)
+        self.assertGreater(len(self.expected), 1)
+        np.testing.assert_array_equal(np.array(calls, dtype=EVENT_DTYPE), self.expected)
+
+    def test_pcm_stream_and_growing_file(self):
+        stereo = np.stack([self.audio, np.zeros_like(self.audio)], axis=1)
+        calls = list(detect_calls_live(read_pcm_blocks(io.BytesIO(stereo.tobytes()), 48000, channels=2), 48000))
+        np.testing.assert_array_equal(np.array(calls, dtype=EVENT_DTYPE), self.expected)
+
+        sample_rate, blocks = follow_wav_file(self.wav_path, block_duration=0.5, idle_timeout=0)
+        calls = list(detect_calls_live(blocks, sample_rate))
+        np.testing.assert_array_equal(np.array(calls, dtype=EVENT_DTYPE), self.expected)
+
+    def test_async_detection_over_a_stream_reader(self):
+        async def detect():
+            reader = asyncio.StreamReader()
+            reader.feed_data(self.audio.tobytes())
+            reader.feed_eof()
+            return [call async for call in adetect_calls_live(aread_pcm_blocks(reader, 48000), 48000)]
+
+        calls = asyncio.run(detect())
+        np.testing.assert_array_equal(np.array(calls, dtype=EVENT_DTYPE), self.expected)
+
+
+class SpectrogramCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        magnitude = np.ones((30, 1000), dtype=np.float32)
+        cache = SpectrogramCache(self.cache_dir, max_bytes=int(2.5 * magnitude.nbytes))
+        for key in ('a', 'b'):
+            cache.put(key, magnitude, times=np.arange(1000))
+        # 'b' was last used long ago, 'a' is used just now
+        os.utime(os.path.join(self.cache_dir, 'b.npy'), (0, 0))
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', magnitude * 2, times=np.arange(1000))
+
+        self.assertIsNone(cache.get('b'))
+        np.testing.assert_array_equal(cache.get('a')['magnitude'], magnitude)
+        np.testing.assert_array_equal(cache.get('c')['magnitude'], magnitude * 2)
+
+    def test_key_depends_on_contents_and_settings(self):
+        paths = [os.path.join(self.cache_dir, name) for name in ('one.wav', 'two.wav', 'three.wav')]
+        for path, contents in zip(paths, (b'same', b'same', b'other')):
+            with open(path, 'wb') as f:
+                f.write(contents)
+        cache = SpectrogramCache(self.cache_dir)
+        self.assertEqual(cache.key(paths[0], 0.1, 15, 300), cache.key(paths[1], 0.1, 15, 300))
+        self.assertNotEqual(cache.key(paths[0], 0.1, 15, 300), cache.key(paths[2], 0.1, 15, 300))
+        self.assertNotEqual(cache.key(paths[0], 0.1, 15, 300), cache.key(paths[0], 0.1, 15, 200))
+
+
+class ProcessAudioTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_audio_file(self, audio, name='SMM07257_20230201_171502.wav'):
+        buffer = tempfile.SpooledTemporaryFile()
+        wavfile.write(buffer, 48000, audio)
+        buffer.seek(0)
+        original_audio = OriginalAudioFile(audio_file_name=name, animal_type='amur_tiger')
+        original_audio.audio_file.save(name, ContentFile(buffer.read()), save=False)
+        original_audio.save()
+        Database.objects.create(audio_file=original_audio, status='Pending')
+        return original_audio
+
+    def test_process_audio_stores_detected_calls(self):
+        audio = np.clip(synthetic_recording(2, seconds=60), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+
+        self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+
+        expected = detect_saw_calls(audio, 48000)
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(DetectedNoiseAudioFile.objects.filter(original_file=original_audio).count(), len(expected))
+        self.assertEqual(Database.objects.get(audio_file=original_audio).status, 'Processed')
+        original_audio.refresh_from_db()
+        self.assertEqual(original_audio.sample_rate, 48000)
+
+    @override_settings(AUDIO_PROCESSING_SHARD_MINUTES=0.1, AUDIO_PROCESSING_WORKERS=2)
+    def test_long_recordings_are_processed_in_time_shards(self):
+        audio = np.clip(synthetic_recording(8, seconds=30), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+
+        self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+
+        self.assertTrue(ProcessingLog.objects.filter(audio_file=original_audio,
+                                                     message__startswith="Detected saw calls in time shards").exists())
+        expected = detect_saw_calls(audio, 48000)
+        self.assertGreater(len(expected), 0)
+        stored = DetectedNoiseAudioFile.objects.filter(original_file=original_audio).order_by('start_time')
+        self.assertEqual([call.saw_count for call in stored], list(expected['impulse_count']))
+
+    def test_remerge_rebuilds_calls_from_stored_hits(self):
+        audio = np.clip(synthetic_recording(6, seconds=60), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+        self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+        original_audio.refresh_from_db()
+        self.assertTrue(original_audio.impulse_hits)
+
+        os.remove(original_audio.audio_file.path)
+        expected = detect_saw_calls(audio, 48000, time_threshold=1, min_impulses=2)
+        self.assertEqual(remerge_saw_calls(original_audio, time_threshold=1, min_impulses=2), len(expected))
+        stored = DetectedNoiseAudioFile.objects.filter(original_file=original_audio).order_by('start_time')
+        self.assertEqual([call.saw_count for call in stored], list(expected['impulse_count']))
+
+        call_command('remerge_detections', '--no-report', stdout=io.StringIO())
+        self.assertEqual(DetectedNoiseAudioFile.objects.filter(original_file=original_audio).count(),
+                         len(detect_saw_calls(audio, 48000)))
+
+    def test_band_envelope_is_served_without_the_audio(self):
+        audio = np.clip(synthetic_recording(7, seconds=30), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+        self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+        os.remove(original_audio.audio_file.path)
+
+        user = CustomUser.objects.create_user(username='admin', email='admin@example.com', password='pw',
+                                              user_type='1')
+        self.client.force_login(user)
+        url = reverse('api_get_band_envelope', args=[original_audio.file_id])
+        data = self.client.get(url, {'points': 50, 'min_mag': 3500}).json()['data']
+        self.assertEqual(data['windows'], 301)
+        self.assertLessEqual(len(data['times']), 50)
+        self.assertEqual(len(data['peak']), len(data['times']))
+        self.assertGreater(data['preview']['active_windows'], 0)
+
+    @override_settings(AUDIO_PROCESSING_FFT_WORKERS=-1, AUDIO_PROCESSING_WORKERS=None)
+    def test_concurrent_files_share_the_cpus(self):
+        with mock.patch('os.cpu_count', return_value=8):
+            self.assertEqual(get_fft_workers(), -1)
+            self.assertEqual(get_fft_workers(2), 4)
+            self.assertEqual(get_fft_workers(16), 1)
+            self.assertIsNone(get_shard_workers())
+            self.assertEqual(get_shard_workers(2), 4)
+            with self.settings(AUDIO_PROCESSING_FFT_WORKERS=None, AUDIO_PROCESSING_WORKERS=3):
+                self.assertIsNone(get_fft_workers(2))
+                self.assertEqual(get_shard_workers(2), 1)
+
+    def test_process_pending_files_view_hands_off_to_the_processor(self):
+        audio = np.clip(synthetic_recording(3, seconds=10, n_calls=1), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+        user = CustomUser.objects.create_user(username='staff', email='staff@example.com', password='pw',
+                                              user_type='2')
+        self.client.force_login(user)
+
+        with mock.patch('vocalization_management_app.staffViews.notify_new_uploads') as notify, \
+                mock.patch('vocalization_management_app.tasks.process_pending_audio_files_batch') as batch:
+            response = self.client.get(reverse('staff_process_audio_files'))
+        self.assertRedirects(response, reverse('staff_home'), fetch_redirect_response=False)
+        notify.assert_called_once_with()
+        batch.assert_not_called()
+        # The request does no processing of its own
+        self.assertEqual(Database.objects.get(audio_file=original_audio).status, 'Pending')
+
+    def test_batch_processing_in_worker_processes(self):
+        audios = [np.clip(synthetic_recording(seed, seconds=30), -32768, 32767).astype(np.int16) for seed in (3, 4)]
+        files = [self.create_audio_file(audio, name=f'SMM07257_20230201_17150{i}.wav')
+                 for i, audio in enumerate(audios)]
+        broken = OriginalAudioFile.objects.create(audio_file='audio_files/missing.wav',
+                                                  audio_file_name='missing.wav', animal_type='amur_tiger',
+                                                  file_size_mb=1.0)
+        Database.objects.create(audio_file=broken, status='Pending')
+
+        output = io.StringIO()
+        call_command('process_batch', '--workers', '2', stdout=output)
+        self.assertIn("Failed to process 1 audio files", output.getvalue())
+        self.assertIn("Processed 2 audio files", output.getvalue())
+
+        for original_audio, audio in zip(files, audios):
+            self.assertEqual(Database.objects.get(audio_file=original_audio).status, 'Processed')
+            self.assertEqual(DetectedNoiseAudioFile.objects.filter(original_file=original_audio).count(),
+                             len(detect_saw_calls(audio, 48000)))
+        self.assertEqual(Database.objects.get(audio_file=broken).status, 'Failed')
+
+    def test_batch_survives_a_broken_worker_pool(self):
+        audio = np.clip(synthetic_recording(3, seconds=10, n_calls=1), -32768, 32767).astype(np.int16)
+        files = [self.create_audio_file(audio, name=f'SMM07257_20230201_17150{i}.wav') for i in range(3)]
+
+        def broken_pool(file_paths, **kwargs):
+            yield file_paths[0], {'events': detect_saw_calls(audio, 48000), 'sample_rate': 48000,
+                                  'n_samples': audio.size}
+            raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+        with mock.patch.object(tasks, 'detect_files_parallel', broken_pool):
+            self.assertEqual(process_pending_audio_files_batch(), (1, 1))
+
+        self.assertEqual([Database.objects.get(audio_file=audio_file).status for audio_file in files],
+                         ['Processed', 'Failed', 'Pending'])
+        self.assertEqual(Database.objects.get(audio_file=files[2]).attempts, 0)
+
+    def create_simultaneous_recordings(self):
+        # The second recorder starts a second later and hears every call 25ms after the first one
+        source = synthetic_recording(9, seconds=40)
+        delayed = np.concatenate([np.zeros(1200, dtype=np.float32), source])[48000:source.size]
+        noise = np.random.default_rng(0).standard_normal(delayed.size).astype(np.float32) * 300
+        first = self.create_audio_file(np.clip(source, -32768, 32767).astype(np.int16),
+                                       name='SMM07257_20230201_171500.wav')
+        second = self.create_audio_file(np.clip(0.8 * delayed + noise, -32768, 32767).astype(np.int16),
+                                        name='SMM07301_20230201_171501.wav')
+        self.create_audio_file(np.zeros(48000, dtype=np.int16), name='SMM07257_20230201_180000.wav')
+        for original_audio in OriginalAudioFile.objects.all():
+            self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+        return first, second
+
+    @override_settings(AUDIO_PROCESSING_SKIP_SILENCE=True)
+    def test_process_audio_skips_silent_frames(self):
+        # Calls separated by long quiet stretches, see ActivityGateTests
+        audio = np.clip(synthetic_recording(4, seconds=120, n_calls=5), -32768, 32767).astype(np.int16)
+        expected = detect_saw_calls(audio, 48000)
+        for cache_dir in (None, os.path.join(self.media_root, 'spectrogram_cache')):
+            original_audio = self.create_audio_file(audio)
+            with self.subTest(cache_dir=cache_dir), self.settings(SPECTROGRAM_CACHE_DIR=cache_dir):
+                self.assertTrue(process_audio(original_audio.audio_file.path, original_audio))
+                log = ProcessingLog.objects.get(audio_file=original_audio, message__endswith="of the recording as silent")
+                self.assertGreater(float(log.message.split()[1].rstrip('%')), 50)
+                self.assertEqual(DetectedNoiseAudioFile.objects.filter(original_file=original_audio).count(),
+                                 len(expected))
+
+    @override_settings(AUDIO_PROCESSING_MAX_ATTEMPTS=2)
+    def test_expired_leases_are_requeued_until_the_attempts_run_out(self):
+        audio_file = self.create_audio_file(np.zeros(4800, dtype=np.int16))
+        entry = Database.objects.filter(audio_file=audio_file)
+
+        self.assertTrue(tasks.mark_file_as_processing(audio_file, 'worker-1'))
+        self.assertEqual(entry.get().attempts, 1)
+        self.assertEqual(tasks.renew_leases('worker-1'), 1)
+        self.assertEqual(tasks.requeue_expired_jobs(), 0)
+
+        # The worker dies: its heartbeat stops and the lease runs out
+        entry.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.requeue_expired_jobs(), 1)
+        self.assertEqual(entry.get().status, 'Pending')
+        self.assertEqual(tasks.claim_next_pending_file('worker-2'), audio_file)
+        self.assertEqual((entry.get().attempts, entry.get().lease_owner), (2, 'worker-2'))
+
+        entry.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.requeue_expired_jobs(), 1)
+        self.assertEqual(entry.get().status, 'Failed')
+        self.assertEqual(ProcessingLog.objects.filter(audio_file=audio_file, message__startswith="Lease of").count(), 2)
+
+        # A long process_audio call outside the processor holds no lease and is not taken from it
+        entry.update(status='Processing', attempts=0, lease_expires_at=None,
+                     processing_start_time=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_expired_jobs(), 0)
+        self.assertEqual(entry.get().status, 'Processing')
+
+    def test_files_are_claimed_in_batches(self):
+        audio_files = [self.create_audio_file(np.zeros(4800, dtype=np.int16), name=f'SMM07257_20230201_1717{index:02d}.wav')
+                       for index in range(6)]
+
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(tasks.claim_pending_files(1, 'worker-1'), audio_files[:1])
+        with CaptureQueriesContext(connection) as batch:
+            self.assertEqual(tasks.claim_pending_files(4, 'worker-1'), audio_files[1:5])
+        # The queue costs the same number of queries however many files are claimed
+        self.assertEqual(len(batch), len(single))
+        self.assertEqual(Database.objects.filter(status='Processing', lease_owner='worker-1', attempts=1).count(), 5)
+        self.assertEqual(ProcessingLog.objects.filter(message__startswith="Started processing").count(), 5)
+
+        self.assertEqual(tasks.release_claimed_files(audio_files[3:], 'worker-1'), 2)
+        self.assertEqual(list(Database.objects.filter(status='Pending').order_by('pk').values_list('attempts', flat=True)),
+                         [0, 0, 0])
+        self.assertEqual(tasks.claim_pending_files(worker_id='worker-2'), audio_files[3:])
+
+    def test_simultaneous_recorders_are_triangulated(self):
+        first, second = self.create_simultaneous_recordings()
+
+        call_command('triangulate_calls', stdout=io.StringIO())
+
+        forward = CallTimeDifference.objects.filter(detection__original_file=first, other_file=second)
+        backward = CallTimeDifference.objects.filter(detection__original_file=second, other_file=first)
+        self.assertGreater(forward.count(), 0)
+        self.assertGreater(backward.count(), 0)
+        self.assertEqual(CallTimeDifference.objects.count(), forward.count() + backward.count())
+        for time_difference in forward:
+            self.assertEqual((time_difference.device, time_difference.other_device), ('SMM07257', 'SMM07301'))
+            self.assertAlmostEqual(time_difference.tdoa_seconds, 0.025, delta=1e-4)
+            self.assertGreater(time_difference.correlation, 0.9)
+        for time_difference in backward:
+            self.assertAlmostEqual(time_difference.tdoa_seconds, -0.025, delta=1e-4)
+
+        # Running it again replaces the stored time differences
+        call_command('triangulate_calls', stdout=io.StringIO())
+        self.assertEqual(CallTimeDifference.objects.count(), forward.count() + backward.count())
+
+        # Recordings that cannot be memory-mapped are read window by window, with the same results
+        stored = list(CallTimeDifference.objects.order_by('detection', 'other_file').values_list('tdoa_seconds',
+                                                                                              'correlation'))
+        with mock.patch('vocalization_management_app.audio_processing.load_wav', side_effect=ValueError), \
+                mock.patch('vocalization_management_app.audio_processing.iter_wav_range',
+                           wraps=iter_wav_range) as read_range:
+            call_command('triangulate_calls', stdout=io.StringIO())
+        self.assertGreater(read_range.call_count, 0)
+        for call in read_range.call_args_list:
+            self.assertLess(call.args[2] - call.args[1], 30 * 48000)
+        for (tdoa, correlation), expected in zip(
+                CallTimeDifference.objects.order_by('detection', 'other_file').values_list('tdoa_seconds',
+                                                                                         'correlation'), stored):
+            self.assertAlmostEqual(tdoa, expected[0], places=6)
+            self.assertAlmostEqual(correlation, expected[1], places=4)
+
+    def test_calls_heard_by_two_recorders_are_counted_once(self):
+        first, second = self.create_simultaneous_recordings()
+        first_calls = DetectedNoiseAudioFile.objects.filter(original_file=first).count()
+        self.assertGreater(first_calls, 0)
+
+        call_command('link_acoustic_events', '--date', '2023-02-01', stdout=io.StringIO())
+        call_command('link_acoustic_events', stdout=io.StringIO())
+
+        # Calls in the first second were only recorded by the first device
+        shared = AcousticEvent.objects.filter(device_count=2)
+        self.assertGreater(shared.count(), 0)
+        self.assertEqual(AcousticEvent.objects.count(), first_calls)
+        self.assertFalse(DetectedNoiseAudioFile.objects.filter(acoustic_event__isnull=True).exists())
+        for event in shared:
+            self.assertEqual(sorted(event.detections.values_list('original_file', flat=True)),
+                             [first.file_id, second.file_id])
+
+    def test_sweep_command_writes_comparison_report(self):
+        audio = np.clip(synthetic_recording(5, seconds=30), -32768, 32767).astype(np.int16)
+        original_audio = self.create_audio_file(audio)
+        report_path = os.path.join(self.media_root, 'sweep.xlsx')
+
+        call_command('sweep_detection', str(original_audio.file_id), '--min-mag', '3000', '3500',
+                     '--time-threshold', '2', '5', '--output', report_path, stdout=io.StringIO())
+
+        summary = pd.read_excel(report_path, sheet_name='Summary')
+        self.assertEqual(list(summary['Setting']), [1, 2, 3, 4])
+        self.assertEqual(list(summary['min_mag']), [3000, 3000, 3500, 3500])
+        expected = len(detect_saw_calls(audio, 48000))
+        default_setting = (summary['min_mag'] == 3500) & (summary['time_threshold'] == 5)
+        self.assertEqual(summary.loc[default_setting, 'Saw Calls'].item(), expected)
+        calls = pd.read_excel(report_path, sheet_name='Saw Calls')
+        self.assertEqual(len(calls), summary['Saw Calls'].sum())
+
+
+class BackgroundProcessorTests(TransactionTestCase):
+    # The workers are separate threads with their own database connections, so the data has to be committed
+    setUp = ProcessAudioTests.setUp
+    create_audio_file = ProcessAudioTests.create_audio_file
+
+    def tearDown(self):
+        # A processor left running by a failed test would keep writing while the tables are flushed
+        tasks.stop_background_processor(timeout=None)
+        ProcessAudioTests.tearDown(self)
+
+    def test_workers_drain_the_queue_back_to_back(self):
+        audio = np.clip(synthetic_recording(3, seconds=20, n_calls=2), -32768, 32767).astype(np.int16)
+        audio_files = [self.create_audio_file(audio, name=f'SMM07257_20230201_1715{index:02d}.wav') for index in range(5)]
+
+        # With the old fixed pause between files this would take close to a minute
+        with mock.patch.object(tasks, 'processing_interval', 30):
+            self.assertTrue(tasks.start_background_processor(concurrency=2))
+            self.assertFalse(tasks.start_background_processor())
+            self.assertEqual(tasks.get_processor_status(), "Running")
+            self.assertEqual(tasks.get_processor_workers(), 2)
+            for _ in range(300):
+                if not Database.objects.filter(status__in=['Pending', 'Processing']).exists():
+                    break
+                time.sleep(0.1)
+            self.assertTrue(tasks.stop_background_processor())
+
+        self.assertEqual(tasks.get_processor_status(), "Stopped")
+        self.assertEqual(tasks.get_processor_workers(), 0)
+        for audio_file in audio_files:
+            self.assertEqual(Database.objects.get(audio_file=audio_file).status, 'Processed')
+            # Every file was claimed by exactly one worker
+            self.assertEqual(ProcessingLog.objects.filter(audio_file=audio_file,
+                                                         message__startswith="Started processing").count(), 1)
+
+    @override_settings(AUDIO_PROCESSOR_EMBEDDED=True)
+    def test_uploads_wake_the_idle_workers(self):
+        audio = np.clip(synthetic_recording(4, seconds=20, n_calls=2), -32768, 32767).astype(np.int16)
+
+        with mock.patch.object(tasks, 'processing_interval', 60):
+            # Notifying starts the processor; its workers find the queue empty and wait
+            tasks.notify_new_uploads()
+            self.assertEqual(tasks.get_processor_workers(), tasks.get_processor_concurrency())
+            time.sleep(0.2)
+
+            audio_file = self.create_audio_file(audio)
+            notified = time.monotonic()
+            tasks.notify_new_uploads()
+            while Database.objects.get(audio_file=audio_file).status == 'Pending' and time.monotonic() - notified < 10:
+                time.sleep(0.01)
+            picked_up = time.monotonic() - notified
+            tasks.stop_background_processor()
+
+        # Well within the idle wait, which only covers files added by other processes now
+        self.assertLess(picked_up, 1)
+        self.assertEqual(tasks.get_processor_workers(), 0)
+
+    def test_run_processor_drains_on_sigterm(self):
+        audio = np.clip(synthetic_recording(5, seconds=20, n_calls=2), -32768, 32767).astype(np.int16)
+        audio_files = [self.create_audio_file(audio, name=f'SMM07257_20230201_1716{index:02d}.wav') for index in range(3)]
+
+        def terminate_when_started():
+            for _ in range(300):
+                if Database.objects.filter(status='Processed').exists():
+                    break
+                time.sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        output = io.StringIO()
+        terminator = threading.Thread(target=terminate_when_started)
+        terminator.start()
+        call_command('run_processor', concurrency=2, poll_interval=60, stdout=output)
+        terminator.join()
+
+        self.assertIn("Received SIGTERM", output.getvalue())
+        self.assertEqual(tasks.get_processor_workers(), 0)
+        # Draining let the files in progress finish and put the unstarted ones back, leaving none in Processing
+        statuses = [Database.objects.get(audio_file=audio_file).status for audio_file in audio_files]
+        self.assertIn('Processed', statuses)
+        self.assertLessEqual(set(statuses), {'Processed', 'Pending'})
+
+    @override_settings(AUDIO_PROCESSOR_PREFETCH=20)
+    def test_claimed_files_are_released_on_shutdown(self):
+        audio = np.clip(synthetic_recording(6, seconds=20, n_calls=2), -32768, 32767).astype(np.int16)
+        for index in range(12):
+            self.create_audio_file(audio, name=f'SMM07257_20230201_1718{index:02d}.wav')
+
+        with mock.patch.object(tasks, 'processing_interval', 60):
+            tasks.start_background_processor(concurrency=1)
+            # The single worker claimed every file in one batch
+            for _ in range(200):
+                if not Database.objects.filter(status='Pending').exists():
+                    break
+                time.sleep(0.01)
+            self.assertTrue(tasks.stop_background_processor(timeout=None))
+
+        self.assertFalse(Database.objects.filter(status='Processing').exists())
+        released = Database.objects.filter(status='Pending')
+        self.assertGreater(released.count(), 0)
+        self.assertEqual(set(released.values_list('attempts', flat=True)), {0})
+        self.assertEqual(ProcessingLog.objects.filter(message__startswith="Processor stopped before").count(), released.count())
@@ -0,0 +1,228 @@
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import butter, sosfiltfilt
+
+from .detection_engine import DEFAULT_MAX_FREQ, DEFAULT_MIN_FREQ, DEFAULT_SEGMENT_DURATION
+
+# Largest time difference searched between two recorders, in seconds. Filename timestamps only have
+# one-second resolution, so this covers the recorders' clock offset as well as the sound's travel time.
+DEFAULT_MAX_LAG = 1.5
+
+# Longest part of a call that is cross-correlated, in seconds
+DEFAULT_MAX_WINDOW = 10.0
+
+# Calls cross-correlated together in one batch of FFTs
+DEFAULT_TDOA_BATCH_SIZE = 32
+
+# Time difference of arrival of one call: the delay in seconds at the other recorder (positive when the
+# call reached the reference recorder first) and the peak of the normalised cross-correlation
+TDOA_DTYPE = np.dtype([
+    ('tdoa_s', np.float64),
+    ('correlation', np.float32),
+])
+
+
+def group_simultaneous_recordings(recordings):
+    """
+    Groups recordings from different devices that overlap in time, like the V1 triangulation data sets.
+
+    The recordings are swept once in start order, so grouping a whole season takes O(n log n).
+
+    Parameters:
+    - recordings (iterable): (key, device, start, duration) tuples, start a datetime parsed from the
+      filename and duration in seconds.
+
+    Returns:
+    - list: Groups of overlapping recordings in start order, each a list of the given tuples. Groups with
+            recordings from a single device only are left out.
+    """
+    groups = []
+    group_end = None
+    for recording in sorted(recordings, key=lambda recording: recording[2]):
+        _, _, start, duration = recording
+        end = start.timestamp() + duration
+        if group_end is not None and start.timestamp() < group_end:
+            groups[-1].append(recording)
+            group_end = max(group_end, end)
+        else:
+            groups.append([recording])
+            group_end = end
+    return [group for group in groups if len({device for _, device, _, _ in group}) > 1]
+
+
+def overlapping_pairs(group):
+    """
+    Lists the pairs of recordings from different devices in a group that overlap in time.
+
+    Parameters:
+    - group (list): (key, device, start, duration) tuples, see group_simultaneous_recordings.
+
+    Returns:
+    - list: (first, second, offset, overlap_start, overlap_end) tuples, where offset is the start of the
+            second recording minus the start of the first and the overlap is in seconds from the start
+            of the first.
+    """
+    pairs = []
+    for index, first in enumerate(group):
+        for second in group[index + 1:]:
+            if first[1] == second[1]:
+                continue
+            offset = (second[2] - first[2]).total_seconds()
+            overlap_start = max(0.0, offset)
+            overlap_end = min(first[3], offset + second[3])
+            if overlap_end > overlap_start:
+                pairs.append((first, second, offset, overlap_start, overlap_end))
+    return pairs
+
+
+def link_overlapping_detections(starts, ends, tolerance=0.0):
+    """
+    Links detections whose time spans overlap into events, e.g. one call heard by several recorders.
+
+    This is an interval join by sweep: the detections are sorted by start once, and a detection starts
+    a new event when it begins after the latest end seen so far, so a whole day takes O(n log n)
+    instead of comparing every pair. Overlap is transitive: a chain of overlapping detections is one event.
+
+    Parameters:
+    - starts (numpy.ndarray): Absolute start times in seconds (from any common reference).
+    - ends (numpy.ndarray): Absolute end times in seconds.
+    - tolerance (float): Detections less than this many seconds apart are linked as well, covering the
+      clock offset between recorders.
+
+    Returns:
+    - numpy.ndarray: Event number of each detection, in input order; events are numbered in start order.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    order = np.argsort(starts, kind='stable')
+    latest_end = np.maximum.accumulate(ends[order])
+    new_event = np.ones(len(order), dtype=bool)
+    new_event[1:] = starts[order][1:] > latest_end[:-1] + tolerance
+    events = np.empty(len(order), dtype=np.intp)
+    events[order] = np.cumsum(new_event) - 1
+    return events
+
+
+def signal_windows(signal, starts, length):
+    """
+    Cuts equally long windows out of a signal, with zeros where a window reaches past either end.
+
+    Parameters:
+    - signal (numpy.ndarray): Mono samples, e.g. a memory-mapped channel.
+    - starts (numpy.ndarray): First sample of each window, which may be negative.
+    - length (int): Window length in samples.
+
+    Returns:
+    - numpy.ndarray: float32 windows of shape (len(starts), length).
+    """
+    indices = np.asarray(starts, dtype=np.int64)[:, np.newaxis] + np.arange(length)
+    inside = (indices >= 0) & (indices < len(signal))
+    windows = np.zeros(indices.shape, dtype=np.float32)
+    windows[inside] = signal[indices[inside]]
+    return windows
+
+
+def cross_correlation_tdoa(reference, other, sample_rate, max_lag_samples, min_freq=DEFAULT_MIN_FREQ,
+                           max_freq=DEFAULT_MAX_FREQ, workers=None):
+    """
+    Finds the time difference of arrival of a batch of calls by FFT cross-correlation.
+
+    Both windows are band-passed to the detection band first, so broadband noise does not mask the calls.
+    The correlation of every lag is normalised by the energy of the overlapping part of the other window,
+    and the peak is refined to a fraction of a sample with a parabola through its neighbours.
+
+    Parameters:
+    - reference (numpy.ndarray): Windows of the reference recording, shape (calls, length).
+    - other (numpy.ndarray): Windows of the other recording, covering the same times plus max_lag_samples
+      on each side, shape (calls, length + 2 * max_lag_samples).
+    - sample_rate (int): Sample rate of both recordings in Hz.
+    - max_lag_samples (int): Largest delay searched in either direction, in samples.
+    - min_freq (float): Lower edge of the pass band in Hz.
+    - max_freq (float): Upper edge of the pass band in Hz.
+    - workers (int): Threads for the FFTs (default is one; -1 uses every CPU).
+
+    Returns:
+    - numpy.ndarray: One TDOA_DTYPE record per call.
+    """
+    n_calls, length = reference.shape
+    n_lags = 2 * max_lag_samples + 1
+    result = np.zeros(n_calls, dtype=TDOA_DTYPE)
+    if n_calls == 0:
+        return result
+
+    sos = butter(4, [min_freq, min(max_freq, 0.45 * sample_rate)], btype='bandpass', fs=sample_rate, output='sos')
+    reference = sosfiltfilt(sos, reference, axis=-1)
+    other = sosfiltfilt(sos, other, axis=-1)
+
+    # correlation[:, k] = sum_t reference[t] * other[t + k], every call in one batch of FFTs
+    n_fft = next_fast_len(length + other.shape[1] - 1, real=True)
+    spectrum = np.conj(rfft(reference, n_fft, axis=-1, workers=workers))
+    spectrum *= rfft(other, n_fft, axis=-1, workers=workers)
+    correlation = irfft(spectrum, n_fft, axis=-1, workers=workers)[:, :n_lags]
+
+    # Energy of the other window under the reference at every lag, from a running sum
+    cumulative = np.zeros((n_calls, other.shape[1] + 1))
+    np.cumsum(np.square(other), axis=-1, out=cumulative[:, 1:])
+    other_energy = cumulative[:, length:length + n_lags] - cumulative[:, :n_lags]
+    norm = np.sqrt(np.square(reference).sum(axis=-1)[:, np.newaxis] * np.maximum(other_energy, 0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.where(norm > 0, correlation / norm, 0.0)
+
+    rows = np.arange(n_calls)
+    peaks = correlation.argmax(axis=-1)
+    shift = np.zeros(n_calls)
+    inner = (peaks > 0) & (peaks < n_lags - 1)
+    before, peak, after = (correlation[rows[inner], peaks[inner] + step] for step in (-1, 0, 1))
+    curvature = before - 2 * peak + after
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift[inner] = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0.0)
+
+    result['tdoa_s'] = (peaks + shift - max_lag_samples) / sample_rate
+    result['correlation'] = correlation[rows, peaks]
+    return result
+
+
+def call_time_differences(reference_signal, other_signal, sample_rate, offset, starts, ends,
+                          max_lag=DEFAULT_MAX_LAG, max_window=DEFAULT_MAX_WINDOW, padding=DEFAULT_SEGMENT_DURATION,
+                          batch_size=DEFAULT_TDOA_BATCH_SIZE, workers=None, **band):
+    """
+    Finds the time difference of arrival of calls detected in one recording at a simultaneous recorder.
+
+    Calls are sorted by length and cross-correlated in batches of similar length, so little time is spent
+    on zero padding.
+
+    Parameters:
+    - reference_signal (numpy.ndarray): Mono samples of the recording the calls were detected in.
+    - other_signal (numpy.ndarray): Mono samples of the other recording, at the same sample rate.
+    - sample_rate (int): Sample rate of both recordings in Hz.
+    - offset (float): Start of the other recording minus the start of the reference one, in seconds.
+    - starts (numpy.ndarray): Call start times in seconds from the start of the reference recording.
+    - ends (numpy.ndarray): Call end times in seconds from the start of the reference recording.
+    - max_lag (float): Largest time difference searched in either direction, in seconds.
+    - max_window (float): Longest part of a call that is cross-correlated, in seconds.
+    - padding (float): Audio kept before and after each call, in seconds.
+    - batch_size (int): Number of calls cross-correlated together.
+    - workers (int): Threads for the FFTs, see cross_correlation_tdoa.
+    - band: min_freq and max_freq of the pass band, see cross_correlation_tdoa.
+
+    Returns:
+    - numpy.ndarray: One TDOA_DTYPE record per call, in the order of starts.
+    """
+    starts = np.asarray(starts, dtype=np.float64) - padding
+    durations = np.minimum(np.asarray(ends, dtype=np.float64) + padding - starts, max_window)
+    lengths = np.maximum(1, np.ceil(durations * sample_rate).astype(np.int64))
+    first_samples = np.round(starts * sample_rate).astype(np.int64)
+    offset_samples = int(round(offset * sample_rate))
+    max_lag_samples = int(round(max_lag * sample_rate))
+
+    result = np.zeros(len(starts), dtype=TDOA_DTYPE)
+    order = np.argsort(lengths, kind='stable')
+    for batch_start in range(0, len(order), batch_size):
+        batch = order[batch_start:batch_start + batch_size]
+        length = int(lengths[batch].max())
+        reference = signal_windows(reference_signal, first_samples[batch], length)
+        other = signal_windows(other_signal, first_samples[batch] - offset_samples - max_lag_samples,
+                               length + 2 * max_lag_samples)
+        result[batch] = cross_correlation_tdoa(reference, other, sample_rate, max_lag_samples, workers=workers,
+                                               **band)
+    return result
@@ -41,4 +41,5 @@ urlpatterns = [
     path('api/get_status/', api_views.get_status, name="api_get_status"),
     path('api/get_file_logs/<int:file_id>/', api_views.get_file_logs, name="api_get_file_logs"),
     path('api/get_recent_logs/', api_views.get_recent_logs, name="api_get_recent_logs"),
+    path('api/get_band_envelope/<int:file_id>/', api_views.get_band_envelope, name="api_get_band_envelope"),
 ]
@@ -21,7 +21,7 @@ import os
 import logging
 from .audio_processing import update_audio_metadata
 from .EmailBackEnd import EmailBackEnd
-from .tasks import process_pending_audio_files
+from .tasks import notify_new_uploads
 import json
 from django.utils.safestring import mark_safe
 from .models import CustomUser, OriginalAudioFile, DetectedNoiseAudioFile, Spectrogram, Database, ProcessingLog
@@ -554,8 +554,8 @@ def upload_audio(request):
                     success_message += f"{upload_stats['failed']} file(s) failed to upload due to errors."
                 messages.success(request, success_message)
                 
-                # Automatically process the uploaded files
-                process_pending_audio_files()
+                # Hand the uploaded files to the background processor
+                notify_new_uploads()
                 
                 return redirect('upload_audio')
             else:
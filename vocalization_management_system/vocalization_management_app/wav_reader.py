@@ -0,0 +1,240 @@
+import os
+import struct
+
+import numpy as np
+
+# WAV format tags the reader understands; extensible files carry one of the others in their sub-format
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample type of each (format, bytes per sample) pair, matching what scipy.io.wavfile.read returns.
+# Packed 24-bit samples are returned as left-justified int32 through PCM24Array.
+WAV_SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 1): 'uint8',
+    (WAVE_FORMAT_PCM, 2): '<i2',
+    (WAVE_FORMAT_PCM, 3): 'int24',
+    (WAVE_FORMAT_PCM, 4): '<i4',
+    (WAVE_FORMAT_PCM, 8): '<i8',
+    (WAVE_FORMAT_IEEE_FLOAT, 4): '<f4',
+    (WAVE_FORMAT_IEEE_FLOAT, 8): '<f8',
+}
+
+# Frames of 24-bit samples unpacked at a time when a whole PCM24Array is reduced
+PCM24_CHUNK_FRAMES = 1 << 20
+
+
+def _is_chunk_id(chunk_id):
+    """Tells whether four bytes look like a RIFF chunk ID (printable ASCII)"""
+    return len(chunk_id) == 4 and all(32 <= byte < 127 for byte in chunk_id)
+
+
+def _parse_fmt_chunk(chunk):
+    """Reads the sample format from the contents of a fmt chunk"""
+    if len(chunk) < 16:
+        raise ValueError("Truncated fmt chunk")
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', chunk[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        if len(chunk) < 26:
+            raise ValueError("Truncated WAVE_FORMAT_EXTENSIBLE fmt chunk")
+        # The sub-format GUID starts with the actual format tag
+        format_tag, = struct.unpack('<H', chunk[24:26])
+    if channels == 0 or block_align % channels:
+        raise ValueError(f"Invalid WAV header: {channels} channels with {block_align} bytes per frame")
+
+    # The container size decides the sample type; e.g. 24 valid bits in 4 bytes are read as int32
+    sample_bytes = block_align // channels
+    if (format_tag, sample_bytes) not in WAV_SAMPLE_DTYPES:
+        raise ValueError(f"Unsupported WAV format: format {format_tag}, {bits} bits in {sample_bytes} bytes")
+    return {
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'dtype': WAV_SAMPLE_DTYPES[(format_tag, sample_bytes)],
+        'block_align': block_align,
+    }
+
+
+def read_wav_header(wav_file):
+    """
+    Reads the format of a WAV file up to the start of its sample data.
+
+    Handles plain and WAVE_FORMAT_EXTENSIBLE headers with 8/16/24/32/64-bit PCM or 32/64-bit float
+    samples and skips any other chunks (LIST, bext, GUANO metadata, ...), including odd-sized chunks
+    written without the pad byte that should follow them. Only the header is needed, so this also
+    works on a file that a recorder is still writing, whose RIFF and data sizes are not final yet.
+
+    Parameters:
+    - wav_file: Binary, seekable file object positioned at the start of the file.
+
+    Returns:
+    - dict: sample_rate, channels, dtype (numpy sample type, or 'int24' for packed 24-bit PCM),
+            block_align (bytes per frame), data_offset (byte offset of the samples), data_size
+            (bytes of sample data according to the header) and riff_size (the RIFF chunk size).
+
+    Raises:
+    - ValueError: If the file is not a WAV file or its sample format is not supported.
+    """
+    riff, riff_size, wave = struct.unpack('<4sI4s', wav_file.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise ValueError("Not a WAV file")
+
+    wav_format = None
+    while True:
+        header = wav_file.read(8)
+        if len(header) < 8:
+            raise ValueError("No data chunk found")
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        if chunk_id == b'data':
+            break
+        chunk = wav_file.read(chunk_size)
+        if chunk_id == b'fmt ':
+            wav_format = _parse_fmt_chunk(chunk)
+        if chunk_size % 2:
+            # Skip the pad byte, unless the next chunk starts right away
+            position = wav_file.tell()
+            wav_file.seek(position + 1)
+            if not _is_chunk_id(wav_file.read(4)):
+                wav_file.seek(position)
+                if _is_chunk_id(wav_file.read(4)):
+                    position -= 1
+            wav_file.seek(position + 1)
+
+    if wav_format is None:
+        raise ValueError("No fmt chunk found before the data chunk")
+    wav_format['data_offset'] = wav_file.tell()
+    wav_format['data_size'] = chunk_size
+    wav_format['riff_size'] = riff_size
+    return wav_format
+
+
+def int24_view(buffer, offset, frames, channels, block_align):
+    """
+    Views packed 24-bit samples as int32 without copying, using overlapping strides.
+
+    Each int32 starts one byte before its sample, so its upper three bytes are the sample and its low
+    byte belongs to the data before it; masking that byte off gives the left-justified sample.
+
+    Parameters:
+    - buffer: Object exposing the bytes, e.g. a numpy.memmap of the file.
+    - offset (int): Byte offset of the first sample, at least 1.
+    - frames (int): Number of frames.
+    - channels (int): Number of interleaved channels.
+    - block_align (int): Bytes per frame.
+
+    Returns:
+    - numpy.ndarray: Unmasked int32 view of shape (frames, channels).
+    """
+    return np.ndarray((frames, channels), dtype='<i4', buffer=buffer, offset=offset - 1, strides=(block_align, 3))
+
+
+class PCM24Array:
+    """
+    Read-only array of packed 24-bit PCM samples, unpacked only when they are used.
+
+    It stands in for the int32 array scipy.io.wavfile.read returns for 24-bit files (left-justified
+    samples, i.e. the 24-bit value times 256) where that array cannot be memory-mapped. Slicing returns
+    another PCM24Array without touching the data, and numpy.asarray unpacks just the selected samples,
+    so a memory-mapped file can still be read block by block.
+    """
+
+    dtype = np.dtype(np.int32)
+
+    def __init__(self, raw):
+        # Unmasked int32 view, see int24_view
+        self._raw = raw
+
+    @property
+    def shape(self):
+        return self._raw.shape
+
+    @property
+    def ndim(self):
+        return self._raw.ndim
+
+    @property
+    def size(self):
+        return self._raw.size
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, key):
+        selected = self._raw[key]
+        if isinstance(selected, np.ndarray) and np.may_share_memory(selected, self._raw):
+            return PCM24Array(selected)
+        return selected & np.int32(-256)
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self._raw & np.int32(-256)
+        return samples if dtype is None else samples.astype(dtype, copy=False)
+
+    def mean(self, axis=None, dtype=None, out=None):
+        """
+        Mean of all samples, unpacked a chunk at a time (only axis=None is supported).
+        """
+        if axis is not None or out is not None:
+            raise ValueError("PCM24Array.mean only supports the mean of all samples")
+        total = 0.0
+        for start in range(0, len(self), PCM24_CHUNK_FRAMES):
+            total += float(np.sum(self[start:start + PCM24_CHUNK_FRAMES], dtype=np.float64))
+        return np.dtype(dtype or np.float64).type(total / self.size)
+
+
+def map_wav(file_path):
+    """
+    Memory-maps the samples of a WAV file, see read_wav_header for the formats covered.
+
+    The data size in the header is only trusted as far as the file reaches, so files whose sizes were
+    never finalised (e.g. a recorder that lost power) are read up to their last whole frame. A data size
+    of 0, or a RIFF size too small to hold the data chunk, is a placeholder that was never updated, and
+    the samples are read to the end of the file.
+
+    Parameters:
+    - file_path (str): Path to the WAV file.
+
+    Returns:
+    - tuple: (sample_rate, audio_data) where audio_data holds the sample values scipy.io.wavfile.read
+             returns, of shape (frames,) or (frames, channels): a numpy.memmap, or a PCM24Array for
+             packed 24-bit PCM.
+
+    Raises:
+    - ValueError: If the file is not a WAV file or its format is not supported.
+    """
+    with open(file_path, 'rb') as wav_file:
+        wav_format = read_wav_header(wav_file)
+    data_offset = wav_format['data_offset']
+    data_size = os.path.getsize(file_path) - data_offset
+    if wav_format['data_size'] and wav_format['riff_size'] + 8 >= data_offset + wav_format['data_size']:
+        data_size = min(wav_format['data_size'], data_size)
+    frames = max(0, data_size) // wav_format['block_align']
+    channels = wav_format['channels']
+    shape = (frames, channels) if channels > 1 else (frames,)
+
+    if wav_format['dtype'] != 'int24':
+        if frames == 0:
+            return wav_format['sample_rate'], np.empty(shape, dtype=wav_format['dtype'])
+        return wav_format['sample_rate'], np.memmap(file_path, dtype=wav_format['dtype'], mode='r',
+                                                    offset=data_offset, shape=shape)
+
+    file_bytes = np.memmap(file_path, dtype=np.uint8, mode='r') if frames else np.zeros(data_offset + 1, np.uint8)
+    raw = int24_view(file_bytes, data_offset, frames, channels, wav_format['block_align'])
+    return wav_format['sample_rate'], PCM24Array(raw if channels > 1 else raw[:, 0])
+
+
+def decode_frames(data, wav_format):
+    """
+    Converts bytes holding whole frames of a WAV file's sample data into samples.
+
+    Parameters:
+    - data (bytes): Sample data, a multiple of wav_format['block_align'] bytes long.
+    - wav_format (dict): Format as returned by read_wav_header.
+
+    Returns:
+    - numpy.ndarray: Samples of shape (frames, channels), with the values map_wav returns.
+    """
+    frames = len(data) // wav_format['block_align']
+    if wav_format['dtype'] == 'int24':
+        # A leading byte gives the first sample's int32 something to start at
+        buffer = np.frombuffer(b'\0' + data, dtype=np.uint8)
+        return int24_view(buffer, 1, frames, wav_format['channels'], wav_format['block_align']) & np.int32(-256)
+    return np.frombuffer(data, dtype=wav_format['dtype']).reshape(frames, wav_format['channels'])
@@ -80,6 +80,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # The background processor's workers write concurrently; wait for each other's locks instead of failing.
+        # Transactions take the write lock when they begin, so two that read first cannot deadlock on upgrading it.
+        'OPTIONS': {'timeout': 30, 'transaction_mode': 'IMMEDIATE'},
+        # A file rather than the in-memory default, whose shared cache fails on concurrent access instead of waiting
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
@@ -132,3 +137,63 @@ APPEND_SLASH = False  # settings.py
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+
+# Audio processing
+# Worker processes used by batch processing (None uses every CPU), files handed to a worker at a time,
+# and the address space limit of each worker in MB (None for no limit)
+AUDIO_PROCESSING_WORKERS = None
+AUDIO_PROCESSING_CHUNKSIZE = 1
+AUDIO_PROCESSING_TASK_MEMORY_MB = None
+
+# Worker threads of the background processor that drains the pending queue (None uses one per CPU). SQLite allows one
+# writer at a time, so raise it only with a database server or in dedicated `manage.py run_processor` workers.
+AUDIO_PROCESSOR_CONCURRENCY = 1
+# Files the processor claims beyond its free workers in one go, so workers move on to the next file without querying
+# the queue; they stay leased to the processor and are released back to the queue when it stops. Off by default so
+# files wait in the queue for whichever processor is free first; raise it for queues of many short files
+AUDIO_PROCESSOR_PREFETCH = 0
+
+# Run the background processor inside the web server process (started by runserver and on upload). Only the
+# development server does this by default: under gunicorn every web worker would start a processor of its own, so in
+# production `manage.py run_processor` is the dispatcher, run as a separate service next to the web server.
+AUDIO_PROCESSOR_EMBEDDED = DEBUG
+
+# A claimed file is leased to its worker for this many seconds and renewed by the worker's heartbeat. Files whose
+# lease expired (the worker was killed or the server restarted) are re-queued, up to AUDIO_PROCESSING_MAX_ATTEMPTS times.
+AUDIO_PROCESSING_LEASE_SECONDS = 300
+AUDIO_PROCESSING_MAX_ATTEMPTS = 3
+
+# Threads for each STFT's FFTs when a single file is processed (-1 uses every CPU, None uses one).
+# Batch workers already run one file per CPU and keep the single-threaded default, and the background processor's
+# workers split these threads (and the shard processes) between the files they process at the same time.
+AUDIO_PROCESSING_FFT_WORKERS = -1
+
+# Recordings longer than two shards of this many minutes are split in time and detected by several
+# worker processes (None processes every recording in one piece)
+AUDIO_PROCESSING_SHARD_MINUTES = 30
+
+# Spectral gating before thresholding: a bin counts only when it is this many times above its noise level,
+# smoothed over AUDIO_PROCESSING_NOISE_TIME_CONSTANT seconds (None disables it)
+AUDIO_PROCESSING_NOISE_GATE = None
+AUDIO_PROCESSING_NOISE_TIME_CONSTANT = 2.0
+
+# Adaptive thresholds for recorders with different gain settings: a bin counts when it is this many times above
+# its own noise floor (and below AUDIO_PROCESSING_NOISE_FLOOR_MAX times it, or the fixed maximum when None),
+# instead of inside the fixed magnitude window (None keeps the fixed window)
+AUDIO_PROCESSING_NOISE_FLOOR = None
+AUDIO_PROCESSING_NOISE_FLOOR_MAX = None
+
+# Skip the STFT of frames too quiet to reach the detection threshold. The detected calls stay the same,
+# but the stored band envelope has no values for the skipped stretches. Not used with the noise gate.
+AUDIO_PROCESSING_SKIP_SILENCE = False
+
+# Disk cache of band-limited STFT magnitudes, so reprocessing a recording skips the FFT (None disables it).
+# Opt-in: a cache miss holds the whole file's band matrix in memory and hashes the whole file, which the
+# block-by-block detection otherwise avoids, e.g. os.path.join(BASE_DIR, 'spectrogram_cache').
+# Least recently used entries are evicted past the budget.
+SPECTROGRAM_CACHE_DIR = None
+SPECTROGRAM_CACHE_MAX_MB = 2048
+
+# Largest time difference of arrival searched between two simultaneous recorders, in seconds. Filename
+# timestamps only have one-second resolution, so this covers their clock offset as well as the travel time.
+TRIANGULATION_MAX_LAG_SECONDS = 1.5